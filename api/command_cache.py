@@ -0,0 +1,294 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from api.command_parser import NUMBER_PATTERN, parse_number
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of cached commands and seconds an entry stays valid
+COMMAND_CACHE_SIZE = int(os.getenv('COMMAND_CACHE_SIZE', '512'))
+COMMAND_CACHE_TTL = float(os.getenv('COMMAND_CACHE_TTL', '86400'))
+# Optional SQLite file for a persistent tier that survives restarts (empty disables it)
+COMMAND_CACHE_DB = os.getenv('COMMAND_CACHE_DB', '')
+# Seconds that current_time / duration are rounded to when they are part of the key
+COMMAND_CACHE_TIME_QUANTUM = float(os.getenv('COMMAND_CACHE_TIME_QUANTUM', '1'))
+
+TIME_FIELDS = ('start_time', 'end_time')
+_NUMBER = re.compile(r'\b' + NUMBER_PATTERN + r'\b')
+_EPSILON = 1e-6
+
+
+def normalize_text(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r'\s+', ' ', (text or '').lower()).strip().rstrip('!?.')
+
+
+def quantize(value, quantum=COMMAND_CACHE_TIME_QUANTUM):
+    value = float(value or 0)
+    return round(value / quantum) * quantum if quantum > 0 else value
+
+
+def text_numbers(text):
+    """Numbers written in the command (digits, mm:ss or number words) in seconds."""
+    numbers = set()
+    for token in _NUMBER.findall(text):
+        value = parse_number(token)
+        # "2 minutes" may come back from the LLM as 120 seconds
+        numbers.update((value, value * 60))
+    return numbers
+
+
+def _close(a, b):
+    return abs(a - b) < _EPSILON
+
+
+def encode_time(value, numbers, current_time, duration):
+    """
+    Classify a command time so it can be replayed at another playback position:
+    ("abs", t) for times written in the text (or 0 / -1), ("rel", offset) for
+    times derived from current_time, ("dur", offset) for times measured back from
+    the end of the video. Returns None when more than one reading fits.
+    """
+    value = float(value)
+    readings = set()
+    if value < 0 or _close(value, 0) or any(_close(value, n) for n in numbers):
+        readings.add(("abs", value))
+    if _close(value, current_time) or any(_close(value - current_time, n) for n in numbers):
+        readings.add(("rel", round(value - current_time, 6)))
+    if duration and any(_close(duration - value, n) for n in numbers):
+        readings.add(("dur", round(value - duration, 6)))
+    if len(readings) != 1:
+        return None
+    return readings.pop()
+
+
+def decode_time(encoded, current_time, duration):
+    kind, value = encoded
+    if kind == "rel":
+        return round(current_time + value, 6)
+    if kind == "dur":
+        return round(max(0.0, duration + value), 6)
+    return value
+
+
+def relativize(commands, text, current_time, duration):
+    """
+    Commands with their times encoded for replay, or None if some time can't be
+    classified unambiguously (the entry is then pinned to its playback position).
+    """
+    numbers = text_numbers(text)
+    encoded = []
+    for command in commands:
+        entry = dict(command)
+        for field in TIME_FIELDS:
+            if field in command and command[field] is not None:
+                try:
+                    value = encode_time(command[field], numbers, current_time, duration)
+                except (TypeError, ValueError):
+                    return None
+                if value is None:
+                    return None
+                entry[field] = value
+        encoded.append(entry)
+    return encoded
+
+
+def rebase(encoded, current_time, duration):
+    """Inverse of relativize() for a new playback position."""
+    commands = []
+    for entry in encoded:
+        command = dict(entry)
+        for field in TIME_FIELDS:
+            if isinstance(command.get(field), (list, tuple)):
+                command[field] = decode_time(command[field], current_time, duration)
+        commands.append(command)
+    return commands
+
+
+class PersistentTier:
+    """SQLite table of cached commands. Entries use wall-clock expiry so they survive restarts."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS command_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM command_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at < time.time():
+            self.delete(key)
+            return None
+        return json.loads(value), expires_at
+
+    def put(self, key, value, ttl):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO command_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl)
+            )
+
+    def delete(self, key):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM command_cache WHERE key = ?", (key,))
+
+    def prune(self):
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "DELETE FROM command_cache WHERE expires_at < ?", (time.time(),)
+            ).rowcount
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM command_cache")
+
+    def size(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM command_cache").fetchone()[0]
+
+
+class CommandCache:
+    """
+    Bounded, thread-safe LRU cache of LLM command results with a TTL.
+    Keys are the normalized text plus the quantized duration; times are stored
+    relative to the playback position so a hit can be replayed at a new
+    current_time. Results whose times can't be classified are pinned to the
+    quantized current_time as well. An optional SQLite tier backs the memory tier.
+    """
+
+    def __init__(self, max_size=COMMAND_CACHE_SIZE, ttl=COMMAND_CACHE_TTL, db_path=COMMAND_CACHE_DB):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.persistent = None
+        if db_path and max_size > 0:
+            try:
+                self.persistent = PersistentTier(db_path)
+                self.persistent.prune()
+            except sqlite3.Error as e:
+                logger.warning(f"Command cache persistent tier disabled ({db_path}): {e}")
+        self.hits = 0
+        self.persistent_hits = 0
+        self.rebased_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _keys(self, text, current_time, duration, namespace):
+        base = f"{namespace}|{normalize_text(text)}|d={quantize(duration)}"
+        digest = lambda raw: hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+        return digest(base), digest(f"{base}|t={quantize(current_time)}")
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put(self, key, value, expires_at):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def lookup(self, text, current_time=0, duration=0, namespace=""):
+        """
+        Return the cached commands for this text, rebased onto current_time, or None.
+        namespace separates results produced by different models or prompts.
+        """
+        if self.max_size <= 0:
+            return None
+        current_time, duration = float(current_time or 0), float(duration or 0)
+        now = time.monotonic()
+        for key in self._keys(text, current_time, duration, namespace):
+            with self._lock:
+                value = self._get(key, now)
+            if value is None and self.persistent is not None:
+                try:
+                    stored = self.persistent.get(key)
+                except sqlite3.Error as e:
+                    logger.warning(f"Command cache read failed: {e}")
+                    stored = None
+                if stored is not None:
+                    value, expires_at = stored
+                    with self._lock:
+                        self.persistent_hits += 1
+                        # Promote with the remaining lifetime of the stored entry
+                        self._put(key, value, now + (expires_at - time.time()))
+            if value is not None:
+                with self._lock:
+                    self.hits += 1
+                    if value["relative"]:
+                        self.rebased_hits += 1
+                return rebase(value["commands"], current_time, duration)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, text, current_time, duration, commands, namespace=""):
+        if self.max_size <= 0:
+            return
+        current_time, duration = float(current_time or 0), float(duration or 0)
+        relative_key, pinned_key = self._keys(text, current_time, duration, namespace)
+        encoded = relativize(commands, normalize_text(text), current_time, duration)
+        if encoded is not None:
+            key, value = relative_key, {"relative": True, "commands": encoded}
+        else:
+            key, value = pinned_key, {"relative": False, "commands": commands}
+        with self._lock:
+            self._put(key, value, time.monotonic() + self.ttl)
+        if self.persistent is not None:
+            try:
+                self.persistent.put(key, value, self.ttl)
+            except sqlite3.Error as e:
+                logger.warning(f"Command cache write failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "rebased_hits": self.rebased_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "persistent": self.persistent is not None
+            }
+        if self.persistent is not None:
+            stats["persistent_size"] = self.persistent.size()
+        return stats
+
+
+command_cache = CommandCache()
@@ -0,0 +1,232 @@
+import re
+
+# Effect names and the phrases that refer to them. Longer phrases are matched first.
+EFFECT_ALIASES = {
+    'segmentation': ['remove the background', 'remove background', 'background removal', 'background',
+                     'segmentation', 'segment'],
+    'grayscale': ['black and white', 'black & white', 'b&w', 'greyscale', 'grayscale', 'gray', 'grey',
+                  'monochrome'],
+    'sepia': ['sepia', 'vintage'],
+    'invert': ['invert colors', 'invert colours', 'inverted', 'invert', 'negative'],
+    'blur': ['blurry', 'blurred', 'blur'],
+}
+
+DELETE_WORDS = ['get rid of', 'turn off', 'take off', 'delete', 'remove', 'clear', 'drop', 'disable', 'undo']
+ADD_WORDS = ['turn on', 'put on', 'add', 'apply', 'put', 'make', 'enable', 'give', 'use', 'set', 'create', 'insert']
+ALL_WORDS = ['all effects', 'all the effects', 'every effect', 'everything', 'all']
+
+# Words that carry no meaning for the command. Anything else left over makes the command ambiguous.
+FILLER_WORDS = {
+    'a', 'an', 'the', 'to', 'on', 'of', 'in', 'over', 'effect', 'effects', 'filter', 'filters', 'please',
+    'pls', 'video', 'clip', 'it', 'me', 'can', 'could', 'you', 'i', 'want', 'would', 'like', 'some',
+    'just', 'now', 'there', 'this', 'that', 'and', 'with', 'bit', 'little', 'let', "let's", 'lets',
+    'go', 'ahead', 'thanks', 'thank', 'colors', 'colours', 'color', 'colour', 'also', 'then', 'too',
+}
+
+WORD_NUMBERS = {
+    'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8,
+    'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'fifteen': 15, 'twenty': 20, 'thirty': 30,
+    'forty': 40, 'fifty': 50, 'sixty': 60, 'half a': 0.5, 'a': 1,
+}
+
+NUMBER_PATTERN = r'(?:\d+:\d{1,2}(?:\.\d+)?|\d+(?:\.\d+)?|' + '|'.join(sorted((w for w in WORD_NUMBERS if w != 'a'), key=len, reverse=True)) + ')'
+_UNIT = r'(?:\s*(?:seconds?|secs?|s)\b)?'
+_MIN_UNIT = r'\s*(?:minutes?|mins?|m)\b'
+
+# Clause separators. "between X and Y" is protected before splitting.
+_SPLIT = re.compile(r'\s*(?:,|;|\.(?!\d)|\band then\b|\bthen\b|\balso\b|\band\b|\bplus\b)\s*')
+
+
+class CommandParseError(Exception):
+    """The text can't be parsed deterministically; the caller should fall back to the LLM."""
+
+
+def parse_number(token):
+    token = token.strip()
+    if ':' in token:
+        minutes, seconds = token.split(':', 1)
+        return int(minutes) * 60 + float(seconds)
+    if token in WORD_NUMBERS:
+        return float(WORD_NUMBERS[token])
+    return float(token)
+
+
+def _duration(match_text):
+    """Seconds for '<n> seconds' / '<n> minutes' phrases."""
+    m = re.match(r'(' + NUMBER_PATTERN + r'|a|an)\s*(minutes?|mins?|m\b)?', match_text)
+    value = parse_number('a' if m.group(1) == 'an' else m.group(1))
+    return value * 60 if m.group(2) else value
+
+
+def _consume(text, pattern):
+    """Return (match, text with the match blanked out) or (None, text)."""
+    m = re.search(pattern, text)
+    if not m:
+        return None, text
+    return m, text[:m.start()] + ' ' + text[m.end():]
+
+
+def _find_phrase(text, phrases):
+    for phrase in sorted(phrases, key=len, reverse=True):
+        m = re.search(r'(?<![\w&])' + re.escape(phrase) + r'(?![\w&])', text)
+        if m:
+            return m
+    return None
+
+
+def split_clauses(text):
+    """
+    Split text into one clause per command. Pieces that don't name an effect
+    (e.g. the "10" in "between 5 and 10") are joined back onto the previous clause.
+    """
+    protected = re.sub(r'\bbetween\s+(' + NUMBER_PATTERN + r')' + _UNIT + r'\s+and\s+', r'between \1 to ', text)
+    pieces = [p for p in _SPLIT.split(protected) if p and p.strip()]
+    clauses = []
+    effect_phrases = [alias for aliases in EFFECT_ALIASES.values() for alias in aliases] + ALL_WORDS
+    for piece in pieces:
+        if clauses and not _find_phrase(piece, effect_phrases):
+            clauses[-1] = clauses[-1] + ' ' + piece
+        else:
+            clauses.append(piece)
+    return clauses
+
+
+def parse_clause(clause, previous_action, current_time, duration):
+    text = ' ' + clause + ' '
+
+    # Effect type. "remove background" names the segmentation effect, so it is matched before actions.
+    effect_type = None
+    for name, aliases in EFFECT_ALIASES.items():
+        m = _find_phrase(text, aliases)
+        if m:
+            if effect_type is not None:
+                raise CommandParseError(f"More than one effect in '{clause}'")
+            effect_type = name
+            text = text[:m.start()] + ' ' + text[m.end():]
+
+    # Action
+    action = None
+    m = _find_phrase(text, DELETE_WORDS)
+    if m:
+        action = 'delete'
+        text = text[:m.start()] + ' ' + text[m.end():]
+    m = _find_phrase(text, ADD_WORDS)
+    if m:
+        if action is not None:
+            raise CommandParseError(f"Conflicting actions in '{clause}'")
+        action = 'add'
+        text = text[:m.start()] + ' ' + text[m.end():]
+    if action is None:
+        action = previous_action or 'add'
+
+    if effect_type is None:
+        m = _find_phrase(text, ALL_WORDS)
+        if m and action == 'delete':
+            effect_type = 'all'
+            text = text[:m.start()] + ' ' + text[m.end():]
+        else:
+            raise CommandParseError(f"No effect named in '{clause}'")
+
+    # Timeframe
+    start = end = None
+    explicit_time = False
+
+    m, text = _consume(text, r'\b(?:(?:for|over|across|on)\s+)?(?:the\s+)?(?:full|entire|whole)\s+(?:video|clip|thing)\b|\bthroughout\b|\beverywhere\b')
+    if m:
+        start, end, explicit_time = 0.0, -1.0, True
+
+    m, text = _consume(text, r'\b(?:from|between)?\s*(' + NUMBER_PATTERN + r')' + _UNIT + r'\s*(?:-|to|until|till|through)\s*(' + NUMBER_PATTERN + r')' + _UNIT)
+    if m:
+        start, end, explicit_time = parse_number(m.group(1)), parse_number(m.group(2)), True
+
+    m, text = _consume(text, r'\b(?:for|lasting)\s+((?:' + NUMBER_PATTERN + r'|an|a)(?:' + _MIN_UNIT + r'|' + _UNIT + r'))')
+    span = _duration(m.group(1)) if m else None
+
+    m, text = _consume(text, r'\b(?:for\s+)?the\s+(first|last)\s+(' + NUMBER_PATTERN + r')' + _UNIT)
+    if m:
+        n = parse_number(m.group(2))
+        if m.group(1) == 'first':
+            start, end = 0.0, n
+        else:
+            if not duration:
+                raise CommandParseError("'last N seconds' needs the video duration")
+            start, end = max(0.0, float(duration) - n), -1.0
+        explicit_time = True
+
+    m, text = _consume(text, r'\bfrom\s+(?:the\s+)?(?:start|beginning)\b|\bfrom\s+0\b')
+    if m:
+        start, explicit_time = 0.0, True
+
+    m, text = _consume(text, r'\b(?:from|starting(?:\s+at)?|after)\s+(' + NUMBER_PATTERN + r')' + _UNIT)
+    if m:
+        start, explicit_time = parse_number(m.group(1)), True
+
+    m, text = _consume(text, r'\b(?:until|till|to|up\s+to)\s+(?:the\s+)?(?:end)\b')
+    if m:
+        end, explicit_time = -1.0, True
+
+    m, text = _consume(text, r'\b(?:until|till|up\s+to|to)\s+(' + NUMBER_PATTERN + r')' + _UNIT)
+    if m:
+        end, explicit_time = parse_number(m.group(1)), True
+
+    m, text = _consume(text, r'\bat\s+(' + NUMBER_PATTERN + r')' + _UNIT)
+    at = parse_number(m.group(1)) if m else None
+    if at is not None:
+        explicit_time = True
+
+    m, text = _consume(text, r'\b(?:right\s+)?(?:now|here|from\s+here|from\s+now)\b')
+
+    # Anything left must be filler; leftover numbers or words mean we didn't understand the clause
+    leftover = [w for w in re.findall(r"[\w'&:.]+", text) if w not in FILLER_WORDS]
+    if leftover:
+        raise CommandParseError(f"Unrecognized words {leftover} in '{clause}'")
+    # "for N seconds" alongside an explicit end ("from 10 to 20", "the first 5 seconds") can't both hold
+    if span is not None and end is not None:
+        raise CommandParseError(f"Conflicting timeframes in '{clause}'")
+
+    command = {"action": action, "type": effect_type}
+    if action == 'delete':
+        if at is not None and start is None:
+            start = end = at
+        if span is not None:
+            start = start if start is not None else current_time
+            end = start + span
+        if explicit_time or span is not None:
+            command["start_time"] = start if start is not None else current_time
+            command["end_time"] = end if end is not None else -1.0
+        return command, action
+
+    if start is None:
+        start = at if at is not None else current_time
+    if span is not None:
+        end = start + span
+    if end is None:
+        end = -1.0
+    if end >= 0 and end < start:
+        raise CommandParseError(f"End before start in '{clause}'")
+    command["start_time"] = float(start)
+    command["end_time"] = float(end)
+    return command, action
+
+
+def parse_command(text, current_time=0, duration=0):
+    """
+    Parse a chat command into the same {"action", "type", "start_time", "end_time"}
+    command list the LLM returns. Raises CommandParseError when the text is ambiguous.
+    """
+    normalized = re.sub(r'\s+', ' ', (text or '').lower()).strip().rstrip('!?.')
+    if not normalized:
+        raise CommandParseError("Empty command")
+    # Keep "black and white" from being split into two clauses
+    normalized = normalized.replace('black and white', 'black & white')
+    # Negations and relative references need real language understanding
+    if re.search(r"\b(?:not|don't|dont|except|but|unless|instead|when|whenever|while|middle|halfway|half way|intro|outro)\b", normalized):
+        raise CommandParseError("Command needs the LLM")
+
+    current_time = float(current_time or 0)
+    commands = []
+    action = None
+    for clause in split_clauses(normalized):
+        command, action = parse_clause(clause, action, current_time, duration)
+        commands.append(command)
+    return commands
@@ -0,0 +1,176 @@
+import os
+import time
+import logging
+import threading
+import functools
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool, NullPool
+from api.helpers import SERVERLESS
+
+logger = logging.getLogger(__name__)
+
+# Pool mode: "queue" keeps a bounded pool of connections (long-lived servers),
+# "null" opens a connection per checkout and closes it on release (serverless,
+# or behind pgbouncer which does the pooling). "auto" picks based on the environment.
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'auto')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+# Statement timeout applied to every transaction on Postgres (0 disables it), and the
+# longer one for routes that read or write many rows at once (see statement_timeout)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '15000'))
+DB_BULK_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_BULK_STATEMENT_TIMEOUT_MS', '60000'))
+# Checkouts that wait longer than this are logged as a warning
+DB_POOL_WAIT_WARN_MS = float(os.getenv('DB_POOL_WAIT_WARN_MS', '100'))
+
+
+def get_pool_mode():
+    mode = DB_POOL_MODE.lower()
+    if mode == 'auto':
+        return 'null' if SERVERLESS else 'queue'
+    if mode not in ('queue', 'null'):
+        raise ValueError(f"Unknown DB_POOL_MODE '{DB_POOL_MODE}'. Use auto, queue or null.")
+    return mode
+
+
+class PoolStats:
+    """Checkout wait and connection-open timings, shared by the timed pools."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.total_connect_ms = 0.0
+
+    def record_checkout(self, wait_ms):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            if wait_ms >= DB_POOL_WAIT_WARN_MS:
+                self.slow_checkouts += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self, connect_ms):
+        with self._lock:
+            self.connects += 1
+            self.total_connect_ms += connect_ms
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "avg_wait_ms": round(self.total_wait_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait_ms, 3),
+                "slow_checkouts": self.slow_checkouts,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "avg_connect_ms": round(self.total_connect_ms / self.connects, 3) if self.connects else 0.0
+            }
+
+
+pool_stats = PoolStats()
+
+
+class TimedPoolMixin:
+    """Measures how long each checkout waits for a connection (including opening one)."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            pool_stats.record_timeout()
+            logger.warning(f"DB pool checkout failed after {(time.perf_counter() - started) * 1000:.1f} ms ({self.status()})")
+            raise
+        wait_ms = (time.perf_counter() - started) * 1000
+        pool_stats.record_checkout(wait_ms)
+        if wait_ms >= DB_POOL_WAIT_WARN_MS:
+            logger.warning(f"Slow DB pool checkout: waited {wait_ms:.1f} ms ({self.status()})")
+        return connection
+
+    def _create_connection(self):
+        started = time.perf_counter()
+        connection = super()._create_connection()
+        pool_stats.record_connect((time.perf_counter() - started) * 1000)
+        return connection
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedNullPool(TimedPoolMixin, NullPool):
+    pass
+
+
+def select_database_url(mode):
+    """
+    Pick the connection URL for the pool mode. A pooled pool ("queue") wants a
+    direct connection; "null" prefers the pgbouncer-pooled POSTGRES_URL.
+    """
+    if mode == 'null':
+        url = os.getenv('POSTGRES_URL') or os.getenv('POSTGRES_URL_NON_POOLING')
+    else:
+        url = os.getenv('POSTGRES_URL_NON_POOLING') or os.getenv('POSTGRES_URL')
+    return url or os.getenv('DATABASE_URL', 'sqlite:///video_editor.db')
+
+
+def engine_options(mode, db_url):
+    """SQLALCHEMY_ENGINE_OPTIONS for the pool mode."""
+    if db_url.startswith('sqlite') and (':memory:' in db_url or db_url.rstrip('/') == 'sqlite:'):
+        # In-memory SQLite needs SQLAlchemy's default single-connection pool
+        return {}
+    if mode == 'null':
+        return {'poolclass': TimedNullPool}
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+
+def set_request_statement_timeout(ms):
+    """Override the statement timeout for transactions started later in the current request."""
+    g.statement_timeout_ms = int(ms)
+
+
+def statement_timeout(ms):
+    """Route decorator: the view's transactions run with a statement timeout of `ms`."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            set_request_statement_timeout(ms)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _apply_statement_timeout(session, transaction, connection):
+    if connection.dialect.name != 'postgresql':
+        return
+    timeout = DB_STATEMENT_TIMEOUT_MS
+    if has_request_context():
+        timeout = g.get('statement_timeout_ms', timeout)
+    if timeout > 0:
+        # SET LOCAL only lasts for this transaction, so it is safe behind pgbouncer transaction pooling
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+
+def install_statement_timeout():
+    """Apply the statement timeout at the start of every ORM transaction."""
+    if not event.contains(Session, 'after_begin', _apply_statement_timeout):
+        event.listen(Session, 'after_begin', _apply_statement_timeout)
@@ -0,0 +1,236 @@
+import os
+import time
+import logging
+import threading
+from api.helpers import cv2
+
+logger = logging.getLogger(__name__)
+
+# Open VideoCapture handles kept across requests, and seconds an unused handle stays open
+DECODER_POOL_SIZE = int(os.getenv('DECODER_POOL_SIZE', '8'))
+DECODER_IDLE_TIMEOUT = float(os.getenv('DECODER_IDLE_TIMEOUT', '60'))
+# Seconds a request waits for a handle when every handle is busy
+DECODER_ACQUIRE_TIMEOUT = float(os.getenv('DECODER_ACQUIRE_TIMEOUT', '5'))
+# Targets up to this many seconds ahead are reached by decoding forward; further ones seek
+DECODER_FORWARD_LIMIT = float(os.getenv('DECODER_FORWARD_LIMIT', '2'))
+
+
+class DecoderPoolExhausted(Exception):
+    """Raised when no decoder handle frees up within the acquire timeout."""
+
+
+class DecoderHandle:
+    """
+    An open VideoCapture that remembers where it is. Reading a frame a little
+    ahead of the current position grabs forward instead of seeking, which
+    would restart decoding from the previous keyframe.
+    """
+
+    def __init__(self, video_url):
+        self.video_url = video_url
+        self.cap = cv2.VideoCapture(video_url)
+        if not self.cap.isOpened():
+            self.cap.release()
+            raise ValueError(f"Could not open video: {video_url}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        # Index of the frame the next read() returns
+        self.position = 0
+        self.last_index = None
+        self.last_frame = None
+        self.last_used = time.monotonic()
+        self.busy = False
+        self.seeks = 0
+        self.forward_frames = 0
+
+    def frame_index(self, t):
+        index = int(round(max(0.0, t) * self.fps))
+        if self.frame_count > 0:
+            index = min(index, self.frame_count - 1)
+        return index
+
+    def distance(self, index):
+        """Frames to decode forward to reach `index`, or None if it needs a seek."""
+        if index == self.last_index:
+            return 0
+        gap = index - self.position
+        if 0 <= gap <= DECODER_FORWARD_LIMIT * self.fps:
+            return gap + 1
+        return None
+
+    def read_at(self, t):
+        """Return (frame, actual_time) for the frame at playback time t."""
+        index = self.frame_index(t)
+        if index == self.last_index:
+            return self.last_frame, index / self.fps
+
+        if self.distance(index) is None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            self.position = index
+            self.seeks += 1
+        while self.position < index:
+            if not self.cap.grab():
+                break
+            self.position += 1
+            self.forward_frames += 1
+
+        ok, frame = self.cap.read()
+        if not ok or frame is None:
+            # Reading past the end leaves the capture in an unknown state; seek next time
+            self.position = -1
+            self.last_index = None
+            self.last_frame = None
+            raise ValueError(f"No frame at {t:.3f}s in {self.video_url}")
+        self.last_index = index
+        self.last_frame = frame
+        self.position = index + 1
+        return frame, index / self.fps
+
+    def close(self):
+        self.cap.release()
+        self.last_frame = None
+
+
+class DecoderPool:
+    """
+    LRU pool of open decoder handles keyed by video_url. Several handles may be
+    open for one video; a request gets the idle handle closest behind its
+    target time. Handles idle for longer than `idle_timeout` are closed, and at
+    most `max_handles` are open at once.
+    """
+
+    def __init__(self, max_handles=DECODER_POOL_SIZE, idle_timeout=DECODER_IDLE_TIMEOUT,
+                 acquire_timeout=DECODER_ACQUIRE_TIMEOUT):
+        self.max_handles = max_handles
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        # Least recently used first
+        self._handles = []
+        self._opening = 0
+        self._cond = threading.Condition()
+        self._reaper = None
+        self.reuses = 0
+        self.opens = 0
+        self.evictions = 0
+        # Counters of handles that have already been closed
+        self._closed_seeks = 0
+        self._closed_forward_frames = 0
+
+    def _close(self, handle):
+        self._handles.remove(handle)
+        self.evictions += 1
+        self._closed_seeks += handle.seeks
+        self._closed_forward_frames += handle.forward_frames
+        handle.close()
+
+    def _evict_idle(self, now):
+        for handle in [h for h in self._handles if not h.busy and now - h.last_used > self.idle_timeout]:
+            self._close(handle)
+
+    def _pick(self, video_url, t):
+        """Best idle handle for the target: fewest frames to decode, seeking as a last resort."""
+        best, best_cost = None, None
+        for handle in self._handles:
+            if handle.busy or handle.video_url != video_url:
+                continue
+            distance = handle.distance(handle.frame_index(t))
+            cost = distance if distance is not None else float('inf')
+            if best is None or cost < best_cost:
+                best, best_cost = handle, cost
+        return best
+
+    def acquire(self, video_url, t=0.0):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._evict_idle(now)
+                handle = self._pick(video_url, t)
+                if handle is not None:
+                    handle.busy = True
+                    self._handles.remove(handle)
+                    self._handles.append(handle)
+                    self.reuses += 1
+                    return handle
+                if len(self._handles) + self._opening >= self.max_handles:
+                    idle = [h for h in self._handles if not h.busy]
+                    if idle:
+                        # Make room by closing the least recently used idle handle
+                        self._close(idle[0])
+                if len(self._handles) + self._opening < self.max_handles:
+                    self._opening += 1
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise DecoderPoolExhausted("All video decoders are busy")
+                self._cond.wait(remaining)
+
+        # Opening a capture can take a while (network probe); don't hold the lock for it
+        try:
+            handle = DecoderHandle(video_url)
+        except Exception:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+        handle.busy = True
+        with self._cond:
+            self._opening -= 1
+            self._handles.append(handle)
+            self.opens += 1
+            self._start_reaper()
+        return handle
+
+    def release(self, handle, discard=False):
+        with self._cond:
+            handle.busy = False
+            handle.last_used = time.monotonic()
+            if discard and handle in self._handles:
+                self._close(handle)
+            self._cond.notify()
+
+    def frame_at(self, video_url, t):
+        """Decode the frame at time t. Returns (frame, actual_time)."""
+        handle = self.acquire(video_url, t)
+        try:
+            result = handle.read_at(t)
+        except Exception:
+            self.release(handle, discard=True)
+            raise
+        self.release(handle)
+        return result
+
+    def _start_reaper(self):
+        if self._reaper is None and self.idle_timeout > 0:
+            self._reaper = threading.Thread(target=self._reap, daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        """Close idle handles even when no requests arrive to trigger eviction."""
+        while True:
+            time.sleep(max(1.0, self.idle_timeout / 2))
+            with self._cond:
+                self._evict_idle(time.monotonic())
+
+    def clear(self):
+        with self._cond:
+            for handle in [h for h in self._handles if not h.busy]:
+                self._close(handle)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "open": len(self._handles),
+                "busy": sum(1 for h in self._handles if h.busy),
+                "max_handles": self.max_handles,
+                "idle_timeout": self.idle_timeout,
+                "opens": self.opens,
+                "reuses": self.reuses,
+                "evictions": self.evictions,
+                "seeks": self._closed_seeks + sum(h.seeks for h in self._handles),
+                "forward_frames": self._closed_forward_frames + sum(h.forward_frames for h in self._handles),
+                "videos": len({h.video_url for h in self._handles})
+            }
+
+
+decoder_pool = DecoderPool()
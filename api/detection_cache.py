@@ -0,0 +1,134 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from api.helpers import np, cv2
+
+# Maximum number of cached frames, seconds an entry stays valid, and whether
+# near-duplicate frames are matched with a downscaled perceptual hash (off by
+# default: a 64-bit hash can't see a face move a few pixels, so it may return stale boxes)
+DETECTION_CACHE_SIZE = int(os.getenv('DETECTION_CACHE_SIZE', '1024'))
+DETECTION_CACHE_TTL = float(os.getenv('DETECTION_CACHE_TTL', '300'))
+DETECTION_CACHE_PERCEPTUAL = os.getenv('DETECTION_CACHE_PERCEPTUAL', 'false').lower() in ('1', 'true', 'yes')
+
+
+def content_key(buffer):
+    """Hash of the encoded image bytes. Computed without decoding the image."""
+    return "c:" + hashlib.blake2b(buffer, digest_size=16).hexdigest()
+
+
+def perceptual_key(buffer):
+    """
+    Difference hash of a 1/8-scale grayscale decode of the image.
+    Frames that differ only by compression noise map to the same key.
+    The reduced size is part of the key so boxes are only reused at the same resolution.
+    """
+    nparr = np.frombuffer(buffer, np.uint8)
+    small = cv2.imdecode(nparr, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if small is None:
+        return None
+    thumb = cv2.resize(small, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(thumb[:, 1:] > thumb[:, :-1])
+    return f"p:{small.shape[1]}x{small.shape[0]}:{bits.tobytes().hex()}"
+
+
+class DetectionCache:
+    """
+    Bounded, thread-safe LRU cache of detection results with a TTL.
+    Entries are looked up by content hash first, then by perceptual hash.
+    """
+
+    def __init__(self, max_size=DETECTION_CACHE_SIZE, ttl=DETECTION_CACHE_TTL, perceptual=DETECTION_CACHE_PERCEPTUAL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.perceptual = perceptual
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put(self, key, value, now):
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def lookup(self, buffer, namespace=""):
+        """
+        Return (detections, keys). detections is None on a miss; keys should be
+        passed back to store() once the frame has been detected.
+        namespace separates results computed with different detection settings.
+        """
+        if self.max_size <= 0:
+            return None, []
+
+        keys = [namespace + content_key(buffer)]
+        now = time.monotonic()
+        with self._lock:
+            value = self._get(keys[0], now)
+            if value is not None:
+                self.hits += 1
+                return value, keys
+
+        if self.perceptual:
+            p_key = perceptual_key(buffer)
+            if p_key:
+                p_key = namespace + p_key
+                keys.append(p_key)
+                with self._lock:
+                    value = self._get(p_key, now)
+                    if value is not None:
+                        self.hits += 1
+                        self.perceptual_hits += 1
+                        # Remember the exact bytes too so the next lookup skips the reduced decode
+                        self._put(keys[0], value, now)
+                        return value, keys
+
+        with self._lock:
+            self.misses += 1
+        return None, keys
+
+    def store(self, keys, detections):
+        if self.max_size <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._put(key, detections, now)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "perceptual": self.perceptual,
+                "hits": self.hits,
+                "perceptual_hits": self.perceptual_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+detection_cache = DetectionCache()
@@ -0,0 +1,285 @@
+import os
+import time
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from api.helpers import np, cv2, detect_face_boxes_scaled, SERVERLESS
+from api.metrics import record_stages
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for /detect-faces. 0 disables the engine and detects in the request thread.
+# Serverless functions can't keep a process pool around, so it is off there by default.
+DETECTION_ENGINE_WORKERS = int(os.getenv('DETECTION_ENGINE_WORKERS', '0' if SERVERLESS else str(os.cpu_count() or 1)))
+# Frames that can be in flight at once (submission queue bound), and the size of each shared-memory slot
+DETECTION_ENGINE_QUEUE = int(os.getenv('DETECTION_ENGINE_QUEUE', str(max(1, DETECTION_ENGINE_WORKERS) * 2)))
+DETECTION_ENGINE_SLOT_BYTES = int(os.getenv('DETECTION_ENGINE_SLOT_BYTES', str(1920 * 1080 * 3)))
+# Seconds a request waits for a free slot before the engine reports it is busy
+DETECTION_ENGINE_TIMEOUT = float(os.getenv('DETECTION_ENGINE_TIMEOUT', '5'))
+# Seconds a request waits for a worker's result before giving up with a 503
+DETECTION_ENGINE_RESULT_TIMEOUT = float(os.getenv('DETECTION_ENGINE_RESULT_TIMEOUT', '10'))
+# A timed-out frame keeps its slot until its worker finishes it. Once this many slots are held by
+# timed-out frames the workers are assumed hung: they are killed and the pool rebuilt (0 = one per worker)
+DETECTION_ENGINE_MAX_STUCK = int(os.getenv('DETECTION_ENGINE_MAX_STUCK', '0'))
+# OpenCV's own thread pool per process. One thread per worker avoids oversubscribing cores.
+DETECTION_CV_THREADS = int(os.getenv('DETECTION_CV_THREADS', '1'))
+DETECTION_ENGINE_START_METHOD = os.getenv('DETECTION_ENGINE_START_METHOD', 'spawn')
+
+
+class EngineBusy(Exception):
+    """Raised when no frame slot frees up within the submission timeout, or a result is too slow."""
+
+
+class EngineUnavailable(EngineBusy):
+    """Raised when a worker process died; the pool is rebuilt for the next frame."""
+
+
+# Worker-side state: shared-memory segments attached by name, reused across tasks
+_worker_segments = {}
+
+
+def _init_worker(cv_threads):
+    cv2.setNumThreads(cv_threads)
+
+
+def _detect_in_slot(slot_name, shape, dtype, profile):
+    """
+    Worker entry point: view the frame in shared memory and run the cascade on it.
+    Returns (boxes, stage timings); the timings are recorded by the parent process.
+    """
+    segment = _worker_segments.get(slot_name)
+    if segment is None:
+        segment = shared_memory.SharedMemory(name=slot_name)
+        _worker_segments[slot_name] = segment
+
+    frame = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+    boxes, timings = _detect_boxes(frame, profile)
+    # Drop the view before returning so the segment can be closed cleanly
+    del frame
+    return boxes, timings
+
+
+def _detect_boxes(frame, profile):
+    """(boxes, {stage: seconds}) for a BGR or grayscale frame."""
+    timings = {}
+    started = time.perf_counter()
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    timings['cvt_color'] = time.perf_counter() - started
+    boxes = detect_face_boxes_scaled(gray, profile, timings)
+    return [tuple(int(v) for v in box) for box in boxes], timings
+
+
+def detect_frame_boxes(frame, profile=None):
+    """Detect faces in a BGR or grayscale frame in the calling thread."""
+    boxes, timings = _detect_boxes(frame, profile)
+    record_stages(timings)
+    return boxes
+
+
+class EnginePool:
+    """
+    One generation of the engine: a process pool and its shared-memory slots.
+    A pool whose worker died (or hung) is replaced as a whole generation;
+    slots still held by requests on the old one are unlinked once they are
+    handed back. `stuck` holds slots whose frame timed out in a worker.
+    """
+
+    def __init__(self, workers, slots, slot_bytes):
+        self.segments = [shared_memory.SharedMemory(create=True, size=slot_bytes) for _ in range(slots)]
+        self.free = list(range(slots))
+        self.stuck = set()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(DETECTION_ENGINE_START_METHOD),
+            initializer=_init_worker,
+            initargs=(DETECTION_CV_THREADS,)
+        )
+
+    def take(self):
+        """A free slot index, or None once the pool was closed."""
+        with self.lock:
+            return None if self.closed else self.free.pop()
+
+    def give(self, index):
+        with self.lock:
+            self.free.append(index)
+            if self.closed and len(self.free) == len(self.segments):
+                self._unlink()
+
+    def terminate(self):
+        """Kill the worker processes; a hung worker never exits on its own."""
+        for process in list((getattr(self.executor, '_processes', None) or {}).values()):
+            process.terminate()
+
+    def close(self, wait=False):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+        with self.lock:
+            self.closed = True
+            if wait or len(self.free) == len(self.segments):
+                self._unlink()
+
+    def _unlink(self):
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+        self.segments = []
+
+
+class DetectionEngine:
+    """
+    Process pool for face detection. Each worker process has its own
+    CascadeClassifier and OpenCV thread setting. Frames are copied once into
+    a fixed set of shared-memory slots rather than pickled; the number of
+    slots bounds how many frames can be queued.
+    """
+
+    def __init__(self, workers=DETECTION_ENGINE_WORKERS, slots=DETECTION_ENGINE_QUEUE,
+                 slot_bytes=DETECTION_ENGINE_SLOT_BYTES, timeout=DETECTION_ENGINE_TIMEOUT,
+                 result_timeout=DETECTION_ENGINE_RESULT_TIMEOUT, max_stuck=DETECTION_ENGINE_MAX_STUCK):
+        self.workers = workers
+        self.max_stuck = max_stuck or max(1, workers)
+        self.slot_count = slots
+        self.slot_bytes = slot_bytes
+        self.timeout = timeout
+        self.result_timeout = result_timeout
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(slots)
+        self._start_lock = threading.Lock()
+        self._count_lock = threading.Lock()
+        self._in_use = 0
+        self.restarts = 0
+        self.timeouts = 0
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def start(self):
+        with self._start_lock:
+            if self._pool is not None:
+                return self._pool
+            self._pool = EnginePool(self.workers, self.slot_count, self.slot_bytes)
+            logger.info(f"Detection engine started: {self.workers} workers, {self.slot_count} slots")
+            return self._pool
+
+    def shutdown(self):
+        with self._start_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close(wait=True)
+
+    def _discard(self, pool, reason="Detection worker died", terminate=False):
+        """Drop a broken pool; the next frame starts a new one. Returns False if it was already dropped."""
+        with self._start_lock:
+            if self._pool is not pool:
+                return False
+            self._pool = None
+            self.restarts += 1
+        logger.warning(f"{reason}; restarting the detection engine")
+        if terminate:
+            pool.terminate()
+        pool.close()
+        return True
+
+    def _release(self, pool, index):
+        pool.give(index)
+        with self._count_lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    def _release_stuck(self, pool, index):
+        """Hand back a timed-out frame's slot, unless a rebuild already did."""
+        with pool.lock:
+            if index not in pool.stuck:
+                return
+            pool.stuck.discard(index)
+        self._release(pool, index)
+
+    def _hold_stuck(self, pool, index, future):
+        """
+        Keep a timed-out frame's slot until its worker is done with it. When
+        max_stuck slots are held that way the workers are hung: kill them,
+        rebuild the pool and return the slots now, so capacity doesn't shrink.
+        """
+        with pool.lock:
+            pool.stuck.add(index)
+            hung = len(pool.stuck) >= self.max_stuck
+        future.add_done_callback(lambda _: self._release_stuck(pool, index))
+        if hung and self._discard(pool, f"{self.max_stuck} detection results timed out", terminate=True):
+            with pool.lock:
+                stuck, pool.stuck = list(pool.stuck), set()
+            for stuck_index in stuck:
+                self._release(pool, stuck_index)
+
+    def detect(self, frame, profile=None):
+        """
+        Return face boxes for a decoded frame. Falls back to detecting in the
+        calling thread when the engine is disabled or the frame doesn't fit a slot.
+        Raises EngineBusy when every slot stays taken for `timeout` seconds or
+        the result takes longer than `result_timeout`, and EngineUnavailable
+        when a worker died (the pool is rebuilt for the next frame).
+        """
+        if not self.enabled or frame.nbytes > self.slot_bytes:
+            return detect_frame_boxes(frame, profile)
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise EngineBusy("Detection engine is at capacity")
+        with self._count_lock:
+            self._in_use += 1
+        index = None
+        while index is None:
+            # A pool discarded by another request after we read it hands out no slots
+            pool = self._pool or self.start()
+            index = pool.take()
+        held = True
+        try:
+            segment = pool.segments[index]
+            view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=segment.buf)
+            view[...] = frame
+            del view
+            future = pool.executor.submit(_detect_in_slot, segment.name, frame.shape, frame.dtype.str, profile)
+            try:
+                boxes, timings = future.result(timeout=self.result_timeout)
+            except FuturesTimeout:
+                # The worker may still be reading the slot: hand it back when the task ends
+                held = False
+                with self._count_lock:
+                    self.timeouts += 1
+                self._hold_stuck(pool, index, future)
+                raise EngineBusy(f"Detection took longer than {self.result_timeout:g}s")
+            record_stages(timings)
+            return boxes
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise EngineUnavailable("A detection worker died; the engine is restarting")
+        finally:
+            if held:
+                self._release(pool, index)
+
+    def stats(self):
+        with self._count_lock:
+            in_use = self._in_use
+        pool = self._pool
+        return {
+            "enabled": self.enabled,
+            "running": self._pool is not None,
+            "workers": self.workers,
+            "slots": self.slot_count,
+            "slots_in_use": in_use,
+            "slots_stuck": len(pool.stuck) if pool else 0,
+            "max_stuck": self.max_stuck,
+            "slot_bytes": self.slot_bytes,
+            "cv_threads": DETECTION_CV_THREADS,
+            "restarts": self.restarts,
+            "timeouts": self.timeouts
+        }
+
+
+detection_engine = DetectionEngine()
+atexit.register(detection_engine.shutdown)
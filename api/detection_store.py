@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import atexit
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from api.helpers import np
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Where each project's detection columns are stored
+DETECTION_STORE_DIR = os.getenv('DETECTION_STORE_DIR', os.path.join(os.path.dirname(__file__), 'detections'))
+# Appended boxes are buffered until there are this many, or the oldest is this many seconds old
+# (a background thread flushes old rows when no further append comes)
+DETECTION_STORE_FLUSH_ROWS = int(os.getenv('DETECTION_STORE_FLUSH_ROWS', '256'))
+DETECTION_STORE_FLUSH_SECONDS = float(os.getenv('DETECTION_STORE_FLUSH_SECONDS', '2'))
+# Most boxes returned by one range query
+DETECTION_STORE_MAX_ROWS = int(os.getenv('DETECTION_STORE_MAX_ROWS', '10000'))
+
+# One raw little-endian file per column; rows are kept sorted by t
+COLUMNS = (
+    ('t', '<f8'),
+    ('x', '<i4'),
+    ('y', '<i4'),
+    ('w', '<i4'),
+    ('h', '<i4'),
+    ('track_id', '<i8'),  # -1 for boxes that don't belong to a track
+    ('source', 'u1'),
+)
+# Where a box came from: a whole-video track job, or a live /detect-faces or stream frame
+SOURCES = {'track': 0, 'live': 1}
+SOURCE_NAMES = {value: name for name, value in SOURCES.items()}
+META_FILE = 'meta.json'
+LOCK_FILE = '.lock'
+
+
+def row_dtype():
+    """Structured dtype used to sort and merge rows before they are split into columns."""
+    return np.dtype(list(COLUMNS))
+
+
+def track_number(detection_id):
+    """Tracking sessions use 8 hex digit track IDs; store them as integers."""
+    try:
+        return int(detection_id, 16)
+    except (TypeError, ValueError):
+        return -1
+
+
+def detection_rows(t, detections, source, tracked=False):
+    """Rows for one frame's detection dicts."""
+    return [
+        (t, d["x"], d["y"], d["width"], d["height"], track_number(d.get("id")) if tracked else -1, SOURCES[source])
+        for d in detections
+    ]
+
+
+class ColumnStore:
+    """
+    One project's boxes as columns in separate files plus meta.json with the
+    row count. Readers memory-map the columns and binary-search t, so a range
+    query touches only the pages it returns. Appends usually land at the end;
+    boxes older than the last stored one are merged into the tail, which is
+    rewritten from the first row they displace. Writes and queries hold an
+    flock on the store, and re-read the count under it, because the job runner
+    (possibly a separate process) and web processes write the same files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._pending = []
+        self._pending_since = None
+        self.count = self._read_count()
+
+    def _column_path(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _read_count(self):
+        try:
+            with open(os.path.join(self.path, META_FILE)) as f:
+                return int(json.load(f)["count"])
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def _write_count(self, count):
+        # The count is published last, so readers never see rows that are still being written
+        tmp = os.path.join(self.path, f"{META_FILE}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump({"count": count, "columns": dict(COLUMNS)}, f)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+        self.count = count
+
+    @contextmanager
+    def _locked(self):
+        """Hold the thread lock and the cross-process file lock, with self.count re-read from disk."""
+        with self.lock:
+            if not self._pending and not os.path.isdir(self.path):
+                # Nothing stored or buffered yet; don't create the directory just to read it
+                self.count = 0
+                yield
+                return
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, LOCK_FILE), 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self.count = self._read_count()
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _columns(self, count):
+        if count == 0:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+        return {name: np.memmap(self._column_path(name), dtype=dtype, mode='r', shape=(count,))
+                for name, dtype in COLUMNS}
+
+    def _write(self, rows, offset, truncate=False):
+        os.makedirs(self.path, exist_ok=True)
+        for name, dtype in COLUMNS:
+            path = self._column_path(name)
+            with open(path, 'r+b' if os.path.exists(path) and not truncate else 'wb') as f:
+                f.seek(offset * np.dtype(dtype).itemsize)
+                f.write(np.ascontiguousarray(rows[name]).tobytes())
+                f.truncate()
+        self._write_count(offset + len(rows))
+
+    def _read_rows(self, start, end):
+        columns = self._columns(self.count)
+        rows = np.empty(end - start, dtype=row_dtype())
+        for name, _ in COLUMNS:
+            rows[name] = columns[name][start:end]
+        return rows
+
+    def _flush(self):
+        if not self._pending:
+            return
+        rows = np.array(self._pending, dtype=row_dtype())
+        self._pending = []
+        self._pending_since = None
+        rows = rows[np.argsort(rows['t'], kind='stable')]
+
+        offset = self.count
+        if offset:
+            offset = int(np.searchsorted(self._columns(self.count)['t'], rows['t'][0], side='right'))
+        if offset < self.count:
+            # Late boxes: merge them with the stored rows they belong between
+            rows = np.concatenate((self._read_rows(offset, self.count), rows))
+            rows = rows[np.argsort(rows['t'], kind='stable')]
+        self._write(rows, offset)
+
+    def _due(self):
+        return self._pending_since is not None and time.monotonic() - self._pending_since >= DETECTION_STORE_FLUSH_SECONDS
+
+    def append(self, rows):
+        with self.lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.extend(rows)
+            due = len(self._pending) >= DETECTION_STORE_FLUSH_ROWS or self._due()
+        if due:
+            self.flush()
+
+    def flush_due(self):
+        """Flush if the oldest buffered row is DETECTION_STORE_FLUSH_SECONDS old."""
+        with self.lock:
+            due = self._due()
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._locked():
+            self._flush()
+
+    def replace_source(self, source, rows):
+        """Replace every box from `source` (e.g. when a track job is re-run) with `rows`."""
+        os.makedirs(self.path, exist_ok=True)
+        with self._locked():
+            self._flush()
+            kept = self._read_rows(0, self.count)
+            kept = kept[kept['source'] != SOURCES[source]]
+            rows = np.concatenate((kept, np.array(rows, dtype=row_dtype())))
+            self._write(rows[np.argsort(rows['t'], kind='stable')], 0, truncate=True)
+
+    def query(self, start, end, source=None, limit=DETECTION_STORE_MAX_ROWS, skip=0):
+        """
+        Columns (dict of arrays) for boxes with start <= t <= end, at most `limit`
+        of them after skipping the first `skip`, and whether the range was cut short.
+        """
+        # Held while copying too: merging late boxes rewrites the tail in place
+        with self._locked():
+            self._flush()
+            columns = self._columns(self.count)
+            lo = int(np.searchsorted(columns['t'], start, side='left'))
+            hi = int(np.searchsorted(columns['t'], end, side='right'))
+            if source is None:
+                lo = min(lo + skip, hi)
+                truncated = hi - lo > limit
+                hi = min(hi, lo + limit)
+                return {name: np.array(column[lo:hi]) for name, column in columns.items()}, truncated
+            keep = np.flatnonzero(columns['source'][lo:hi] == SOURCES[source])[skip:]
+            truncated = len(keep) > limit
+            keep = keep[:limit] + lo
+            return {name: np.array(column[keep]) for name, column in columns.items()}, truncated
+
+
+class DetectionStore:
+    """
+    Per-project ColumnStores under DETECTION_STORE_DIR, opened on first use.
+    The first append starts a flusher thread, so buffered rows reach the files
+    (and other processes) after the last frame of a stream too.
+    """
+
+    def __init__(self, root=DETECTION_STORE_DIR):
+        self.root = root
+        self._stores = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def get(self, project_id):
+        with self._lock:
+            store = self._stores.get(project_id)
+            if store is None:
+                store = self._stores[project_id] = ColumnStore(os.path.join(self.root, project_id))
+            return store
+
+    def append(self, project_id, t, detections, source='live', tracked=False):
+        if detections:
+            self._start_flusher()
+            self.get(project_id).append(detection_rows(t, detections, source, tracked))
+
+    def _start_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            # is_alive() is False in a forked child, which needs its own thread
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, name="detection-store-flush", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(max(0.1, DETECTION_STORE_FLUSH_SECONDS / 2))
+            with self._lock:
+                stores = list(self._stores.values())
+            for store in stores:
+                try:
+                    store.flush_due()
+                except Exception as e:
+                    logger.error(f"Error flushing detection store {store.path}: {e}")
+
+    def flush(self, project_id):
+        """Write a project's buffered rows now (e.g. when its stream ends)."""
+        with self._lock:
+            store = self._stores.get(project_id)
+        if store is not None:
+            store.flush()
+
+    def replace_track(self, project_id, samples):
+        """Store a track job's {t, detections} samples, replacing the previous job's."""
+        rows = []
+        for sample in samples:
+            rows.extend(detection_rows(sample["t"], sample["detections"], 'track'))
+        self.get(project_id).replace_source('track', rows)
+
+    def query(self, project_id, start, end, source=None, limit=DETECTION_STORE_MAX_ROWS, skip=0):
+        return self.get(project_id).query(start, end, source, limit, skip)
+
+    def delete(self, project_id):
+        with self._lock:
+            store = self._stores.pop(project_id, None)
+        if store is not None:
+            with store.lock:
+                store._pending = []
+        shutil.rmtree(os.path.join(self.root, project_id), ignore_errors=True)
+
+    def flush_all(self):
+        with self._lock:
+            stores = list(self._stores.values())
+        for store in stores:
+            try:
+                store.flush()
+            except Exception as e:
+                logger.error(f"Error flushing detection store {store.path}: {e}")
+
+
+detection_store = DetectionStore()
+atexit.register(detection_store.flush_all)
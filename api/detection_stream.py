@@ -0,0 +1,163 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+# Open streams kept at once, and seconds a stream with no frames or subscriber stays alive
+MAX_STREAMS = int(os.getenv('DETECTION_MAX_STREAMS', '256'))
+STREAM_TTL = float(os.getenv('DETECTION_STREAM_TTL', '60'))
+
+
+class PendingFrame:
+    __slots__ = ('buffer', 't', 'seq', 'received_at')
+
+    def __init__(self, buffer, t, seq):
+        self.buffer = buffer
+        self.t = t
+        self.seq = seq
+        self.received_at = time.monotonic()
+
+
+class FrameStream:
+    """
+    Latest-frame-wins mailbox between a client pushing frames and the event
+    stream that detects them. Only one frame is ever pending: a newer frame
+    replaces one that hasn't been picked up yet, so work never queues behind
+    a slow detector and each result describes a recent frame.
+    """
+
+    def __init__(self, profile, tracking=False, keyframe_interval=None, project_id=None):
+        self.id = str(uuid.uuid4())
+        self.profile = profile
+        self.tracking = tracking
+        self.keyframe_interval = keyframe_interval
+        # Results for frames with a timestamp are kept in this project's detection store
+        self.project_id = project_id
+        self._cond = threading.Condition()
+        self._pending = None
+        self._next_seq = 0
+        self.last_seq = -1
+        self.subscribed = False
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+        self.stale = 0
+        self.processed = 0
+        self.last_used = time.monotonic()
+
+    def submit(self, buffer, t=None, seq=None):
+        """
+        Offer a frame. Returns (seq, accepted, replaced): frames older than the
+        newest one seen (by client sequence number) are refused, and a pending
+        frame that hadn't been picked up yet is replaced.
+        """
+        with self._cond:
+            self.last_used = time.monotonic()
+            self.received += 1
+            if seq is None:
+                seq = self._next_seq
+            if seq <= self.last_seq:
+                # Arrived after a newer frame (requests overtaking each other)
+                self.stale += 1
+                return seq, False, False
+            self.last_seq = seq
+            self._next_seq = seq + 1
+            replaced = self._pending is not None
+            if replaced:
+                self.dropped += 1
+            self._pending = PendingFrame(buffer, t, seq)
+            self._cond.notify()
+            return seq, True, replaced
+
+    def take(self, timeout):
+        """Wait up to `timeout` seconds for the pending frame and remove it. None on timeout or close."""
+        with self._cond:
+            if self._pending is None and not self.closed:
+                self._cond.wait(timeout)
+            frame, self._pending = self._pending, None
+            self.last_used = time.monotonic()
+            if frame is None or self.closed:
+                return None
+            self.processed += 1
+            return frame
+
+    def subscribe(self):
+        """Claim the stream's event channel. Only one subscriber consumes frames at a time."""
+        with self._cond:
+            if self.subscribed or self.closed:
+                return False
+            self.subscribed = True
+            return True
+
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribed = False
+            self.last_used = time.monotonic()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._pending = None
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "stream_id": self.id,
+                "profile": self.profile,
+                "tracking": self.tracking,
+                "project_id": self.project_id,
+                "subscribed": self.subscribed,
+                "received": self.received,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "stale": self.stale,
+                "pending": self._pending is not None
+            }
+
+
+class StreamStore:
+    """Bounded map of stream ID to FrameStream with idle expiry."""
+
+    def __init__(self, max_streams=MAX_STREAMS, ttl=STREAM_TTL):
+        self.max_streams = max_streams
+        self.ttl = ttl
+        self._streams = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        for stream_id, stream in list(self._streams.items()):
+            # A stream with a live event subscriber is kept even when no frames arrive
+            if not stream.subscribed and now - stream.last_used > self.ttl:
+                del self._streams[stream_id]
+                stream.close()
+
+    def create(self, profile, tracking=False, keyframe_interval=None, project_id=None):
+        stream = FrameStream(profile, tracking, keyframe_interval, project_id)
+        with self._lock:
+            self._expire(time.monotonic())
+            self._streams[stream.id] = stream
+            while len(self._streams) > self.max_streams:
+                _, oldest = self._streams.popitem(last=False)
+                oldest.close()
+        return stream
+
+    def get(self, stream_id):
+        with self._lock:
+            self._expire(time.monotonic())
+            stream = self._streams.get(stream_id)
+            if stream is not None:
+                self._streams.move_to_end(stream_id)
+            return stream
+
+    def remove(self, stream_id):
+        with self._lock:
+            stream = self._streams.pop(stream_id, None)
+        if stream is None:
+            return False
+        stream.close()
+        return True
+
+
+detection_streams = StreamStore()
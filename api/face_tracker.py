@@ -0,0 +1,205 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from api.helpers import cv2, detect_face_boxes
+from api.detection_engine import detection_engine
+
+# Full-frame cascade runs at most every N frames of a session
+KEYFRAME_INTERVAL = int(os.getenv('TRACKING_KEYFRAME_INTERVAL', '10'))
+# Template match score below which a track is re-detected in its ROI
+MIN_TRACK_SCORE = float(os.getenv('TRACKING_MIN_SCORE', '0.6'))
+# Search window / ROI margin around a box, as a fraction of the box size
+SEARCH_MARGIN = 0.5
+# Minimum IoU for a fresh detection to keep an existing track's ID
+MATCH_IOU = 0.3
+# Sessions idle for longer than this are dropped, and at most this many are kept
+SESSION_TTL = float(os.getenv('TRACKING_SESSION_TTL', '60'))
+MAX_SESSIONS = int(os.getenv('TRACKING_MAX_SESSIONS', '256'))
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+def expand_box(box, margin, width, height):
+    """Grow a box by `margin` of its size on each side, clipped to the frame."""
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    x0, y0 = max(0, x - dx), max(0, y - dy)
+    x1, y1 = min(width, x + w + dx), min(height, y + h + dy)
+    return x0, y0, x1, y1
+
+
+class Track:
+    def __init__(self, box, template):
+        self.id = str(uuid.uuid4())[:8]
+        self.box = box
+        self.template = template
+        self.score = 1.0
+
+    def to_detection(self, confidence):
+        x, y, w, h = self.box
+        return {
+            "id": self.id,
+            "x": int(x),
+            "y": int(y),
+            "width": int(w),
+            "height": int(h),
+            "confidence": round(float(confidence), 3),
+            "label": "Face"
+        }
+
+
+class TrackingSession:
+    """
+    Per-client detection state. The full cascade only runs on keyframes; in
+    between, boxes follow the face by template matching in a small search
+    window, and a track that loses its match is re-detected in an ROI around
+    its last box. Track IDs stay stable across frames.
+    """
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL, profile=None):
+        self.keyframe_interval = keyframe_interval
+        self.profile = profile
+        self.tracks = []
+        self.frame_shape = None
+        self.frames_since_keyframe = 0
+        self.force_keyframe = True
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _template(self, gray, box):
+        x, y, w, h = box
+        return gray[y:y + h, x:x + w].copy()
+
+    def _keyframe(self, gray):
+        """Full-frame detection. New boxes inherit the ID of the best-overlapping old track."""
+        boxes = [tuple(int(v) for v in b) for b in detection_engine.detect(gray, self.profile)]
+        previous = list(self.tracks)
+        tracks = []
+        for box in boxes:
+            best = max(previous, key=lambda t: iou(t.box, box), default=None)
+            if best is not None and iou(best.box, box) >= MATCH_IOU:
+                previous.remove(best)
+                best.box = box
+                best.template = self._template(gray, box)
+                best.score = 1.0
+                tracks.append(best)
+            else:
+                tracks.append(Track(box, self._template(gray, box)))
+        self.tracks = tracks
+        self.frames_since_keyframe = 0
+        self.force_keyframe = False
+
+    def _redetect_roi(self, gray, track):
+        """Run the cascade only in an ROI around the track's last box."""
+        height, width = gray.shape[:2]
+        x0, y0, x1, y1 = expand_box(track.box, SEARCH_MARGIN, width, height)
+        roi = gray[y0:y1, x0:x1]
+        _, _, w, h = track.box
+        min_side = max(20, int(min(w, h) * 0.7))
+        boxes = detect_face_boxes(roi, min_size=(min_side, min_side))
+        if len(boxes) == 0:
+            return False
+        shifted = [(int(bx) + x0, int(by) + y0, int(bw), int(bh)) for bx, by, bw, bh in boxes]
+        track.box = max(shifted, key=lambda b: iou(track.box, b))
+        track.template = self._template(gray, track.box)
+        track.score = 1.0
+        return True
+
+    def _follow(self, gray, track):
+        """Move a track by template matching within its search window. Returns False if lost."""
+        height, width = gray.shape[:2]
+        x0, y0, x1, y1 = expand_box(track.box, SEARCH_MARGIN, width, height)
+        window = gray[y0:y1, x0:x1]
+        th, tw = track.template.shape[:2]
+        if window.shape[0] < th or window.shape[1] < tw or th == 0 or tw == 0:
+            return self._redetect_roi(gray, track)
+
+        result = cv2.matchTemplate(window, track.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, loc = cv2.minMaxLoc(result)
+        if score < MIN_TRACK_SCORE:
+            return self._redetect_roi(gray, track)
+
+        track.box = (x0 + loc[0], y0 + loc[1], tw, th)
+        track.score = score
+        return True
+
+    def process(self, frame):
+        """Return (detections, is_keyframe) for a decoded BGR frame."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.last_used = time.monotonic()
+
+        if gray.shape != self.frame_shape:
+            self.frame_shape = gray.shape
+            self.force_keyframe = True
+
+        is_keyframe = (
+            self.force_keyframe
+            or not self.tracks
+            or self.frames_since_keyframe + 1 >= self.keyframe_interval
+        )
+
+        if is_keyframe:
+            self._keyframe(gray)
+        else:
+            self.frames_since_keyframe += 1
+            kept = [track for track in self.tracks if self._follow(gray, track)]
+            # A lost face means something changed; run the full cascade on the next frame
+            if len(kept) < len(self.tracks):
+                self.force_keyframe = True
+            self.tracks = kept
+
+        confidence = 0.9  # Haar Cascade doesn't provide confidence
+        return [t.to_detection(confidence if is_keyframe else min(confidence, t.score)) for t in self.tracks], is_keyframe
+
+
+class SessionStore:
+    """Bounded map of session ID to TrackingSession with idle expiry."""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id, keyframe_interval=None, profile=None):
+        now = time.monotonic()
+        with self._lock:
+            # Drop idle sessions (oldest first)
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if now - oldest.last_used <= self.ttl:
+                    break
+                del self._sessions[oldest_id]
+
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = TrackingSession(keyframe_interval or KEYFRAME_INTERVAL, profile)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                if keyframe_interval:
+                    session.keyframe_interval = keyframe_interval
+                if profile:
+                    session.profile = profile
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def remove(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+
+tracking_sessions = SessionStore()
@@ -1,15 +1,146 @@
 import logging
 import os
+import time
 import uuid
-import cv2
+import types
+import threading
+import importlib
+from urllib.parse import urlparse
+
+class LazyModule(types.ModuleType):
+    """
+    Module placeholder that imports the real module on first attribute access.
+    Keeps heavy dependencies (cv2, numpy, anthropic, cloudinary) off the cold-start path.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        # Copy the real module's namespace so later lookups don't come back here
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+def lazy_import(name):
+    """Return `name` if it's already imported, otherwise a LazyModule for it."""
+    import sys
+    return sys.modules.get(name) or LazyModule(name)
+
+# Vercel/Lambda: frozen between invocations, read-only except /tmp, no disk shared between instances
+SERVERLESS = bool(os.environ.get('VERCEL') or os.environ.get('AWS_LAMBDA_FUNCTION_NAME'))
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+# A lightweight face detection model.
+# CascadeClassifier is not safe to share between threads, so each thread builds its own,
+# on first use rather than at import time.
+FACE_CASCADE_FILE = 'haarcascade_frontalface_default.xml'
+_cascade_local = threading.local()
+
+def get_face_cascade():
+    """Return the calling thread's CascadeClassifier, building it on first use."""
+    cascade = getattr(_cascade_local, 'face_cascade', None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + FACE_CASCADE_FILE)
+        _cascade_local.face_cascade = cascade
+    return cascade
 
-# A lightweight face detection model
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def detect_face_boxes(gray, min_size=(30, 30)):
+    """Run the Haar cascade on a grayscale image and return (x, y, w, h) boxes."""
+    return get_face_cascade().detectMultiScale(
+        gray,
+        scaleFactor=1.1,
+        minNeighbors=5,
+        minSize=min_size
+    )
+
+# Detection profiles trade accuracy for a predictable per-frame cost.
+# Frames are downsampled so their longest side is at most max_side, and the
+# cascade only searches faces between min_face and max_face of the shorter side.
+DETECTION_PROFILES = {
+    'fast': {'max_side': 480, 'scale_factor': 1.2, 'min_neighbors': 4, 'min_face': 0.1, 'max_face': 0.9},
+    'balanced': {'max_side': 640, 'scale_factor': 1.1, 'min_neighbors': 5, 'min_face': 0.05, 'max_face': 1.0},
+    'accurate': {'max_side': 1280, 'scale_factor': 1.05, 'min_neighbors': 5, 'min_face': 0.02, 'max_face': 1.0},
+}
+DEFAULT_DETECTION_PROFILE = os.getenv('DETECTION_PROFILE', 'balanced')
+
+# The frontal face cascade is trained on 24x24 windows; smaller minSize values are meaningless
+CASCADE_WINDOW = 24
+
+def detect_face_boxes_scaled(gray, profile=None, timings=None):
+    """
+    Run the cascade on a downsampled copy of a grayscale frame using a detection profile.
+    Boxes are returned in the coordinates of the original frame. If a `timings`
+    dict is given, the resize and detectMultiScale seconds are added to it.
+    """
+    started = time.perf_counter()
+    settings = DETECTION_PROFILES[profile or DEFAULT_DETECTION_PROFILE]
+    height, width = gray.shape[:2]
+
+    scale = min(1.0, settings['max_side'] / max(height, width))
+    if scale < 1.0:
+        small = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    else:
+        small = gray
+
+    resized = time.perf_counter()
+
+    side = min(small.shape[:2])
+    min_px = max(CASCADE_WINDOW, int(side * settings['min_face']))
+    max_px = max(min_px, int(side * settings['max_face']))
+
+    boxes = get_face_cascade().detectMultiScale(
+        small,
+        scaleFactor=settings['scale_factor'],
+        minNeighbors=settings['min_neighbors'],
+        minSize=(min_px, min_px),
+        maxSize=(max_px, max_px)
+    )
+    if timings is not None:
+        timings['resize'] = resized - started
+        timings['detect_multiscale'] = time.perf_counter() - resized
+    if len(boxes) == 0 or scale == 1.0:
+        return boxes
+    return np.round(np.asarray(boxes) / scale).astype(int)
+
+# Video URL schemes the server opens. video_url comes from the client, so local
+# paths and other schemes (file:, ftp:, ffmpeg protocols) would read server files.
+VIDEO_URL_SCHEMES = ('http', 'https')
+
+def check_video_url(video_url):
+    """Raise ValueError unless video_url is an http(s) URL."""
+    if not video_url or urlparse(video_url).scheme.lower() not in VIDEO_URL_SCHEMES:
+        raise ValueError(f"Only http(s) video URLs can be processed: {video_url}")
+
+def format_detections(faces):
+    """Turn (x, y, w, h) boxes into detection dicts."""
+    detections = []
+    for (x, y, w, h) in faces:
+        detections.append({
+            "id": str(uuid.uuid4())[:8],
+            "x": int(x),
+            "y": int(y),
+            "width": int(w),
+            "height": int(h),
+            "confidence": 0.9,  # Haar Cascade doesn't provide confidence
+            "label": "Face"
+        })
+    return detections
+
+def detect_in_frame(frame, profile=None):
+    """Run the Haar cascade on a decoded frame in the calling process and return detection dicts."""
+    # Convert to grayscale for detection
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    # Detect faces using Haar Cascade
+    return format_detections(detect_face_boxes_scaled(gray, profile))
+
 def get_temp_path():
     temp_dir = os.path.join(os.path.dirname(__file__), "temp")
     os.makedirs(temp_dir, exist_ok=True)
@@ -0,0 +1,110 @@
+import bisect
+from sqlalchemy import and_, or_
+
+INF = float('inf')
+
+
+def normalize_end(end):
+    """end_time of -1 (or any negative value / None) means end of video."""
+    return INF if end is None or end < 0 else end
+
+
+def overlaps(start1, end1, start2, end2):
+    """Same rule as effects.check_overlap, on already-normalized ends."""
+    return max(start1, start2) < min(end1, end2)
+
+
+class IntervalIndex:
+    """
+    Static index over (start, end, item) intervals sorted by start, with a
+    running maximum of ends. Supports overlap checks in O(log n + k) and bulk
+    overlap validation in O(n log n).
+    """
+
+    def __init__(self, intervals=()):
+        entries = sorted(
+            ((float(start), normalize_end(end), item) for start, end, item in intervals),
+            key=lambda entry: entry[0]
+        )
+        self.starts = [entry[0] for entry in entries]
+        self.ends = [entry[1] for entry in entries]
+        self.items = [entry[2] for entry in entries]
+        # max_ends[i] = max(ends[:i + 1]); non-decreasing, so it can be bisected
+        self.max_ends = []
+        running = -INF
+        for end in self.ends:
+            running = max(running, end)
+            self.max_ends.append(running)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _candidates(self, lo_end, hi_start):
+        """Indices whose start is before hi_start and whose running max end passes lo_end."""
+        hi = bisect.bisect_left(self.starts, hi_start)
+        lo = bisect.bisect_right(self.max_ends, lo_end)
+        return range(lo, hi)
+
+    def find_overlap(self, start, end):
+        """Return an item overlapping [start, end) under check_overlap rules, or None."""
+        start, end = float(start), normalize_end(end)
+        for i in self._candidates(start, end):
+            if overlaps(start, end, self.starts[i], self.ends[i]):
+                return self.items[i]
+        return None
+
+    def first_overlap(self):
+        """
+        Sweep-line validation: return the first overlapping (item, item) pair, or None.
+        Zero-length intervals never overlap anything under check_overlap rules.
+        """
+        widest = None
+        for i in range(len(self.starts)):
+            if self.ends[i] <= self.starts[i]:
+                continue
+            if widest is not None and self.starts[i] < self.ends[widest]:
+                return self.items[widest], self.items[i]
+            if widest is None or self.ends[i] > self.ends[widest]:
+                widest = i
+        return None
+
+
+def overlap_filter(model, start, end):
+    """
+    SQL predicate for rows of `model` overlapping [start, end) under
+    check_overlap rules. With an index on (project_id, start_time) the
+    database answers it with a range scan instead of loading every row.
+    """
+    end = normalize_end(end)
+    clauses = [
+        # The stored interval must not be empty ...
+        or_(model.end_time < 0, model.end_time > model.start_time),
+        # ... and must end after the new one starts
+        or_(model.end_time < 0, model.end_time > start),
+    ]
+    if end != INF:
+        clauses.append(model.start_time < end)
+    return and_(*clauses)
+
+
+def preceding_filter(model, end):
+    """
+    SQL predicate for non-empty rows of `model` starting before `end`. Stored
+    effects never overlap each other, so the last such row by start_time is
+    the only one that can overlap an interval ending at `end`: ORDER BY
+    start_time DESC LIMIT 1 is one seek on the (project_id, start_time) index.
+    """
+    end = normalize_end(end)
+    clauses = [or_(model.end_time < 0, model.end_time > model.start_time)]
+    if end != INF:
+        clauses.append(model.start_time < end)
+    return and_(*clauses)
+
+
+def range_filter(model, start, end):
+    """SQL predicate for rows of `model` active at any time in [start, end]."""
+    end = normalize_end(end)
+    clauses = [or_(model.end_time < 0, model.end_time >= start)]
+    if end != INF:
+        clauses.append(model.start_time <= end)
+    return and_(*clauses)
@@ -0,0 +1,374 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, and_
+from api.models import db, Job
+from api.helpers import SERVERLESS
+
+logger = logging.getLogger(__name__)
+
+# Worker threads per process; 0 only enqueues (run the workers elsewhere with `python -m api.jobs`).
+# Serverless functions are frozen between invocations, so they only enqueue by default.
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '0' if SERVERLESS else '3'))
+# Set when a `python -m api.jobs` worker shares this database. Without it (or local workers)
+# nothing would claim a job, so job endpoints return 503 instead of queueing one.
+JOB_EXTERNAL_WORKERS = os.getenv('JOB_EXTERNAL_WORKERS', 'false').lower() in ('1', 'true', 'yes')
+# Seconds an idle worker waits before polling the table again (jobs submitted in-process wake it at once)
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+# A running job whose heartbeat is older than this is assumed lost (its process died) and requeued
+JOB_STALE_SECONDS = float(os.getenv('JOB_STALE_SECONDS', '60'))
+# Runs per job, including ones interrupted by a restart
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# Progress is written to the job row at most this often
+JOB_PROGRESS_INTERVAL = 1.0
+
+# Higher runs first: uploads the user is waiting on ahead of background media work
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+jobs_table = Job.__table__
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler once cancellation of its job was requested."""
+
+
+class JobsUnavailable(RuntimeError):
+    """No worker will run jobs submitted from this process."""
+
+
+class JobContext:
+    """
+    Handed to a handler with its payload: the app, progress reporting and
+    cooperative cancellation. Handlers run inside an app context.
+    """
+
+    def __init__(self, runner, job_id):
+        self.runner = runner
+        self.id = job_id
+        self.app = runner.app
+        self.cancelled = False
+        self._last_write = 0.0
+
+    def progress(self, fraction, message=None):
+        """
+        Record progress (0-1) and refresh the heartbeat; throttled to one write
+        per JOB_PROGRESS_INTERVAL. Raises JobCancelled if the job was cancelled.
+        """
+        now = time.monotonic()
+        if now - self._last_write < JOB_PROGRESS_INTERVAL and fraction < 1:
+            return
+        self._last_write = now
+        values = {"progress": max(0.0, min(1.0, float(fraction))), "heartbeat_at": datetime.utcnow()}
+        if message is not None:
+            values["message"] = str(message)[:255]
+        self._check(values)
+
+    def check_cancelled(self):
+        """Raise JobCancelled if the job was cancelled (one query; for loops without progress)."""
+        self._check({"heartbeat_at": datetime.utcnow()})
+
+    def _check(self, values):
+        # Own connection: the handler's session may be mid-transaction
+        with self.runner.engine.begin() as conn:
+            conn.execute(jobs_table.update().where(jobs_table.c.id == self.id).values(**values))
+            cancel = conn.execute(
+                select(jobs_table.c.cancel_requested).where(jobs_table.c.id == self.id)).scalar()
+        if cancel:
+            self.cancelled = True
+            raise JobCancelled(f"Job {self.id} cancelled")
+
+    def check_row(self, model, row_id):
+        """
+        The run_*_job entry points record failures on their own row instead of
+        raising; fail (or cancel) the job to match.
+        """
+        db.session.expire_all()
+        row = db.session.get(model, row_id)
+        if row is None or row.status != 'failed':
+            return
+        if self.cancelled:
+            raise JobCancelled(f"Job {self.id} cancelled")
+        raise RuntimeError(row.error or f"{model.__tablename__} {row_id} failed")
+
+
+class JobRunner:
+    """
+    Worker threads that run jobs stored in the jobs table. Rows are claimed
+    with a conditional UPDATE, so several processes can share the table;
+    heartbeats let a restarted process requeue jobs a dead one was running.
+    Kinds registered with max_concurrent are throttled per process, so heavy
+    media work can't take every worker.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL, stale_seconds=JOB_STALE_SECONDS,
+                 external=JOB_EXTERNAL_WORKERS):
+        self.workers = workers
+        self.external = external
+        self.poll_interval = poll_interval
+        self.stale_seconds = stale_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers = {}  # kind -> (function, max_concurrent)
+        self.app = None
+        self.engine = None
+        self._cond = threading.Condition()
+        self._running = {}  # kind -> jobs running in this process
+        self._active = set()
+        self._threads = []
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.recovered = 0
+
+    def handler(self, kind, max_concurrent=None):
+        """Decorator registering `function(job, payload)` for `kind`; its return value is stored as JSON."""
+        def register(function):
+            self.handlers[kind] = (function, max_concurrent)
+            return function
+        return register
+
+    @property
+    def live(self):
+        """Whether jobs submitted here are run by this process's workers."""
+        return self.workers > 0
+
+    @property
+    def accepting(self):
+        """Whether a submitted job will run: here, or on a dedicated worker sharing the database."""
+        return self.live or self.external
+
+    def require(self):
+        """Raise JobsUnavailable unless submitted jobs will run. Routes call it before creating job rows."""
+        if not self.accepting:
+            raise JobsUnavailable("Background jobs don't run on this server: start `python -m api.jobs` "
+                                  "against the same database and set JOB_EXTERNAL_WORKERS=1")
+
+    def start(self, app):
+        """Requeue jobs lost by a previous run and start the workers. Safe to call more than once."""
+        if self.app is not None:
+            return
+        with self._cond:
+            if self.app is not None:
+                return
+            self.app = app
+            with app.app_context():
+                self.engine = db.engine
+        if self.workers <= 0:
+            return
+        try:
+            self.recover()
+        except Exception as e:
+            logger.error(f"Error recovering jobs: {e}")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        logger.info(f"Job runner {self.worker_id} started {self.workers} workers")
+
+    def submit(self, kind, payload=None, priority=PRIORITY_NORMAL, app=None, max_attempts=JOB_MAX_ATTEMPTS):
+        """Queue a job and return its id. Committed before returning, so it survives a restart."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        self.require()
+        if self.app is None:
+            from flask import current_app
+            self.start(app or current_app._get_current_object())
+        job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        with self.engine.begin() as conn:
+            conn.execute(jobs_table.insert().values(
+                id=job_id, kind=kind, status='queued', priority=priority, payload=json.dumps(payload or {}),
+                progress=0.0, attempts=0, max_attempts=max_attempts, cancel_requested=False,
+                created_at=now, updated_at=now))
+        with self._cond:
+            self._cond.notify()
+        return job_id
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued job outright, or ask a running one to stop at its next
+        progress report. Returns False if the job already finished.
+        """
+        now = datetime.utcnow()
+        # Called from requests, which may come before the runner starts
+        with (self.engine or db.engine).begin() as conn:
+            queued = conn.execute(jobs_table.update().where(
+                jobs_table.c.id == job_id, jobs_table.c.status == 'queued'
+            ).values(status='cancelled', cancel_requested=True, finished_at=now, updated_at=now))
+            if queued.rowcount:
+                return True
+            running = conn.execute(jobs_table.update().where(
+                jobs_table.c.id == job_id, jobs_table.c.status == 'running'
+            ).values(cancel_requested=True, updated_at=now))
+            return bool(running.rowcount)
+
+    def recover(self):
+        """Requeue running jobs whose heartbeat went stale; fail those out of attempts."""
+        now = datetime.utcnow()
+        stale = and_(jobs_table.c.status == 'running',
+                        jobs_table.c.heartbeat_at < now - timedelta(seconds=self.stale_seconds))
+        with self.engine.begin() as conn:
+            cancelled = conn.execute(jobs_table.update().where(stale, jobs_table.c.cancel_requested == True).values(
+                status='cancelled', worker=None, finished_at=now, updated_at=now)).rowcount
+            requeued = conn.execute(jobs_table.update().where(
+                stale, jobs_table.c.attempts < jobs_table.c.max_attempts
+            ).values(status='queued', worker=None, message='Requeued after its worker stopped', updated_at=now)).rowcount
+            failed = conn.execute(jobs_table.update().where(stale).values(
+                status='failed', worker=None, error='Worker stopped and no attempts are left',
+                finished_at=now, updated_at=now)).rowcount
+        if requeued:
+            with self._cond:
+                self.recovered += requeued
+                self._cond.notify_all()
+        if cancelled or requeued or failed:
+            logger.warning(f"Recovered stale jobs: {requeued} requeued, {failed} failed, {cancelled} cancelled")
+
+    def _claim(self):
+        """Claim the best queued job this process may run. Returns (id, kind) or None."""
+        with self._cond:
+            kinds = [kind for kind, (_, limit) in self.handlers.items()
+                     if limit is None or self._running.get(kind, 0) < limit]
+        if not kinds:
+            return None
+        with self.engine.connect() as conn:
+            candidates = conn.execute(
+                select(jobs_table.c.id, jobs_table.c.kind)
+                .where(jobs_table.c.status == 'queued', jobs_table.c.kind.in_(kinds))
+                .order_by(jobs_table.c.priority.desc(), jobs_table.c.created_at)
+                .limit(self.workers + 1)
+            ).all()
+        for job_id, kind in candidates:
+            limit = self.handlers[kind][1]
+            # Reserve the slot first so two workers can't both take the last one
+            with self._cond:
+                if limit is not None and self._running.get(kind, 0) >= limit:
+                    continue
+                self._running[kind] = self._running.get(kind, 0) + 1
+            now = datetime.utcnow()
+            with self.engine.begin() as conn:
+                claimed = conn.execute(jobs_table.update().where(
+                    jobs_table.c.id == job_id, jobs_table.c.status == 'queued'
+                ).values(status='running', worker=self.worker_id, attempts=jobs_table.c.attempts + 1,
+                         started_at=now, heartbeat_at=now, updated_at=now, error=None)).rowcount
+            if claimed:
+                return job_id, kind
+            with self._cond:
+                self._running[kind] -= 1
+        return None
+
+    def _finish(self, job_id, status, **values):
+        now = datetime.utcnow()
+        with self.engine.begin() as conn:
+            # Skip if the job was recovered and handed to another worker meanwhile
+            conn.execute(jobs_table.update().where(
+                jobs_table.c.id == job_id, jobs_table.c.status == 'running', jobs_table.c.worker == self.worker_id
+            ).values(status=status, finished_at=now, updated_at=now, heartbeat_at=now, **values))
+
+    def _run(self, job_id, kind):
+        function = self.handlers[kind][0]
+        with self._cond:
+            self._active.add(job_id)
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                job = JobContext(self, job_id)
+                try:
+                    with self.engine.connect() as conn:
+                        payload, cancel = conn.execute(
+                            select(jobs_table.c.payload, jobs_table.c.cancel_requested)
+                            .where(jobs_table.c.id == job_id)).one()
+                    if cancel:
+                        raise JobCancelled(f"Job {job_id} cancelled")
+                    result = function(job, json.loads(payload) if payload else {})
+                    self._finish(job_id, 'complete', progress=1.0, result=json.dumps(result))
+                    with self._cond:
+                        self.completed += 1
+                    logger.info(f"Job {job_id} ({kind}) complete in {time.perf_counter() - started:.1f}s")
+                except JobCancelled:
+                    db.session.rollback()
+                    self._finish(job_id, 'cancelled')
+                    with self._cond:
+                        self.cancelled += 1
+                    logger.info(f"Job {job_id} ({kind}) cancelled")
+                except Exception as e:
+                    db.session.rollback()
+                    self._finish(job_id, 'failed', error=str(e))
+                    with self._cond:
+                        self.failed += 1
+                    logger.error(f"Job {job_id} ({kind}) failed: {e}")
+        finally:
+            with self._cond:
+                self._active.discard(job_id)
+                self._running[kind] -= 1
+                # A throttled kind may have a queued job waiting for this slot
+                self._cond.notify_all()
+
+    def _work(self):
+        while True:
+            try:
+                claimed = self._claim()
+            except Exception as e:
+                logger.error(f"Error claiming a job: {e}")
+                claimed = None
+            if claimed is None:
+                with self._cond:
+                    self._cond.wait(self.poll_interval)
+                continue
+            try:
+                self._run(*claimed)
+            except Exception as e:
+                logger.error(f"Error finishing job {claimed[0]}: {e}")
+
+    def _heartbeat(self):
+        """Keep this process's running jobs fresh and requeue jobs other processes lost."""
+        while True:
+            time.sleep(max(1.0, self.stale_seconds / 4))
+            try:
+                with self._cond:
+                    active = list(self._active)
+                if active:
+                    with self.engine.begin() as conn:
+                        conn.execute(jobs_table.update().where(
+                            jobs_table.c.id.in_(active), jobs_table.c.worker == self.worker_id
+                        ).values(heartbeat_at=datetime.utcnow()))
+                self.recover()
+            except Exception as e:
+                logger.error(f"Error updating job heartbeats: {e}")
+
+    def stats(self):
+        with self._cond:
+            return {
+                "worker": self.worker_id,
+                "workers": self.workers,
+                "live": self.live,
+                "accepting": self.accepting,
+                "started": self.app is not None,
+                "running": {kind: count for kind, count in self._running.items() if count},
+                "limits": {kind: limit for kind, (_, limit) in self.handlers.items() if limit is not None},
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "recovered": self.recovered
+            }
+
+
+job_runner = JobRunner()
+
+
+if __name__ == "__main__":
+    # Dedicated worker process (run the web process with JOB_WORKERS=0). Imported by
+    # name: this file runs as __main__, a separate copy of the module.
+    import api.jobs
+    from api.main import app
+    api.jobs.job_runner.start(app)
+    while True:
+        time.sleep(3600)
@@ -1,32 +1,59 @@
 import os
+import time
+
+# Startup-time breakdown, reported in the log and on /startup
+_startup_started = time.perf_counter()
+_startup_mark = _startup_started
+startup_timings = {}
+
+def record_startup(stage):
+    global _startup_mark
+    now = time.perf_counter()
+    startup_timings[stage] = round((now - _startup_mark) * 1000, 2)
+    _startup_mark = now
+
 from dotenv import load_dotenv
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 
 # Load environment variables BEFORE importing modules that use them
 load_dotenv()
+record_startup('dotenv_ms')
 
-import cv2
-import uuid
-import json
 import logging
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response
 from flask_cors import CORS
-from api.helpers import face_cascade
-from api.models import db, Project, Effect
+from api.models import db
+record_startup('flask_sqlalchemy_import_ms')
+
+# Blueprints keep cv2, numpy, anthropic and cloudinary out of their imports; those load on first use
 from api.routes.projects import projects_bp
 from api.routes.effects import effects_bp
 from api.routes.detection import detection_bp
+from api.routes.stream import stream_bp
 from api.routes.upload import upload_bp
 from api.routes.chat import chat_bp
+from api.routes.tracks import tracks_bp
+from api.routes.render import render_bp
+from api.routes.media import media_bp
+from api.routes.frames import frames_bp
+from api.routes.segmentation import segmentation_bp
+from api.routes.jobs import jobs_bp
+from api.schema import ensure_schema
+from api.db_pool import get_pool_mode, select_database_url, engine_options, install_statement_timeout, pool_stats
+from api.decoder_pool import decoder_pool
+from api.metrics import metrics, install_metrics
+from api.jobs import job_runner
+from api.helpers import SERVERLESS
+record_startup('blueprint_import_ms')
 
 app = Flask(__name__)
 
 # Vercel/Lambda environment is read-only except for /tmp
 # We need to set instance_path to /tmp to avoid OSError when Flask-SQLAlchemy tries to create it
-if os.environ.get('VERCEL') or os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+if SERVERLESS:
     app.instance_path = '/tmp'
 
-CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS", "PUT", "DELETE"]}})
+CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS", "PUT", "PATCH", "DELETE"], "expose_headers": ["X-Next-Cursor", "ETag", "X-Frame-Time", "X-Mask-Width", "X-Mask-Height", "X-Mask-Fps", "X-Mask-First", "X-Mask-Count"]}})
 
 def clean_postgres_url(url):
     """Clean Postgres URL by removing unsupported parameters like api_key."""
@@ -54,8 +81,10 @@ def clean_postgres_url(url):
     return cleaned_url
 
 # Database Configuration
-# Try POSTGRES_URL_NON_POOLING first (direct connection), then POSTGRES_URL
-db_url = os.getenv('POSTGRES_URL_NON_POOLING') or os.getenv('POSTGRES_URL') or os.getenv('DATABASE_URL', 'sqlite:///video_editor.db')
+# Queue mode (long-lived servers) tries POSTGRES_URL_NON_POOLING first (direct connection);
+# null mode (serverless / pgbouncer) tries the pooled POSTGRES_URL first
+pool_mode = get_pool_mode()
+db_url = select_database_url(pool_mode)
 
 # Clean the URL to remove unsupported parameters
 if 'postgresql' in db_url or 'postgres' in db_url:
@@ -67,24 +96,100 @@ if db_url.startswith("postgres://"):
 
 app.config['SQLALCHEMY_DATABASE_URI'] = db_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(pool_mode, db_url)
 
 db.init_app(app)
+install_statement_timeout()
+# Request latency per route and SQL query counts/durations, exposed on /metrics
+install_metrics(app)
+record_startup('app_config_ms')
 
 # Register Blueprints
 app.register_blueprint(projects_bp, url_prefix='/projects')
 app.register_blueprint(effects_bp, url_prefix='/projects')
+app.register_blueprint(tracks_bp, url_prefix='/projects')
+app.register_blueprint(render_bp, url_prefix='/projects')
+app.register_blueprint(media_bp, url_prefix='/projects')
+app.register_blueprint(frames_bp, url_prefix='/projects')
+app.register_blueprint(segmentation_bp, url_prefix='/projects')
 app.register_blueprint(detection_bp)
+app.register_blueprint(stream_bp)
 app.register_blueprint(upload_bp)
 app.register_blueprint(chat_bp)
+app.register_blueprint(jobs_bp)
+record_startup('blueprint_register_ms')
 
-# Create tables on startup
-with app.app_context():
-    db.create_all()
+# Spawned pool workers (detection engine, renders, tracks) re-import the script the
+# server was started from as __mp_main__. They never serve requests, so skip the
+# database work there; the job runner only starts on a request anyway.
+pool_worker_import = __name__ == "__mp_main__"
+
+# Create or upgrade tables on startup; skipped after one query when the schema is current
+startup_schema_updated = False
+if not pool_worker_import:
+    with app.app_context():
+        startup_schema_updated = ensure_schema()
+record_startup('schema_ms')
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+startup_timings['total_ms'] = round((time.perf_counter() - _startup_started) * 1000, 2)
+if not pool_worker_import:
+    logger.info(f"Startup timings: {startup_timings}")
+
+@app.before_request
+def start_job_runner():
+    # Started on the first request, not at import, so scripts and spawned pool workers
+    # that import this module don't run jobs. Requeues jobs a previous process lost.
+    job_runner.start(app)
+
+@app.route("/db-pool", methods=["GET"])
+def db_pool_status():
+    try:
+        return jsonify({
+            "mode": pool_mode,
+            "status": db.engine.pool.status(),
+            "stats": pool_stats.to_dict()
+        }), 200
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus text exposition of the request, query, detection and external-call metrics."""
+    try:
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/decoder-pool", methods=["GET"])
+def decoder_pool_status():
+    try:
+        return jsonify(decoder_pool.stats()), 200
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/job-runner", methods=["GET"])
+def job_runner_status():
+    try:
+        return jsonify(job_runner.stats()), 200
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/startup", methods=["GET"])
+def startup():
+    try:
+        return jsonify({"timings": startup_timings, "schema_updated": startup_schema_updated}), 200
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/hello-world", methods=["GET"])
 def hello_world():
     try:
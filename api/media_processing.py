@@ -0,0 +1,393 @@
+import os
+import json
+import time
+import shutil
+import subprocess
+import hashlib
+import logging
+import threading
+import urllib.request
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_
+from sqlalchemy.exc import IntegrityError
+from api.helpers import cv2, np, get_temp_path, check_video_url
+from api.jobs import job_runner, JobCancelled, PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+# Where proxies and sprite sheets are stored, one directory per content hash
+MEDIA_DIR = os.getenv('MEDIA_DIR', os.path.join(os.path.dirname(__file__), 'media'))
+# Height of the low-resolution proxy (sources smaller than this are kept at their size)
+PROXY_HEIGHT = int(os.getenv('PROXY_HEIGHT', '480'))
+# OpenCV's pip builds only encode MPEG-4 Part 2 (mp4v), which browsers don't play, so the
+# proxy is re-encoded to H.264 with ffmpeg when it's installed (CRF: lower is better quality)
+PROXY_FOURCC = 'mp4v'
+PROXY_H264_CRF = int(os.getenv('PROXY_H264_CRF', '28'))
+# Seconds between sprite thumbnails, thumbnail width and sprite sheet layout
+THUMB_INTERVAL = float(os.getenv('THUMB_INTERVAL', '2'))
+THUMB_WIDTH = int(os.getenv('THUMB_WIDTH', '160'))
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+SPRITE_JPEG_QUALITY = 80
+FETCH_BLOCK = 1024 * 1024
+# An artifact left processing without a heartbeat for this long was abandoned by a dead job and is reclaimed
+MEDIA_STALE_SECONDS = float(os.getenv('MEDIA_STALE_SECONDS', '120'))
+# Frames between progress callbacks while generating
+PROGRESS_EVERY = 100
+
+PROXY_FILE = 'proxy.mp4'
+
+
+def media_dir(content_hash):
+    return os.path.join(MEDIA_DIR, content_hash)
+
+
+def proxy_path(content_hash):
+    return os.path.join(media_dir(content_hash), PROXY_FILE)
+
+
+def sprite_path(content_hash, sheet):
+    return os.path.join(media_dir(content_hash), f"sprite_{sheet}.jpg")
+
+
+def fetch_and_hash(video_url):
+    """
+    Return (content_hash, local_path, is_temp). The video is streamed to a temp
+    file while hashing so the content is only downloaded once. Only http(s)
+    URLs are fetched (see check_video_url).
+    """
+    check_video_url(video_url)
+
+    digest = hashlib.blake2b(digest_size=20)
+    path = get_temp_path() + os.path.splitext(video_url.split('?')[0])[1]
+    try:
+        with urllib.request.urlopen(video_url) as response, open(path, 'wb') as out:
+            for block in iter(lambda: response.read(FETCH_BLOCK), b''):
+                digest.update(block)
+                out.write(block)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return digest.hexdigest(), path, True
+
+
+def proxy_size(width, height):
+    """Proxy dimensions: PROXY_HEIGHT tall, same aspect ratio, even sizes for the encoder."""
+    if height <= PROXY_HEIGHT:
+        return width - width % 2, height - height % 2
+    scaled_width = int(round(width * PROXY_HEIGHT / height))
+    return scaled_width - scaled_width % 2, PROXY_HEIGHT
+
+
+class SpriteWriter:
+    """Tiles thumbnails into fixed-size sprite sheets, writing each sheet as soon as it fills up."""
+
+    def __init__(self, out_dir, tile_width, tile_height):
+        self.out_dir = out_dir
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+        self.sheet = None
+        self.sheet_index = 0
+        self.count = 0
+        self.thumbnails = []
+
+    def add(self, t, frame):
+        slot = self.count % self.per_sheet
+        if slot == 0:
+            self.sheet = np.zeros((self.tile_height * SPRITE_ROWS, self.tile_width * SPRITE_COLUMNS, 3), np.uint8)
+        x = (slot % SPRITE_COLUMNS) * self.tile_width
+        y = (slot // SPRITE_COLUMNS) * self.tile_height
+        self.sheet[y:y + self.tile_height, x:x + self.tile_width] = cv2.resize(
+            frame, (self.tile_width, self.tile_height), interpolation=cv2.INTER_AREA
+        )
+        self.thumbnails.append({"t": round(t, 3), "sheet": self.sheet_index, "x": x, "y": y})
+        self.count += 1
+        if self.count % self.per_sheet == 0:
+            self.flush()
+
+    def flush(self):
+        if self.sheet is None:
+            return
+        # Crop unused rows off the last sheet
+        used = self.count - self.sheet_index * self.per_sheet
+        rows = (used + SPRITE_COLUMNS - 1) // SPRITE_COLUMNS
+        cv2.imwrite(os.path.join(self.out_dir, f"sprite_{self.sheet_index}.jpg"),
+                    self.sheet[:rows * self.tile_height], [cv2.IMWRITE_JPEG_QUALITY, SPRITE_JPEG_QUALITY])
+        self.sheet = None
+        self.sheet_index += 1
+
+    def index(self, interval):
+        return {
+            "interval": interval,
+            "tile_width": self.tile_width,
+            "tile_height": self.tile_height,
+            "columns": SPRITE_COLUMNS,
+            "rows": SPRITE_ROWS,
+            "sheets": self.sheet_index,
+            "thumbnails": self.thumbnails
+        }
+
+
+def encode_h264(path):
+    """
+    Re-encode the proxy at `path` to H.264 in place with ffmpeg so browsers can
+    play it. Returns the proxy's codec: 'h264', or 'mp4v' when ffmpeg is
+    missing or fails (the proxy then only serves the server's own decoding).
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        return PROXY_FOURCC
+    temp_path = f"{path}.h264.mp4"
+    try:
+        subprocess.run(
+            [ffmpeg, '-y', '-loglevel', 'error', '-i', path, '-an', '-c:v', 'libx264', '-preset', 'veryfast',
+             '-crf', str(PROXY_H264_CRF), '-pix_fmt', 'yuv420p', '-movflags', '+faststart', temp_path],
+            check=True
+        )
+        os.replace(temp_path, path)
+        return 'h264'
+    except subprocess.CalledProcessError as e:
+        logger.warning(f"ffmpeg H.264 encode failed, keeping the {PROXY_FOURCC} proxy: {e}")
+        return PROXY_FOURCC
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def generate_artifacts(video_path, out_dir, interval=THUMB_INTERVAL, on_progress=None):
+    """
+    Decode the video once, writing the downscaled proxy and sampling a
+    thumbnail every `interval` seconds into sprite sheets.
+    on_progress(frames_done, frame_count) is called every PROGRESS_EVERY frames.
+    Returns the metadata stored on the MediaArtifact row.
+    """
+    cap = cv2.VideoCapture(video_path)
+    writer = None
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        out_width, out_height = proxy_size(width, height)
+
+        writer = cv2.VideoWriter(os.path.join(out_dir, PROXY_FILE), cv2.VideoWriter_fourcc(*PROXY_FOURCC),
+                                 fps, (out_width, out_height))
+        if not writer.isOpened():
+            raise ValueError("Could not open the proxy writer")
+
+        thumb_height = max(2, int(round(THUMB_WIDTH * height / width)))
+        sprites = SpriteWriter(out_dir, THUMB_WIDTH, thumb_height)
+
+        index = 0
+        next_thumb = 0.0
+        while True:
+            ok, frame = cap.read()
+            if not ok or frame is None:
+                break
+            if (frame.shape[1], frame.shape[0]) != (out_width, out_height):
+                small = cv2.resize(frame, (out_width, out_height), interpolation=cv2.INTER_AREA)
+            else:
+                small = frame
+            writer.write(small)
+
+            t = index / fps
+            if t >= next_thumb:
+                # Thumbnails come from the proxy-sized frame; the resize is much cheaper from there
+                sprites.add(t, small)
+                next_thumb += interval
+            index += 1
+            if on_progress and index % PROGRESS_EVERY == 0:
+                on_progress(index, frame_count)
+        sprites.flush()
+
+        if index == 0:
+            raise ValueError(f"No frames could be decoded from {video_path}")
+        writer.release()
+        writer = None
+
+        return {
+            "fps": fps,
+            "frame_count": index,
+            "width": width,
+            "height": height,
+            "proxy_width": out_width,
+            "proxy_height": out_height,
+            "proxy_codec": encode_h264(os.path.join(out_dir, PROXY_FILE)),
+            "sprite_index": sprites.index(interval)
+        }
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
+
+
+def link_project(project, artifact):
+    project.media_hash = artifact.id
+
+
+def media_in_progress(artifact):
+    """Whether a job is generating the artifact: processing, with a heartbeat newer than MEDIA_STALE_SECONDS."""
+    return (artifact.status == 'processing' and artifact.heartbeat_at is not None
+            and artifact.heartbeat_at > datetime.utcnow() - timedelta(seconds=MEDIA_STALE_SECONDS))
+
+
+def claim_artifact(content_hash, video_url):
+    """
+    Mark the artifact as being generated by this job. Returns False if another
+    job holds it; an artifact left processing by a job that died is reclaimed.
+    """
+    from api.models import db, MediaArtifact
+
+    now = datetime.utcnow()
+    if not MediaArtifact.query.get(content_hash):
+        db.session.add(MediaArtifact(id=content_hash, source_url=video_url, status='processing', heartbeat_at=now))
+        try:
+            db.session.commit()
+            return True
+        except IntegrityError:
+            # Another job inserted it first; fall through to the conditional claim
+            db.session.rollback()
+
+    stale = now - timedelta(seconds=MEDIA_STALE_SECONDS)
+    claimed = db.session.execute(
+        update(MediaArtifact)
+        .where(MediaArtifact.id == content_hash,
+               or_(MediaArtifact.status != 'processing', MediaArtifact.heartbeat_at.is_(None),
+                   MediaArtifact.heartbeat_at < stale))
+        .values(status='processing', heartbeat_at=now, source_url=video_url, error=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return bool(claimed)
+
+
+def run_media_job(app, project_id, runner_job=None):
+    """
+    Background entry point: hash the project's video and attach proxy/sprite
+    artifacts to the project, generating them only if no project has
+    produced them for the same content yet.
+    """
+    from api.models import db, Project, MediaArtifact
+
+    with app.app_context():
+        project = Project.query.get(project_id)
+        if not project or not project.video_url:
+            return
+        video_url = project.video_url
+
+        # Same URL already processed: no need to download it again
+        artifact = MediaArtifact.query.filter_by(source_url=video_url, status='complete').first()
+        if artifact and os.path.exists(proxy_path(artifact.id)):
+            link_project(project, artifact)
+            db.session.commit()
+            return
+
+        local_path = None
+        is_temp = False
+        content_hash = None
+        owned = False
+        try:
+            content_hash, local_path, is_temp = fetch_and_hash(video_url)
+
+            artifact = MediaArtifact.query.get(content_hash)
+            if artifact and artifact.status == 'complete' and os.path.exists(proxy_path(content_hash)):
+                # Same content under another URL (a re-upload)
+                artifact.source_url = video_url
+                link_project(project, artifact)
+                db.session.commit()
+                logger.info(f"Project {project_id} reuses media artifacts {content_hash}")
+                return
+
+            owned = claim_artifact(content_hash, video_url)
+            artifact = MediaArtifact.query.populate_existing().get(content_hash)
+            link_project(project, artifact)
+            db.session.commit()
+            if not owned:
+                logger.info(f"Project {project_id} waits for media artifacts {content_hash} from another job")
+                return
+
+            last_beat = time.monotonic()
+
+            def on_progress(done, total):
+                nonlocal last_beat
+                if time.monotonic() - last_beat >= MEDIA_STALE_SECONDS / 4:
+                    artifact.heartbeat_at = datetime.utcnow()
+                    db.session.commit()
+                    last_beat = time.monotonic()
+                if runner_job and total > 0:
+                    runner_job.progress(min(done / total, 1.0))
+
+            # Build into a scratch directory and move it into place when complete
+            scratch = f"{media_dir(content_hash)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            os.makedirs(scratch, exist_ok=True)
+            try:
+                result = generate_artifacts(local_path, scratch, on_progress=on_progress)
+                shutil.rmtree(media_dir(content_hash), ignore_errors=True)
+                os.replace(scratch, media_dir(content_hash))
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+            artifact.fps = result["fps"]
+            artifact.frame_count = result["frame_count"]
+            artifact.width = result["width"]
+            artifact.height = result["height"]
+            artifact.proxy_width = result["proxy_width"]
+            artifact.proxy_height = result["proxy_height"]
+            artifact.proxy_codec = result["proxy_codec"]
+            artifact.sprite_index = json.dumps(result["sprite_index"])
+            artifact.status = 'complete'
+            artifact.heartbeat_at = None
+            db.session.commit()
+            logger.info(f"Media artifacts {content_hash} complete: {result['frame_count']} frames, "
+                        f"{result['sprite_index']['sheets']} sprite sheets")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error processing media for project {project_id}: {e}")
+            if not owned:
+                # Nothing of ours to record it on (e.g. the URL was refused): fail the job instead
+                raise
+            artifact = MediaArtifact.query.get(content_hash)
+            if artifact:
+                artifact.status = 'failed'
+                artifact.error = str(e)
+                artifact.heartbeat_at = None
+                db.session.commit()
+        finally:
+            if is_temp and local_path and os.path.exists(local_path):
+                os.remove(local_path)
+
+
+@job_runner.handler('media', max_concurrent=1)
+def media_handler(job, payload):
+    from api.models import db, Project
+    run_media_job(job.app, payload['project_id'], job)
+    db.session.expire_all()
+    project = db.session.get(Project, payload['project_id'])
+    if project and project.media and project.media.status == 'failed':
+        if job.cancelled:
+            raise JobCancelled(f"Job {job.id} cancelled")
+        raise RuntimeError(project.media.error or f"Media processing failed for project {project.id}")
+    return {'media_hash': project.media_hash if project else None}
+
+
+def start_media_job(app, project_id):
+    """Queue proxy/sprite generation on the job runner (one at a time)."""
+    return job_runner.submit('media', {'project_id': project_id}, PRIORITY_NORMAL, app=app)
+
+
+def get_proxy_source(project):
+    """
+    (path, scale) to scan instead of project.video_url: the proxy when it's ready,
+    with the factor that maps proxy coordinates back to the source. None otherwise.
+    """
+    artifact = project.media
+    if not artifact or artifact.status != 'complete' or not artifact.proxy_width:
+        return None
+    path = proxy_path(artifact.id)
+    if not os.path.exists(path):
+        return None
+    return path, artifact.width / artifact.proxy_width
@@ -0,0 +1,232 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Set METRICS_ENABLED=false to skip the request and query hooks entirely
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Queries slower than this are logged with their statement
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+
+# Histogram buckets in seconds: whole requests, hot-path stages and external calls
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+EXTERNAL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram per label set. Observing is a bisect and a few
+    additions under a lock; the Prometheus text is only built on scrape.
+    """
+
+    def __init__(self, name, help_text, labels=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labels, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._get_or_create(Counter, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=REQUEST_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+request_duration = metrics.histogram(
+    "http_request_duration_seconds", "Request latency by route", ("method", "route", "status"))
+request_queries = metrics.histogram(
+    "http_request_db_queries", "SQL queries issued per request", ("route",), QUERY_COUNT_BUCKETS)
+request_query_time = metrics.histogram(
+    "http_request_db_seconds", "Time spent in SQL queries per request", ("route",), STAGE_BUCKETS)
+query_duration = metrics.histogram(
+    "db_query_duration_seconds", "SQL query latency by statement type", ("operation",), STAGE_BUCKETS)
+slow_queries = metrics.counter(
+    "db_slow_queries_total", f"SQL queries slower than {SLOW_QUERY_MS:g} ms", ("operation",))
+detection_stages = metrics.histogram(
+    "detection_stage_seconds", "Time per face detection stage", ("stage",), STAGE_BUCKETS)
+external_duration = metrics.histogram(
+    "external_call_duration_seconds", "Latency of calls to external services", ("service", "operation"), EXTERNAL_BUCKETS)
+external_errors = metrics.counter(
+    "external_call_errors_total", "Failed calls to external services", ("service", "operation"))
+
+
+def record_stages(timings):
+    """Record a {stage: seconds} dict, e.g. one filled in by a detection worker."""
+    for stage, seconds in timings.items():
+        detection_stages.observe(seconds, stage=stage)
+
+
+def time_stage(stage):
+    """Context manager timing one detection stage."""
+    return detection_stages.time(stage=stage)
+
+
+@contextmanager
+def time_external(service, operation):
+    """Time a call to an external service (LLM, Cloudinary), counting failures."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        external_errors.inc(service=service, operation=operation)
+        raise
+    finally:
+        external_duration.observe(time.perf_counter() - started, service=service, operation=operation)
+
+
+def _route_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else "unmatched"
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+
+
+def _after_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        route = _route_label()
+        request_duration.observe(time.perf_counter() - started,
+                                 method=request.method, route=route, status=response.status_code)
+        request_queries.observe(g.get('db_queries', 0), route=route)
+        request_query_time.observe(g.get('db_seconds', 0.0), route=route)
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    query_duration.observe(seconds, operation=operation)
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_seconds = g.get('db_seconds', 0.0) + seconds
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        slow_queries.inc(operation=operation)
+        logger.warning(f"Slow query ({seconds * 1000:.1f} ms): {' '.join(statement.split())[:500]}")
+
+
+def install_metrics(app):
+    """Time every request and SQL query. A no-op when METRICS_ENABLED is off."""
+    if not METRICS_ENABLED:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
@@ -12,21 +12,49 @@ class Project(db.Model):
     name = db.Column(db.String(100), nullable=False)
     video_url = db.Column(db.String(500), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped by every write to the project or its effects; used as the ETag
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Content hash of the video; points at the shared proxy/sprite artifacts
+    media_hash = db.Column(db.String(64), db.ForeignKey('media_artifacts.id'), nullable=True)
     
     # Relationship
     effects = db.relationship('Effect', backref='project', lazy=True, cascade="all, delete-orphan")
+    detection_track = db.relationship('DetectionTrack', backref='project', uselist=False, cascade="all, delete-orphan")
+    renders = db.relationship('RenderJob', backref='project', lazy=True, cascade="all, delete-orphan")
+    media = db.relationship('MediaArtifact', lazy=True)
+    segmentation = db.relationship('SegmentationMask', backref='project', uselist=False, cascade="all, delete-orphan")
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'video_url': self.video_url,
-            'created_at': self.created_at.isoformat(),
-            'effects': [effect.to_dict() for effect in self.effects]
-        }
+    # Fields that can be requested from to_dict(fields=...)
+    FIELDS = ('id', 'name', 'video_url', 'created_at', 'effects')
+
+    def to_dict(self, fields=None):
+        if fields is None:
+            return {
+                'id': self.id,
+                'name': self.name,
+                'video_url': self.video_url,
+                'created_at': self.created_at.isoformat(),
+                'effects': [effect.to_dict() for effect in self.effects]
+            }
+
+        # Only touch the requested attributes so unloaded columns/relationships stay unloaded
+        result = {}
+        for field in fields:
+            if field == 'created_at':
+                result['created_at'] = self.created_at.isoformat()
+            elif field == 'effects':
+                result['effects'] = [effect.to_dict() for effect in self.effects]
+            else:
+                result[field] = getattr(self, field)
+        return result
 
 class Effect(db.Model):
     __tablename__ = 'effects'
+    __table_args__ = (
+        # Overlap checks and time queries are range scans on start_time within a project
+        db.Index('ix_effects_project_start', 'project_id', 'start_time'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     project_id = db.Column(db.String(36), db.ForeignKey('projects.id'), nullable=False)
@@ -53,3 +81,271 @@ class Effect(db.Model):
             'config': config_dict,
             'created_at': self.created_at.isoformat()
         }
+
+class DetectionTrack(db.Model):
+    __tablename__ = 'detection_tracks'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    project_id = db.Column(db.String(36), db.ForeignKey('projects.id'), nullable=False, unique=True)
+    status = db.Column(db.String(20), nullable=False, default='pending') # pending, processing, complete, failed
+    video_url = db.Column(db.String(500), nullable=True)
+    fps = db.Column(db.Float, nullable=True)
+    interval = db.Column(db.Float, nullable=True) # Seconds between sampled frames
+    frames = db.Column(db.Text, nullable=True) # JSON list of {t, detections}, sorted by t
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def get_frames(self):
+        if not self.frames:
+            return []
+        try:
+            return json.loads(self.frames)
+        except:
+            return []
+
+    def to_dict(self, include_frames=True):
+        result = {
+            'id': self.id,
+            'project_id': self.project_id,
+            'status': self.status,
+            'video_url': self.video_url,
+            'fps': self.fps,
+            'interval': self.interval,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        if include_frames:
+            result['frames'] = self.get_frames()
+        return result
+
+class RenderJob(db.Model):
+    __tablename__ = 'render_jobs'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    project_id = db.Column(db.String(36), db.ForeignKey('projects.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending') # pending, processing, complete, failed
+    video_url = db.Column(db.String(500), nullable=True)
+    frames_done = db.Column(db.Integer, nullable=False, default=0)
+    frames_total = db.Column(db.Integer, nullable=True)
+    fps = db.Column(db.Float, nullable=True) # Render throughput in frames per second
+    output_path = db.Column(db.String(500), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'project_id': self.project_id,
+            'status': self.status,
+            'frames_done': self.frames_done,
+            'frames_total': self.frames_total,
+            'progress': (self.frames_done / self.frames_total) if self.frames_total else 0.0,
+            'fps': self.fps,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class SegmentationMask(db.Model):
+    __tablename__ = 'segmentation_masks'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    project_id = db.Column(db.String(36), db.ForeignKey('projects.id'), nullable=False, unique=True)
+    status = db.Column(db.String(20), nullable=False, default='pending') # pending, processing, complete, failed
+    video_url = db.Column(db.String(500), nullable=True)
+    fps = db.Column(db.Float, nullable=True) # Masks per second of video
+    frame_count = db.Column(db.Integer, nullable=True) # Masks stored
+    width = db.Column(db.Integer, nullable=True) # Mask resolution
+    height = db.Column(db.Integer, nullable=True)
+    frames_done = db.Column(db.Integer, nullable=False, default=0)
+    frames_total = db.Column(db.Integer, nullable=True)
+    path = db.Column(db.String(500), nullable=True) # Packed-bit mask file
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'project_id': self.project_id,
+            'status': self.status,
+            'video_url': self.video_url,
+            'fps': self.fps,
+            'frame_count': self.frame_count,
+            'width': self.width,
+            'height': self.height,
+            'frames_done': self.frames_done,
+            'frames_total': self.frames_total,
+            'progress': (self.frames_done / self.frames_total) if self.frames_total else 0.0,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class MediaArtifact(db.Model):
+    __tablename__ = 'media_artifacts'
+
+    id = db.Column(db.String(64), primary_key=True) # Content hash of the source video
+    source_url = db.Column(db.String(500), nullable=True, index=True) # Last URL the content was fetched from
+    status = db.Column(db.String(20), nullable=False, default='pending') # pending, processing, complete, failed
+    fps = db.Column(db.Float, nullable=True)
+    frame_count = db.Column(db.Integer, nullable=True)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    proxy_width = db.Column(db.Integer, nullable=True)
+    proxy_height = db.Column(db.Integer, nullable=True)
+    proxy_codec = db.Column(db.String(10), nullable=True) # h264 (plays in browsers) or mp4v (no ffmpeg on the server)
+    sprite_index = db.Column(db.Text, nullable=True) # JSON: sprite sheet layout and {t, sheet, x, y} per thumbnail
+    heartbeat_at = db.Column(db.DateTime, nullable=True) # Refreshed while a job generates it; stale means the job died
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def get_sprite_index(self):
+        if not self.sprite_index:
+            return None
+        try:
+            return json.loads(self.sprite_index)
+        except:
+            return None
+
+    def to_dict(self, include_index=True):
+        result = {
+            'hash': self.id,
+            'status': self.status,
+            'fps': self.fps,
+            'frame_count': self.frame_count,
+            'width': self.width,
+            'height': self.height,
+            'proxy_width': self.proxy_width,
+            'proxy_height': self.proxy_height,
+            'proxy_codec': self.proxy_codec,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        if include_index:
+            result['sprites'] = self.get_sprite_index()
+        return result
+
+class UploadSession(db.Model):
+    __tablename__ = 'upload_sessions'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=True)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    total_chunks = db.Column(db.Integer, nullable=False)
+    backend = db.Column(db.String(20), nullable=False) # local, cloudinary
+    status = db.Column(db.String(20), nullable=False, default='pending') # pending, assembling, complete, failed
+    chunks_assembled = db.Column(db.Integer, nullable=False, default=0) # Parts already handed to the backend
+    sending_at = db.Column(db.DateTime, nullable=True) # Set while a request sends part chunks_assembled (cloudinary)
+    url = db.Column(db.String(500), nullable=True)
+    public_id = db.Column(db.String(255), nullable=True)
+    duration = db.Column(db.Float, nullable=True)
+    format = db.Column(db.String(20), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def chunk_length(self, index):
+        """Expected byte length of chunk `index` (the last one may be short)."""
+        if index == self.total_chunks - 1:
+            return self.total_size - self.chunk_size * (self.total_chunks - 1)
+        return self.chunk_size
+
+    def to_dict(self, received=None):
+        result = {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'total_size': self.total_size,
+            'chunk_size': self.chunk_size,
+            'total_chunks': self.total_chunks,
+            'backend': self.backend,
+            'status': self.status,
+            'progress': (self.chunks_assembled / self.total_chunks) if self.total_chunks else 0.0,
+            'url': self.url,
+            'public_id': self.public_id,
+            'duration': self.duration,
+            'format': self.format,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        if received is not None:
+            result['received'] = received
+            result['missing'] = sorted(set(range(self.total_chunks)) - set(received))
+        return result
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Workers claim the highest-priority, oldest queued job
+        db.Index('ix_jobs_status_priority', 'status', 'priority', 'created_at'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = db.Column(db.String(50), nullable=False) # Handler name, e.g. render, track, upload_assembly
+    status = db.Column(db.String(20), nullable=False, default='queued') # queued, running, complete, failed, cancelled
+    priority = db.Column(db.Integer, nullable=False, default=0) # Higher runs first
+    payload = db.Column(db.Text, nullable=True) # JSON arguments for the handler
+    result = db.Column(db.Text, nullable=True) # JSON value returned by the handler
+    progress = db.Column(db.Float, nullable=False, default=0.0)
+    message = db.Column(db.String(255), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3) # Runs interrupted by a restart count too
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    worker = db.Column(db.String(100), nullable=True) # Process running it: host:pid:boot
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def get_payload(self):
+        if not self.payload:
+            return {}
+        try:
+            return json.loads(self.payload)
+        except:
+            return {}
+
+    def get_result(self):
+        if not self.result:
+            return None
+        try:
+            return json.loads(self.result)
+        except:
+            return None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'priority': self.priority,
+            'payload': self.get_payload(),
+            'result': self.get_result(),
+            'progress': self.progress,
+            'message': self.message,
+            'error': self.error,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class SchemaInfo(db.Model):
+    __tablename__ = 'schema_info'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
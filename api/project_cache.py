@@ -0,0 +1,87 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from api.models import db, Project
+
+# Maximum number of serialized projects kept in memory
+PROJECT_CACHE_SIZE = int(os.getenv('PROJECT_CACHE_SIZE', '256'))
+
+
+def make_etag(project_id, version):
+    """Strong ETag for a project version."""
+    return f"{project_id}-{version}"
+
+
+class ProjectCache:
+    """
+    In-process LRU of serialized project payloads keyed by project ID.
+    Each entry remembers the version it was built from, so a payload is only
+    served while the database still reports that version.
+    """
+
+    def __init__(self, max_size=PROJECT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, project_id, version):
+        with self._lock:
+            entry = self._entries.get(project_id)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(project_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, project_id, version, payload):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[project_id] = (version, payload)
+            self._entries.move_to_end(project_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, project_id):
+        with self._lock:
+            self._entries.pop(project_id, None)
+
+
+project_cache = ProjectCache()
+
+
+def get_project_version(project_id):
+    """Current version of a project, or None if it doesn't exist. A single primary-key lookup."""
+    return db.session.query(Project.version).filter(Project.id == project_id).scalar()
+
+
+def get_project_payload(project_id, version):
+    """Serialized project JSON for `version`, built from the database on a cache miss."""
+    payload = project_cache.get(project_id, version)
+    if payload is not None:
+        return payload
+
+    project = Project.query.get(project_id)
+    if not project:
+        return None
+    payload = json.dumps(project.to_dict())
+    project_cache.put(project_id, project.version, payload)
+    return payload
+
+
+def mark_project_changed(project_id):
+    """
+    Bump the project's version inside the current transaction and drop its
+    cached payload. Call before committing any write to a project or its effects.
+    """
+    db.session.execute(
+        db.update(Project)
+        .where(Project.id == project_id)
+        .values(version=Project.version + 1, updated_at=datetime.utcnow())
+    )
+    project_cache.invalidate(project_id)
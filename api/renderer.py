@@ -0,0 +1,282 @@
+import os
+import time
+import shutil
+import logging
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from api.helpers import np, cv2, check_video_url
+from api.jobs import job_runner, PRIORITY_LOW
+
+logger = logging.getLogger(__name__)
+
+# Worker processes used to render segments, and where rendered files are written
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', '0')) or os.cpu_count() or 1
+RENDER_DIR = os.getenv('RENDER_DIR', os.path.join(os.path.dirname(__file__), 'renders'))
+RENDER_FOURCC = 'mp4v'
+
+# Sepia matrix in BGR order (rows produce B, G, R), matching the browser preview
+SEPIA_BGR = (
+    (0.131, 0.534, 0.272),
+    (0.168, 0.686, 0.349),
+    (0.189, 0.769, 0.393),
+)
+_sepia_matrix = None
+
+
+def get_sepia_matrix():
+    global _sepia_matrix
+    if _sepia_matrix is None:
+        _sepia_matrix = np.array(SEPIA_BGR, dtype=np.float32)
+    return _sepia_matrix
+
+
+def apply_effect(frame, effect_type, config=None):
+    """Apply one effect to a whole BGR frame using vectorized OpenCV operations."""
+    if effect_type == 'grayscale':
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+    if effect_type == 'sepia':
+        # cv2.transform saturates to uint8, so no explicit clipping is needed
+        return cv2.transform(frame, get_sepia_matrix())
+    if effect_type == 'invert':
+        return cv2.bitwise_not(frame)
+    if effect_type == 'blur':
+        radius = int((config or {}).get('radius', 10))
+        kernel = max(1, radius) * 2 + 1
+        return cv2.GaussianBlur(frame, (kernel, kernel), 0)
+    # Segmentation (and unknown types) are browser-only for now; leave the frame unchanged
+    return frame
+
+
+def active_effects(effects, t):
+    """Effects whose [start_time, end_time] contains t. end_time < 0 means end of video."""
+    active = []
+    for effect in effects:
+        start = effect.get('start_time') or 0.0
+        end = effect.get('end_time')
+        if end is None or end < 0:
+            end = float('inf')
+        if start <= t <= end:
+            active.append(effect)
+    return active
+
+
+def plan_segments(frame_count, workers):
+    """Split [0, frame_count) into one contiguous segment per worker."""
+    if frame_count <= 0:
+        return []
+    count = min(workers, frame_count)
+    size = (frame_count + count - 1) // count
+    return [(start, min(start + size, frame_count)) for start in range(0, frame_count, size)]
+
+
+# Worker-side shared progress counter and stop flag, set by the pool initializer
+_progress = None
+_stop = None
+
+
+def _init_worker(progress, stop):
+    global _progress, _stop
+    _progress = progress
+    _stop = stop
+    cv2.setNumThreads(1)
+
+
+def render_segment(video_url, start_frame, end_frame, effects, output_path):
+    """Render frames [start_frame, end_frame) of a video with effects into output_path."""
+    cap = cv2.VideoCapture(video_url)
+    writer = None
+    rendered = 0
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_url}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*RENDER_FOURCC), fps, (width, height))
+
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        for index in range(start_frame, end_frame):
+            ok, frame = cap.read()
+            if not ok:
+                break
+            for effect in active_effects(effects, index / fps):
+                frame = apply_effect(frame, effect.get('type'), effect.get('config'))
+            writer.write(frame)
+            rendered += 1
+            # Report in batches to keep lock contention on the shared counter low
+            if _progress is not None and rendered % 10 == 0:
+                with _progress.get_lock():
+                    _progress.value += 10
+                # Set when the render was cancelled or another segment failed
+                if _stop is not None and _stop.value:
+                    break
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
+
+    if _progress is not None and rendered % 10:
+        with _progress.get_lock():
+            _progress.value += rendered % 10
+    return rendered
+
+
+def concat_segments(segment_paths, output_path, fps, size):
+    """
+    Join rendered segments into one file. Uses ffmpeg's concat demuxer (no
+    re-encode) when available, otherwise re-muxes frames through OpenCV.
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg:
+        list_path = output_path + '.txt'
+        with open(list_path, 'w') as f:
+            for path in segment_paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+        try:
+            subprocess.run(
+                [ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', output_path],
+                check=True
+            )
+            return
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"ffmpeg concat failed, falling back to OpenCV: {e}")
+        finally:
+            os.remove(list_path)
+
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*RENDER_FOURCC), fps, size)
+    try:
+        for path in segment_paths:
+            cap = cv2.VideoCapture(path)
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                writer.write(frame)
+            cap.release()
+    finally:
+        writer.release()
+
+
+def render_video(video_url, effects, output_path, on_progress=None):
+    """
+    Render a video with effects across a process pool and write it to output_path.
+    on_progress(frames_done, frames_total, fps) is called periodically from this thread.
+    Returns (frames_done, render_fps).
+    """
+    cap = cv2.VideoCapture(video_url)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_url}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    finally:
+        cap.release()
+
+    segments = plan_segments(frame_count, RENDER_WORKERS)
+    segment_paths = [f"{output_path}.part{i}.mp4" for i in range(len(segments))]
+
+    context = multiprocessing.get_context('spawn')
+    progress = context.Value('q', 0)
+    stop = context.Value('b', 0)
+    started = time.perf_counter()
+
+    def report():
+        if on_progress:
+            elapsed = time.perf_counter() - started
+            done = progress.value
+            on_progress(done, frame_count, done / elapsed if elapsed > 0 else 0.0)
+
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, len(segments)), mp_context=context,
+                                 initializer=_init_worker, initargs=(progress, stop)) as executor:
+            futures = [
+                executor.submit(render_segment, video_url, start, end, effects, path)
+                for (start, end), path in zip(segments, segment_paths)
+            ]
+            pending = set(futures)
+            try:
+                while pending:
+                    done = {f for f in pending if f.done()}
+                    for future in done:
+                        future.result()
+                    pending -= done
+                    report()
+                    if pending:
+                        time.sleep(0.5)
+            except BaseException:
+                # Don't wait for the other segments to finish before raising
+                stop.value = 1
+                raise
+
+        concat_segments(segment_paths, output_path, fps, size)
+    finally:
+        for path in segment_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    elapsed = time.perf_counter() - started
+    frames_done = progress.value
+    return frames_done, frames_done / elapsed if elapsed > 0 else 0.0
+
+
+def run_render_job(app, render_id, runner_job=None):
+    """
+    Background entry point: render the project and keep the RenderJob row up
+    to date (and the runner's job, when given, so it can be cancelled).
+    """
+    from api.models import db, RenderJob
+
+    with app.app_context():
+        job = RenderJob.query.get(render_id)
+        if not job:
+            return
+        try:
+            job.status = 'processing'
+            db.session.commit()
+
+            effects = [e.to_dict() for e in job.project.effects]
+            os.makedirs(RENDER_DIR, exist_ok=True)
+            output_path = os.path.join(RENDER_DIR, f"{render_id}.mp4")
+
+            def on_progress(done, total, fps):
+                job.frames_done = done
+                job.frames_total = total
+                job.fps = fps
+                db.session.commit()
+                if runner_job and total:
+                    runner_job.progress(done / total)
+
+            check_video_url(job.video_url)
+            frames_done, fps = render_video(job.video_url, effects, output_path, on_progress)
+
+            job.frames_done = frames_done
+            job.fps = fps
+            job.output_path = output_path
+            job.status = 'complete'
+            db.session.commit()
+            logger.info(f"Render {render_id} complete: {frames_done} frames at {fps:.1f} fps")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error rendering {render_id}: {e}")
+            job = RenderJob.query.get(render_id)
+            if job:
+                job.status = 'failed'
+                job.error = str(e)
+                db.session.commit()
+
+
+@job_runner.handler('render', max_concurrent=1)
+def render_handler(job, payload):
+    from api.models import RenderJob
+    run_render_job(job.app, payload['render_id'], job)
+    job.check_row(RenderJob, payload['render_id'])
+
+
+def start_render_job(app, render_id):
+    """Queue a render on the job runner (low priority; one at a time, it already uses every core)."""
+    return job_runner.submit('render', {'render_id': render_id}, PRIORITY_LOW, app=app)
@@ -1,19 +1,50 @@
 from flask import Blueprint, request, jsonify
 import os
-import anthropic
 import json
 import logging
+import threading
+from api.helpers import lazy_import
+from api.command_parser import parse_command, CommandParseError
+from api.command_cache import command_cache
+from api.metrics import time_external
+
+# Only loaded when a command actually needs the LLM
+anthropic = lazy_import('anthropic')
 
 chat_bp = Blueprint('chat', __name__)
 logger = logging.getLogger(__name__)
 
+COMMAND_MODEL = "claude-3-haiku-20240307"
+
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+
+
+def get_anthropic_client(api_key):
+    """Reuse one client (and its connection pool) across requests; rebuilt if the key changes."""
+    global _client, _client_key
+    with _client_lock:
+        if _client is None or _client_key != api_key:
+            _client = anthropic.Anthropic(api_key=api_key)
+            _client_key = api_key
+        return _client
+
+
 @chat_bp.route("/command", methods=["POST"])
 def process_command():
     data = request.get_json()
     text = data.get("text")
     duration = data.get("duration", 0)
     current_time = data.get("current_time", 0)
-    
+
+    # Most commands follow a simple grammar; only fall through to the LLM when the parser can't tell
+    try:
+        commands = parse_command(text, current_time, duration)
+        return jsonify({"commands": commands, "source": "parser"}), 200
+    except CommandParseError as e:
+        logger.info(f"Command parser fell back to the LLM: {e}")
+
     api_key = os.getenv("ANTHROPIC_API_KEY")
     if not api_key:
         # Mock response for development if no key is present
@@ -45,9 +76,14 @@ def process_command():
             else:
                 commands.append({"action": "add", "type": "segmentation", "start_time": current_time, "end_time": -1})
         
-        return jsonify({"commands": commands}), 200
+        return jsonify({"commands": commands, "source": "fallback"}), 200
         
-    client = anthropic.Anthropic(api_key=api_key)
+    # Cached results are only valid for the model that produced them
+    cached = command_cache.lookup(text, current_time, duration, namespace=COMMAND_MODEL)
+    if cached is not None:
+        return jsonify({"commands": cached, "source": "cache"}), 200
+
+    client = get_anthropic_client(api_key)
     
     prompt = f"""
     You are a video editing assistant. Extract video effect commands from the user's text.
@@ -85,13 +121,14 @@ def process_command():
     """
     
     try:
-        message = client.messages.create(
-            model="claude-3-haiku-20240307",
-            max_tokens=1024,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
+        with time_external('anthropic', 'messages.create'):
+            message = client.messages.create(
+                model=COMMAND_MODEL,
+                max_tokens=1024,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            )
         
         # Extract JSON from response
         content = message.content[0].text
@@ -103,18 +140,23 @@ def process_command():
             data = json.loads(json_str)
             
             # Normalize response to always have "commands" list
+            commands = None
             if "commands" in data:
-                return jsonify(data), 200
+                commands = data["commands"]
             elif "action" in data:
                 # Single command format backward compatibility
-                return jsonify({"commands": [data]}), 200
+                commands = [data]
             else:
                 # Fallback if LLM returns just the object without "commands" key or "action"
                 # Try to guess if it's a single command object
                 if "type" in data:
                     if "action" not in data:
                         data["action"] = "add"
-                    return jsonify({"commands": [data]}), 200
+                    commands = [data]
+
+            if isinstance(commands, list):
+                command_cache.store(text, current_time, duration, commands, namespace=COMMAND_MODEL)
+                return jsonify({"commands": commands, "source": "llm"}), 200
                 
             return jsonify({"error": "Invalid response format from LLM"}), 400
         else:
@@ -123,4 +165,23 @@ def process_command():
             
     except Exception as e:
         logger.error(f"Error processing chat command: {e}")
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+
+@chat_bp.route("/command/cache", methods=["GET"])
+def get_command_cache_stats():
+    try:
+        return jsonify(command_cache.stats()), 200
+    except Exception as e:
+        logger.error(f"Error getting command cache stats: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@chat_bp.route("/command/cache", methods=["DELETE"])
+def clear_command_cache():
+    try:
+        command_cache.clear()
+        return jsonify({"message": "Command cache cleared"}), 200
+    except Exception as e:
+        logger.error(f"Error clearing command cache: {e}")
+        return jsonify({"error": str(e)}), 500
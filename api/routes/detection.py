@@ -1,61 +1,306 @@
 from flask import Blueprint, request, jsonify
 import logging
 import base64
-import numpy as np
-import cv2
-import uuid
-from api.helpers import face_cascade
+import binascii
+from api.helpers import np, cv2, format_detections, DETECTION_PROFILES, DEFAULT_DETECTION_PROFILE
+from api.detection_cache import detection_cache
+from api.face_tracker import tracking_sessions
+from api.detection_engine import detection_engine, EngineBusy
+from api.metrics import time_stage
+from api.models import Project
+from api.detection_store import detection_store
 
 detection_bp = Blueprint('detection', __name__)
 logger = logging.getLogger(__name__)
 
+# Content types accepted as a raw encoded frame in the request body
+RAW_IMAGE_TYPES = ('image/jpeg', 'image/png', 'application/octet-stream')
+
+
+def read_request_body():
+    """
+    Read the raw request body into a single preallocated buffer.
+    The returned bytearray can be wrapped by np.frombuffer without copying.
+    """
+    length = request.content_length
+    if length is None:
+        return bytearray(request.get_data(cache=False))
+
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    stream = request.stream
+    read = 0
+    while read < length:
+        n = stream.readinto(view[read:])
+        if not n:
+            break
+        read += n
+    return buffer[:read] if read < length else buffer
+
+
+def decode_base64_image(image_data):
+    """Decode a base64 string (optionally a data URL) into encoded image bytes, or None if it isn't valid base64."""
+    if not isinstance(image_data, str):
+        return None
+    # Remove data URL prefix if present
+    comma = image_data.find(",")
+    if comma != -1:
+        image_data = image_data[comma + 1:]
+    with time_stage('base64_decode'):
+        try:
+            return base64.b64decode(image_data)
+        except (binascii.Error, ValueError):
+            return None
+
+
+def decode_frame(buffer):
+    """Decode an encoded JPEG/PNG buffer into a BGR frame, or None if invalid."""
+    if buffer is None or len(buffer) == 0:
+        return None
+    nparr = np.frombuffer(buffer, np.uint8)
+    with time_stage('imdecode'):
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def detect_in_buffer(buffer, profile=None):
+    """
+    Detect faces in an encoded frame, going through the detection cache.
+    Cache hits skip cv2.imdecode entirely. Returns None if the image is invalid.
+    """
+    profile = profile or DEFAULT_DETECTION_PROFILE
+    cached, keys = detection_cache.lookup(buffer, namespace=profile + ":")
+    if cached is not None:
+        return cached
+
+    frame = decode_frame(buffer)
+    if frame is None:
+        return None
+
+    # Detection itself runs in the engine's worker processes
+    detections = format_detections(detection_engine.detect(frame, profile))
+    detection_cache.store(keys, detections)
+    return detections
+
+
+def get_single_frame_buffer():
+    """
+    Extract one encoded frame from the request.
+    Supports a raw image body, a multipart upload ("image" or "frame" field)
+    and the original JSON body with a base64 "image".
+    """
+    mimetype = request.mimetype
+
+    if mimetype in RAW_IMAGE_TYPES:
+        return read_request_body()
+
+    if mimetype == 'multipart/form-data':
+        file = request.files.get('image') or request.files.get('frame')
+        return file.read() if file else None
+
+    data = request.get_json()
+    image_data = data.get("image") if data else None
+    if not image_data:
+        return None
+    return decode_base64_image(image_data)
+
+
+def parse_keyframe_interval(value):
+    """A positive integer keyframe interval, or None when not given. Raises ValueError otherwise."""
+    if value is None or value == "":
+        return None
+    try:
+        interval = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("keyframe_interval must be a positive integer")
+    if interval <= 0 or interval != float(value):
+        raise ValueError("keyframe_interval must be a positive integer")
+    return interval
+
+
+def get_session_params():
+    """
+    Return (session_id, keyframe_interval) for session-aware detection.
+    The session can be given as a query parameter, an X-Session-Id header or a JSON field.
+    Raises ValueError for a keyframe_interval that isn't a positive integer.
+    """
+    session_id = request.args.get("session_id") or request.headers.get("X-Session-Id")
+    keyframe_interval = request.args.get("keyframe_interval")
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        session_id = session_id or data.get("session_id")
+        if keyframe_interval is None:
+            keyframe_interval = data.get("keyframe_interval")
+    return session_id, parse_keyframe_interval(keyframe_interval)
+
+
+def get_store_target():
+    """
+    (project_id, t) when the detections should be kept in the project's
+    detection store: ?project_id= (or X-Project-Id) plus the frame's ?t=
+    (or X-Frame-Time). (None, None) otherwise. Raises LookupError for an unknown project.
+    """
+    project_id = request.args.get("project_id") or request.headers.get("X-Project-Id")
+    t = request.args.get("t", type=float)
+    if t is None and request.headers.get("X-Frame-Time"):
+        t = float(request.headers["X-Frame-Time"])
+    if not project_id or t is None:
+        return None, None
+    if not Project.query.get(project_id):
+        raise LookupError("Project not found")
+    return project_id, t
+
+
+def get_profile():
+    """
+    Return the detection profile requested via ?profile= or a JSON "profile" field.
+    Raises ValueError for unknown profiles.
+    """
+    profile = request.args.get("profile")
+    if not profile and request.is_json:
+        data = request.get_json(silent=True) or {}
+        profile = data.get("profile")
+    if profile and profile not in DETECTION_PROFILES:
+        raise ValueError(f"Unknown profile '{profile}'. Use one of: {', '.join(DETECTION_PROFILES)}")
+    return profile or DEFAULT_DETECTION_PROFILE
+
+
+def get_batch_frame_buffers():
+    """
+    Extract a list of encoded frames from the request.
+    Supports multipart uploads with repeated "frames" fields and JSON bodies
+    with an "images" list of base64 strings.
+    """
+    if request.mimetype == 'multipart/form-data':
+        return [file.read() for file in request.files.getlist('frames')]
+
+    data = request.get_json()
+    images = data.get("images") if data else None
+    if not images:
+        return []
+    return [decode_base64_image(image) if image else None for image in images]
+
+
 @detection_bp.route("/detect-faces", methods=["POST"])
 def detect_faces():
     try:
-        data = request.get_json()
-        image_data = data.get("image")
+        try:
+            profile = get_profile()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        try:
+            project_id, t = get_store_target()
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except ValueError:
+            return jsonify({"error": "X-Frame-Time must be a number"}), 400
 
-        if not image_data:
+        buffer = get_single_frame_buffer()
+
+        if not buffer:
             return jsonify({"error": "No image provided"}), 400
 
-        # Remove data URL prefix if present
-        if "," in image_data:
-            image_data = image_data.split(",")[1]
+        # Session mode: keyframe detection plus tracking, with stable IDs
+        try:
+            session_id, keyframe_interval = get_session_params()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if session_id:
+            frame = decode_frame(buffer)
+            if frame is None:
+                return jsonify({"error": "Invalid image"}), 400
 
-        # Decode base64 to image
-        image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            session = tracking_sessions.get(session_id, keyframe_interval, profile)
+            with session.lock:
+                detections, keyframe = session.process(frame)
+            if project_id:
+                detection_store.append(project_id, t, detections, tracked=True)
 
-        if frame is None:
-            return jsonify({"error": "Invalid image"}), 400
+            return jsonify({"detections": detections, "keyframe": keyframe, "session_id": session_id}), 200
 
-        # Convert to grayscale for detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        # Detect faces using Haar Cascade
-        faces = face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
-        )
-
-        # Format results
-        detections = []
-        for (x, y, w, h) in faces:
-            detections.append({
-                "id": str(uuid.uuid4())[:8],
-                "x": int(x),
-                "y": int(y),
-                "width": int(w),
-                "height": int(h),
-                "confidence": 0.9,  # Haar Cascade doesn't provide confidence
-                "label": "Face"
-            })
+        detections = detect_in_buffer(buffer, profile)
+
+        if detections is None:
+            return jsonify({"error": "Invalid image"}), 400
+        if project_id:
+            detection_store.append(project_id, t, detections)
 
         return jsonify({"detections": detections}), 200
 
+    except EngineBusy as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         logger.error(f"Error in face detection: {e}")
         return jsonify({"error": str(e)}), 500
+
+
+@detection_bp.route("/detect-faces/batch", methods=["POST"])
+def detect_faces_batch():
+    try:
+        try:
+            profile = get_profile()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        buffers = get_batch_frame_buffers()
+
+        if not buffers:
+            return jsonify({"error": "No images provided"}), 400
+
+        # One result per frame, in request order. A bad frame does not fail the batch.
+        results = []
+        for buffer in buffers:
+            detections = detect_in_buffer(buffer, profile) if buffer else None
+            if detections is None:
+                results.append({"error": "Invalid image", "detections": []})
+                continue
+            results.append({"detections": detections})
+
+        return jsonify({"results": results}), 200
+
+    except EngineBusy as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error in batch face detection: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@detection_bp.route("/detect-faces/sessions/<session_id>", methods=["DELETE"])
+def end_detection_session(session_id):
+    try:
+        if not tracking_sessions.remove(session_id):
+            return jsonify({"error": "Session not found"}), 404
+        # The session doesn't know which projects it stored boxes for
+        detection_store.flush_all()
+        return jsonify({"message": "Session ended"}), 200
+    except Exception as e:
+        logger.error(f"Error ending detection session: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@detection_bp.route("/detect-faces/engine", methods=["GET"])
+def get_detection_engine_stats():
+    try:
+        return jsonify(detection_engine.stats()), 200
+    except Exception as e:
+        logger.error(f"Error getting detection engine stats: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@detection_bp.route("/detect-faces/cache", methods=["GET"])
+def get_detection_cache_stats():
+    try:
+        return jsonify(detection_cache.stats()), 200
+    except Exception as e:
+        logger.error(f"Error getting detection cache stats: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@detection_bp.route("/detect-faces/cache", methods=["DELETE"])
+def clear_detection_cache():
+    try:
+        detection_cache.clear()
+        return jsonify({"message": "Detection cache cleared"}), 200
+    except Exception as e:
+        logger.error(f"Error clearing detection cache: {e}")
+        return jsonify({"error": str(e)}), 500
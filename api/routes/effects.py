@@ -1,11 +1,20 @@
 from flask import Blueprint, request, jsonify
 from api.models import db, Project, Effect
+from api.intervals import IntervalIndex, overlap_filter, preceding_filter, range_filter
+from api.project_cache import mark_project_changed
+from api.db_pool import statement_timeout, DB_BULK_STATEMENT_TIMEOUT_MS
+from sqlalchemy import insert, update, delete, or_, true
+from datetime import datetime
+import uuid
 import logging
 import json
 
 effects_bp = Blueprint('effects', __name__)
 logger = logging.getLogger(__name__)
 
+# Overlap predicates combined into one candidate query when validating a PATCH
+OVERLAP_QUERY_CHUNK = 200
+
 def check_overlap(start1, end1, start2, end2):
     """
     Check if two timeframes overlap.
@@ -37,14 +46,17 @@ def add_effect(project_id):
         start_val = float(start_time) if start_time is not None else 0.0
         end_val = float(end_time) if end_time is not None else -1.0
         
-        # Check for overlaps with existing effects
-        existing_effects = Effect.query.filter_by(project_id=project_id).all()
-        for existing in existing_effects:
-            if check_overlap(start_val, end_val, existing.start_time, existing.end_time):
-                return jsonify({
-                    "error": "Effect overlaps with an existing effect",
-                    "existing_effect": existing.to_dict()
-                }), 400
+        # Check for overlaps with existing effects.
+        # Only the last effect starting before the new one ends can overlap it.
+        existing = Effect.query.filter(
+            Effect.project_id == project_id,
+            preceding_filter(Effect, end_val)
+        ).order_by(Effect.start_time.desc()).first()
+        if existing and check_overlap(start_val, end_val, existing.start_time, existing.end_time):
+            return jsonify({
+                "error": "Effect overlaps with an existing effect",
+                "existing_effect": existing.to_dict()
+            }), 400
             
         effect = Effect(
             project_id=project_id,
@@ -55,6 +67,7 @@ def add_effect(project_id):
         )
         
         db.session.add(effect)
+        mark_project_changed(project_id)
         db.session.commit()
         
         # Refresh to get ID and created_at
@@ -65,7 +78,39 @@ def add_effect(project_id):
         logger.error(f"Error adding effect: {e}")
         return jsonify({"error": str(e)}), 500
 
+@effects_bp.route("/<project_id>/effects", methods=["GET"])
+def query_effects(project_id):
+    """
+    List a project's effects ordered by start time.
+    ?t=<seconds> returns the effects active at t; ?from=<a>&to=<b> those active in [a, b].
+    """
+    try:
+        project = Project.query.get(project_id)
+        if not project:
+            return jsonify({"error": "Project not found"}), 404
+
+        t = request.args.get("t", type=float)
+        range_from = request.args.get("from", type=float)
+        range_to = request.args.get("to", type=float)
+
+        query = Effect.query.filter(Effect.project_id == project_id)
+        if t is not None:
+            query = query.filter(range_filter(Effect, t, t))
+        elif range_from is not None or range_to is not None:
+            start = range_from if range_from is not None else 0.0
+            end = range_to if range_to is not None else -1.0
+            if end >= 0 and end < start:
+                return jsonify({"error": "'to' must not be before 'from'"}), 400
+            query = query.filter(range_filter(Effect, start, end))
+
+        effects = query.order_by(Effect.start_time).all()
+        return jsonify([e.to_dict() for e in effects]), 200
+    except Exception as e:
+        logger.error(f"Error querying effects: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @effects_bp.route("/<project_id>/effects", methods=["PUT"])
+@statement_timeout(DB_BULK_STATEMENT_TIMEOUT_MS)
 def update_effects(project_id):
     try:
         project = Project.query.get(project_id)
@@ -75,24 +120,18 @@ def update_effects(project_id):
         data = request.get_json()
         effects_data = data.get("effects", [])
         
-        # Validate overlaps within the new list
-        # We need to check every pair in the new list
-        for i in range(len(effects_data)):
-            for j in range(i + 1, len(effects_data)):
-                eff1 = effects_data[i]
-                eff2 = effects_data[j]
-                
-                s1 = float(eff1.get("start_time", 0.0))
-                e1 = float(eff1.get("end_time", -1.0))
-                s2 = float(eff2.get("start_time", 0.0))
-                e2 = float(eff2.get("end_time", -1.0))
-                
-                if check_overlap(s1, e1, s2, e2):
-                    return jsonify({
-                        "error": "New effects list contains overlapping effects",
-                        "effect1": eff1,
-                        "effect2": eff2
-                    }), 400
+        # Validate overlaps within the new list with a sweep over the sorted intervals
+        index = IntervalIndex(
+            (float(eff.get("start_time", 0.0)), float(eff.get("end_time", -1.0)), eff)
+            for eff in effects_data
+        )
+        overlap = index.first_overlap()
+        if overlap:
+            return jsonify({
+                "error": "New effects list contains overlapping effects",
+                "effect1": overlap[0],
+                "effect2": overlap[1]
+            }), 400
         
         # Clear existing effects
         Effect.query.filter_by(project_id=project_id).delete()
@@ -115,7 +154,8 @@ def update_effects(project_id):
             )
             db.session.add(effect)
             new_effects.append(effect)
-            
+
+        mark_project_changed(project_id)
         db.session.commit()
         
         return jsonify([e.to_dict() for e in new_effects]), 200
@@ -124,6 +164,109 @@ def update_effects(project_id):
         logger.error(f"Error updating effects: {e}")
         return jsonify({"error": str(e)}), 500
 
+@effects_bp.route("/<project_id>/effects", methods=["PATCH"])
+@statement_timeout(DB_BULK_STATEMENT_TIMEOUT_MS)
+def patch_effects(project_id):
+    """
+    Apply an incremental edit to a project's effects in one transaction.
+    Body: {"upsert": [effect, ...], "delete": [effect_id, ...]}
+    Upserts with the ID of an existing effect update only the given fields; the rest are inserted.
+    Returns only the changed rows: {"upserted": [...], "deleted": [...]}.
+    """
+    try:
+        project = Project.query.get(project_id)
+        if not project:
+            return jsonify({"error": "Project not found"}), 404
+
+        data = request.get_json()
+        upserts = data.get("upsert", [])
+        delete_ids = set(data.get("delete", []))
+
+        # Load only the rows this edit touches
+        upsert_ids = {eff["id"] for eff in upserts if eff.get("id")}
+        touched_ids = upsert_ids | delete_ids
+        existing = {}
+        if touched_ids:
+            for effect in Effect.query.filter(Effect.id.in_(touched_ids)).all():
+                if effect.project_id != project_id:
+                    return jsonify({"error": f"Effect {effect.id} belongs to another project"}), 400
+                existing[effect.id] = effect
+
+        now = datetime.utcnow()
+        inserts, updates, final_rows = [], [], []
+        for eff in upserts:
+            current = existing.get(eff.get("id"))
+            if current and current.id in delete_ids:
+                return jsonify({"error": f"Effect {current.id} is both upserted and deleted"}), 400
+
+            start_time = eff.get("start_time", current.start_time if current else None)
+            end_time = eff.get("end_time", current.end_time if current else None)
+            row = {
+                "id": eff.get("id") or str(uuid.uuid4()),
+                "type": eff.get("type", current.type if current else "grayscale"),
+                "start_time": float(start_time) if start_time is not None else 0.0,
+                "end_time": float(end_time) if end_time is not None else -1.0,
+            }
+            if "config" in eff:
+                row["config"] = json.dumps(eff["config"]) if eff["config"] else None
+
+            if current:
+                updates.append(row)
+            else:
+                row["project_id"] = project_id
+                row["created_at"] = now
+                row.setdefault("config", None)
+                inserts.append(row)
+            final_rows.append(row)
+
+        # Overlaps among the upserted rows themselves
+        index = IntervalIndex((row["start_time"], row["end_time"], row) for row in final_rows)
+        overlap = index.first_overlap()
+        if overlap:
+            return jsonify({
+                "error": "Effects overlap",
+                "effect1": overlap[0],
+                "effect2": overlap[1]
+            }), 400
+
+        # Overlaps against untouched rows: ask the database only for rows that could overlap an upsert
+        for i in range(0, len(final_rows), OVERLAP_QUERY_CHUNK):
+            chunk = final_rows[i:i + OVERLAP_QUERY_CHUNK]
+            candidates = Effect.query.filter(
+                Effect.project_id == project_id,
+                Effect.id.notin_(touched_ids) if touched_ids else true(),
+                or_(*[overlap_filter(Effect, row["start_time"], row["end_time"]) for row in chunk])
+            ).all()
+            for candidate in candidates:
+                row = index.find_overlap(candidate.start_time, candidate.end_time)
+                if row:
+                    return jsonify({
+                        "error": "Effect overlaps with an existing effect",
+                        "effect": row,
+                        "existing_effect": candidate.to_dict()
+                    }), 400
+
+        deleted = [effect_id for effect_id in delete_ids if effect_id in existing]
+        if deleted:
+            db.session.execute(delete(Effect).where(Effect.project_id == project_id, Effect.id.in_(deleted)))
+        if inserts:
+            db.session.execute(insert(Effect), inserts)
+        if updates:
+            db.session.execute(update(Effect), updates)
+        mark_project_changed(project_id)
+        db.session.commit()
+
+        changed_ids = [row["id"] for row in final_rows]
+        changed = Effect.query.filter(Effect.id.in_(changed_ids)).all() if changed_ids else []
+        return jsonify({
+            "upserted": [e.to_dict() for e in changed],
+            "deleted": deleted
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error patching effects: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @effects_bp.route("/<project_id>/effects/<effect_id>", methods=["DELETE"])
 def delete_effect(project_id, effect_id):
     try:
@@ -132,6 +275,7 @@ def delete_effect(project_id, effect_id):
             return jsonify({"error": "Effect not found"}), 404
             
         db.session.delete(effect)
+        mark_project_changed(project_id)
         db.session.commit()
         
         return jsonify({"message": "Effect deleted"}), 200
@@ -0,0 +1,77 @@
+from flask import Blueprint, request, jsonify, Response
+from api.models import Project
+from api.helpers import cv2, check_video_url
+from api.decoder_pool import decoder_pool, DecoderPoolExhausted
+from api.media_processing import get_proxy_source
+import logging
+
+frames_bp = Blueprint('frames', __name__)
+logger = logging.getLogger(__name__)
+
+# JPEG quality when ?quality= isn't given, and the largest ?width= accepted
+DEFAULT_JPEG_QUALITY = 85
+MAX_FRAME_WIDTH = 3840
+
+def get_frame_source(project, source):
+    """
+    Video path to decode for ?source=original|proxy|auto (auto prefers the proxy when it's ready).
+    Raises ValueError for a video_url that isn't http(s), before any decoder opens it.
+    """
+    if source not in ('original', 'proxy', 'auto'):
+        raise ValueError("source must be original, proxy or auto")
+    check_video_url(project.video_url)
+    if source != 'original':
+        proxy = get_proxy_source(project)
+        if proxy:
+            return proxy[0]
+        if source == 'proxy':
+            raise LookupError("Proxy is not ready")
+    return project.video_url
+
+@frames_bp.route("/<project_id>/frame", methods=["GET"])
+def get_frame(project_id):
+    """
+    JPEG of the project's video at ?t=<seconds>.
+    Optional ?width= (downscale), ?quality=1-100 and ?source=original|proxy|auto.
+    The decoded frame's exact time is returned in X-Frame-Time.
+    """
+    try:
+        project = Project.query.get(project_id)
+        if not project:
+            return jsonify({"error": "Project not found"}), 404
+        if not project.video_url:
+            return jsonify({"error": "Project has no video"}), 400
+
+        t = request.args.get("t", 0.0, type=float)
+        width = request.args.get("width", type=int)
+        quality = request.args.get("quality", DEFAULT_JPEG_QUALITY, type=int)
+        if t < 0 or (width is not None and not 0 < width <= MAX_FRAME_WIDTH) or not 1 <= quality <= 100:
+            return jsonify({"error": f"t must be >= 0, width between 1 and {MAX_FRAME_WIDTH}, quality 1-100"}), 400
+
+        try:
+            video = get_frame_source(project, request.args.get("source", "auto"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 409
+
+        try:
+            frame, frame_time = decoder_pool.frame_at(video, t)
+        except DecoderPoolExhausted as e:
+            return jsonify({"error": str(e)}), 503
+
+        if width and width < frame.shape[1]:
+            height = max(1, int(round(frame.shape[0] * width / frame.shape[1])))
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            return jsonify({"error": "Could not encode frame"}), 500
+
+        response = Response(encoded.tobytes(), mimetype="image/jpeg")
+        response.headers["X-Frame-Time"] = f"{frame_time:.3f}"
+        response.headers["Cache-Control"] = "private, max-age=300"
+        return response
+    except Exception as e:
+        logger.error(f"Error getting frame: {e}")
+        return jsonify({"error": str(e)}), 500
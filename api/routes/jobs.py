@@ -0,0 +1,62 @@
+from flask import Blueprint, request, jsonify
+from api.models import db, Job
+from api.jobs import job_runner
+import logging
+
+jobs_bp = Blueprint('jobs', __name__)
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'complete', 'failed', 'cancelled')
+
+@jobs_bp.route("/jobs", methods=["GET"])
+def list_jobs():
+    """Recent jobs, newest first. ?status= and ?kind= filter, ?limit= (default 50, at most 200)."""
+    try:
+        status = request.args.get("status")
+        if status and status not in JOB_STATUSES:
+            return jsonify({"error": f"status must be one of {', '.join(JOB_STATUSES)}"}), 400
+        limit = request.args.get("limit", 50, type=int)
+        if limit <= 0:
+            return jsonify({"error": "limit must be positive"}), 400
+
+        query = Job.query
+        if status:
+            query = query.filter(Job.status == status)
+        if request.args.get("kind"):
+            query = query.filter(Job.kind == request.args["kind"])
+        jobs = query.order_by(Job.created_at.desc()).limit(min(limit, 200)).all()
+        return jsonify([job.to_dict() for job in jobs]), 200
+    except Exception as e:
+        logger.error(f"Error listing jobs: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@jobs_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Status, progress (0-1) and, once complete, the handler's result."""
+    try:
+        job = db.session.get(Job, job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job.to_dict()), 200
+    except Exception as e:
+        logger.error(f"Error getting job: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@jobs_bp.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    """
+    Cancel a job. A queued job is cancelled at once (200); a running one stops
+    at its next progress report (202). 409 if it already finished.
+    """
+    try:
+        job = db.session.get(Job, job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        if not job_runner.cancel(job_id):
+            db.session.refresh(job)
+            return jsonify({"error": f"Job is {job.status}", **job.to_dict()}), 409
+        db.session.refresh(job)
+        return jsonify(job.to_dict()), 200 if job.status == 'cancelled' else 202
+    except Exception as e:
+        logger.error(f"Error cancelling job: {e}")
+        return jsonify({"error": str(e)}), 500
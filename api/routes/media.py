@@ -0,0 +1,93 @@
+from flask import Blueprint, jsonify, current_app, send_file
+from api.models import Project
+from api.media_processing import start_media_job, media_in_progress, proxy_path, sprite_path
+from api.helpers import check_video_url
+from api.jobs import job_runner, JobsUnavailable
+import os
+import logging
+
+media_bp = Blueprint('media', __name__)
+logger = logging.getLogger(__name__)
+
+def get_ready_media(project_id):
+    """(artifact, error response) for the project's completed media artifacts."""
+    project = Project.query.get(project_id)
+    if not project:
+        return None, (jsonify({"error": "Project not found"}), 404)
+    if not project.media or project.media.status != 'complete':
+        return None, (jsonify({"error": "Media is not ready"}), 409)
+    return project.media, None
+
+@media_bp.route("/<project_id>/media", methods=["POST"])
+def create_media(project_id):
+    """(Re)generate the proxy and sprite sheets. Artifacts already built for the same content are reused."""
+    try:
+        project = Project.query.get(project_id)
+        if not project:
+            return jsonify({"error": "Project not found"}), 404
+        if not project.video_url:
+            return jsonify({"error": "Project has no video"}), 400
+        try:
+            check_video_url(project.video_url)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            job_runner.require()
+        except JobsUnavailable as e:
+            return jsonify({"error": str(e)}), 503
+        if project.media and media_in_progress(project.media):
+            return jsonify(project.media.to_dict(include_index=False)), 202
+
+        job_id = start_media_job(current_app._get_current_object(), project_id)
+
+        return jsonify({"status": "pending", "job_id": job_id}), 202
+    except Exception as e:
+        logger.error(f"Error starting media processing: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@media_bp.route("/<project_id>/media", methods=["GET"])
+def get_media(project_id):
+    """Proxy/sprite status and the sprite index ({t, sheet, x, y} per thumbnail)."""
+    try:
+        project = Project.query.get(project_id)
+        if not project:
+            return jsonify({"error": "Project not found"}), 404
+        if not project.media:
+            return jsonify({"status": "none"}), 404
+        return jsonify(project.media.to_dict()), 200
+    except Exception as e:
+        logger.error(f"Error getting media: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@media_bp.route("/<project_id>/media/proxy", methods=["GET"])
+def get_media_proxy(project_id):
+    try:
+        artifact, error = get_ready_media(project_id)
+        if error:
+            return error
+        path = proxy_path(artifact.id)
+        if not os.path.exists(path):
+            return jsonify({"error": "Proxy not found"}), 404
+        # Content-addressed, so the file behind this hash never changes
+        response = send_file(path, mimetype="video/mp4", conditional=True, etag=artifact.id)
+        response.headers["Cache-Control"] = "public, max-age=86400"
+        return response
+    except Exception as e:
+        logger.error(f"Error serving proxy: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@media_bp.route("/<project_id>/media/sprites/<int:sheet>", methods=["GET"])
+def get_media_sprite(project_id, sheet):
+    try:
+        artifact, error = get_ready_media(project_id)
+        if error:
+            return error
+        path = sprite_path(artifact.id, sheet)
+        if not os.path.exists(path):
+            return jsonify({"error": "Sprite sheet not found"}), 404
+        response = send_file(path, mimetype="image/jpeg", conditional=True, etag=f"{artifact.id}-{sheet}")
+        response.headers["Cache-Control"] = "public, max-age=86400"
+        return response
+    except Exception as e:
+        logger.error(f"Error serving sprite sheet: {e}")
+        return jsonify({"error": str(e)}), 500
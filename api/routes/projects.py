@@ -1,10 +1,46 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, current_app
 from api.models import db, Project
+from api.media_processing import start_media_job
+from api.jobs import job_runner
+from api.detection_store import detection_store
+from api.db_pool import statement_timeout, DB_BULK_STATEMENT_TIMEOUT_MS
+from api.project_cache import make_etag, get_project_version, get_project_payload, mark_project_changed, project_cache
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload, load_only
+from datetime import datetime
+import base64
 import logging
 
 projects_bp = Blueprint('projects', __name__)
 logger = logging.getLogger(__name__)
 
+# Upper bound for ?limit= on the project listing
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(project):
+    """Opaque keyset cursor pointing just after `project` in (created_at desc, id desc) order."""
+    raw = f"{project.created_at.isoformat()}|{project.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, project_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), project_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def parse_fields(value):
+    """Parse ?fields=a,b,c. Returns None (all fields) when not given; raises ValueError for unknown fields."""
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in Project.FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
 @projects_bp.route("", methods=["POST"])
 def create_project():
     try:
@@ -18,6 +54,10 @@ def create_project():
         project = Project(name=name, video_url=video_url or None)
         db.session.add(project)
         db.session.commit()
+
+        if project.video_url and job_runner.accepting:
+            # Build the proxy and sprite sheets in the background
+            start_media_job(current_app._get_current_object(), project.id)
         
         return jsonify(project.to_dict()), 201
     except Exception as e:
@@ -25,10 +65,52 @@ def create_project():
         return jsonify({"error": str(e)}), 500
 
 @projects_bp.route("", methods=["GET"])
+@statement_timeout(DB_BULK_STATEMENT_TIMEOUT_MS)
 def list_projects():
+    """
+    List projects, newest first.
+    ?fields=id,name,created_at limits the payload (effects are only loaded if requested).
+    ?limit=N pages the results; the X-Next-Cursor response header is passed back as ?cursor=.
+    """
     try:
-        projects = Project.query.order_by(Project.created_at.desc()).all()
-        return jsonify([p.to_dict() for p in projects]), 200
+        try:
+            fields = parse_fields(request.args.get("fields"))
+            limit = request.args.get("limit", type=int)
+            cursor = request.args.get("cursor")
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        query = Project.query.order_by(Project.created_at.desc(), Project.id.desc())
+
+        if fields is None or 'effects' in fields:
+            # One extra query for all effects instead of one per project
+            query = query.options(selectinload(Project.effects))
+        if fields is not None:
+            columns = [getattr(Project, f) for f in fields if f != 'effects']
+            query = query.options(load_only(*columns, Project.id, Project.created_at))
+
+        if after:
+            created_at, project_id = after
+            query = query.filter(or_(
+                Project.created_at < created_at,
+                and_(Project.created_at == created_at, Project.id < project_id)
+            ))
+
+        if limit is not None:
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+            # Fetch one extra row to know whether there is a next page
+            projects = query.limit(limit + 1).all()
+            has_more = len(projects) > limit
+            projects = projects[:limit]
+        else:
+            projects = query.all()
+            has_more = False
+
+        response = jsonify([p.to_dict(fields) for p in projects])
+        if has_more:
+            response.headers['X-Next-Cursor'] = encode_cursor(projects[-1])
+        return response, 200
     except Exception as e:
         logger.error(f"Error listing projects: {e}")
         return jsonify({"error": str(e)}), 500
@@ -36,10 +118,24 @@ def list_projects():
 @projects_bp.route("/<project_id>", methods=["GET"])
 def get_project(project_id):
     try:
-        project = Project.query.get(project_id)
-        if not project:
+        # Only the version is read up front; unchanged projects cost one primary-key lookup
+        version = get_project_version(project_id)
+        if version is None:
             return jsonify({"error": "Project not found"}), 404
-        return jsonify(project.to_dict()), 200
+
+        etag = make_etag(project_id, version)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            payload = get_project_payload(project_id, version)
+            if payload is None:
+                return jsonify({"error": "Project not found"}), 404
+            response = Response(payload, status=200, mimetype="application/json")
+
+        response.set_etag(etag)
+        # Let browsers keep the payload but revalidate it on every use
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         logger.error(f"Error getting project: {e}")
         return jsonify({"error": str(e)}), 500
@@ -52,12 +148,19 @@ def update_project(project_id):
             return jsonify({"error": "Project not found"}), 404
             
         data = request.get_json()
+        video_changed = "video_url" in data and data["video_url"] != project.video_url
         if "name" in data:
             project.name = data["name"]
         if "video_url" in data:
             project.video_url = data["video_url"]
-            
+        if video_changed:
+            project.media_hash = None
+
+        mark_project_changed(project_id)
         db.session.commit()
+
+        if video_changed and project.video_url and job_runner.accepting:
+            start_media_job(current_app._get_current_object(), project_id)
         return jsonify(project.to_dict()), 200
     except Exception as e:
         logger.error(f"Error updating project: {e}")
@@ -72,6 +175,8 @@ def delete_project(project_id):
             
         db.session.delete(project)
         db.session.commit()
+        project_cache.invalidate(project_id)
+        detection_store.delete(project_id)
         return jsonify({"message": "Project deleted"}), 200
     except Exception as e:
         logger.error(f"Error deleting project: {e}")
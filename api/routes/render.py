@@ -0,0 +1,64 @@
+from flask import Blueprint, jsonify, current_app, send_file
+from api.models import db, Project, RenderJob
+from api.renderer import start_render_job
+from api.helpers import check_video_url
+from api.jobs import job_runner, JobsUnavailable
+import os
+import logging
+
+render_bp = Blueprint('render', __name__)
+logger = logging.getLogger(__name__)
+
+@render_bp.route("/<project_id>/render", methods=["POST"])
+def create_render(project_id):
+    try:
+        project = Project.query.get(project_id)
+        if not project:
+            return jsonify({"error": "Project not found"}), 404
+        if not project.video_url:
+            return jsonify({"error": "Project has no video"}), 400
+        try:
+            check_video_url(project.video_url)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            job_runner.require()
+        except JobsUnavailable as e:
+            return jsonify({"error": str(e)}), 503
+
+        job = RenderJob(project_id=project_id, video_url=project.video_url)
+        db.session.add(job)
+        db.session.commit()
+
+        job_id = start_render_job(current_app._get_current_object(), job.id)
+
+        return jsonify({**job.to_dict(), "job_id": job_id}), 202
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error starting render: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@render_bp.route("/<project_id>/render/<render_id>", methods=["GET"])
+def get_render(project_id, render_id):
+    try:
+        job = RenderJob.query.filter_by(id=render_id, project_id=project_id).first()
+        if not job:
+            return jsonify({"error": "Render not found"}), 404
+        return jsonify(job.to_dict()), 200
+    except Exception as e:
+        logger.error(f"Error getting render: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@render_bp.route("/<project_id>/render/<render_id>/download", methods=["GET"])
+def download_render(project_id, render_id):
+    try:
+        job = RenderJob.query.filter_by(id=render_id, project_id=project_id).first()
+        if not job:
+            return jsonify({"error": "Render not found"}), 404
+        if job.status != 'complete' or not job.output_path or not os.path.exists(job.output_path):
+            return jsonify({"error": "Render is not ready"}), 409
+        return send_file(job.output_path, mimetype="video/mp4", as_attachment=True,
+                         download_name=f"{job.project.name}.mp4")
+    except Exception as e:
+        logger.error(f"Error downloading render: {e}")
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,107 @@
+from flask import Blueprint, request, jsonify, current_app, Response
+from api.models import db, Project, SegmentationMask
+from api.segmentation import start_segmentation_job, mask_range, rle_encode
+from api.helpers import check_video_url
+from api.jobs import job_runner, JobsUnavailable
+import os
+import logging
+
+segmentation_bp = Blueprint('segmentation', __name__)
+logger = logging.getLogger(__name__)
+
+@segmentation_bp.route("/<project_id>/segmentation", methods=["POST"])
+def create_segmentation(project_id):
+    """Start computing foreground masks for the project's video (replaces previous masks)."""
+    try:
+        project = Project.query.get(project_id)
+        if not project:
+            return jsonify({"error": "Project not found"}), 404
+        if not project.video_url:
+            return jsonify({"error": "Project has no video"}), 400
+        try:
+            check_video_url(project.video_url)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            job_runner.require()
+        except JobsUnavailable as e:
+            return jsonify({"error": str(e)}), 503
+
+        record = project.segmentation
+        if record and record.status in ('pending', 'processing'):
+            return jsonify(record.to_dict()), 202
+
+        if not record:
+            record = SegmentationMask(project_id=project_id)
+            db.session.add(record)
+        record.status = 'pending'
+        record.video_url = project.video_url
+        record.frames_done = 0
+        record.frames_total = None
+        record.error = None
+        db.session.commit()
+
+        job_id = start_segmentation_job(current_app._get_current_object(), record.id)
+
+        return jsonify({**record.to_dict(), "job_id": job_id}), 202
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error starting segmentation: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@segmentation_bp.route("/<project_id>/segmentation", methods=["GET"])
+def get_segmentation(project_id):
+    try:
+        record = SegmentationMask.query.filter_by(project_id=project_id).first()
+        if not record:
+            return jsonify({"error": "Segmentation not found"}), 404
+        return jsonify(record.to_dict()), 200
+    except Exception as e:
+        logger.error(f"Error getting segmentation: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@segmentation_bp.route("/<project_id>/segmentation/masks", methods=["GET"])
+def get_segmentation_masks(project_id):
+    """
+    Masks covering ?from=&to= seconds (mask i is at i / fps).
+    Default: the packed bitmaps back to back (height rows of ceil(width / 8) bytes,
+    most significant bit first), described by X-Mask-* headers.
+    ?format=rle: JSON run lengths per mask, alternating background/foreground.
+    """
+    try:
+        record = SegmentationMask.query.filter_by(project_id=project_id).first()
+        if not record:
+            return jsonify({"error": "Segmentation not found"}), 404
+        if record.status != 'complete' or not record.path or not os.path.exists(record.path):
+            return jsonify(record.to_dict()), 409
+
+        start = request.args.get("from", 0.0, type=float)
+        end = request.args.get("to", start, type=float)
+        output = request.args.get("format", "bits")
+        if start < 0 or end < start or output not in ('bits', 'rle'):
+            return jsonify({"error": "from must be >= 0, to >= from, format bits or rle"}), 400
+
+        first, masks = mask_range(record, start, end)
+
+        if output == 'rle':
+            return jsonify({
+                "width": record.width,
+                "height": record.height,
+                "fps": record.fps,
+                "masks": [
+                    {"t": round((first + i) / record.fps, 3), "counts": rle_encode(mask, record.width)}
+                    for i, mask in enumerate(masks)
+                ]
+            }), 200
+
+        response = Response(masks.tobytes(), mimetype="application/octet-stream")
+        response.headers["X-Mask-Width"] = str(record.width)
+        response.headers["X-Mask-Height"] = str(record.height)
+        response.headers["X-Mask-Fps"] = f"{record.fps:.6g}"
+        response.headers["X-Mask-First"] = str(first)
+        response.headers["X-Mask-Count"] = str(len(masks))
+        response.headers["Cache-Control"] = "private, max-age=300"
+        return response
+    except Exception as e:
+        logger.error(f"Error getting segmentation masks: {e}")
+        return jsonify({"error": str(e)}), 500
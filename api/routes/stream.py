@@ -0,0 +1,189 @@
+from flask import Blueprint, request, jsonify, Response
+import os
+import json
+import time
+import logging
+from api.detection_stream import detection_streams
+from api.detection_engine import EngineBusy
+from api.face_tracker import tracking_sessions
+from api.detection_store import detection_store
+from api.models import Project
+from api.routes.detection import (
+    get_profile, get_single_frame_buffer, decode_frame, detect_in_buffer, parse_keyframe_interval
+)
+
+stream_bp = Blueprint('stream', __name__)
+logger = logging.getLogger(__name__)
+
+# Seconds between keep-alive comments on an idle event stream
+STREAM_KEEPALIVE = float(os.getenv('DETECTION_STREAM_KEEPALIVE', '15'))
+
+
+def format_event(event, data, event_id=None):
+    lines = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{lines}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def detect_pending(stream, pending):
+    """Run detection for a frame taken from the stream. Returns the event payload; failures go in its "error"."""
+    started = time.monotonic()
+    result = {"seq": pending.seq, "t": pending.t}
+    try:
+        if stream.tracking:
+            frame = decode_frame(pending.buffer)
+            if frame is None:
+                result["error"] = "Invalid image"
+                return result
+            session = tracking_sessions.get(stream.id, stream.keyframe_interval, stream.profile)
+            with session.lock:
+                result["detections"], result["keyframe"] = session.process(frame)
+        else:
+            detections = detect_in_buffer(pending.buffer, stream.profile)
+            if detections is None:
+                result["error"] = "Invalid image"
+                return result
+            result["detections"] = detections
+        if stream.project_id and pending.t is not None:
+            detection_store.append(stream.project_id, pending.t, result["detections"], tracked=stream.tracking)
+    except EngineBusy as e:
+        result["error"] = str(e)
+    except Exception as e:
+        # Report it on this frame's event; ending the generator would drop the client's stream
+        logger.error(f"Error detecting frame {pending.seq} of stream {stream.id}: {e}")
+        result["error"] = str(e)
+    finished = time.monotonic()
+    result["detect_ms"] = round((finished - started) * 1000, 2)
+    # Time from the frame arriving to its result being ready, including any wait behind the previous frame
+    result["latency_ms"] = round((finished - pending.received_at) * 1000, 2)
+    result["dropped"] = stream.dropped
+    return result
+
+
+def event_stream(stream):
+    try:
+        yield format_event("ready", {"stream_id": stream.id})
+        while not stream.closed:
+            pending = stream.take(STREAM_KEEPALIVE)
+            if pending is None:
+                if not stream.closed:
+                    yield ": keep-alive\n\n"
+                continue
+            result = detect_pending(stream, pending)
+            yield format_event("detections", result, pending.seq)
+    finally:
+        # Client disconnected (or the stream was closed); the stream can be subscribed to again
+        stream.unsubscribe()
+        if stream.project_id:
+            detection_store.flush(stream.project_id)
+
+
+@stream_bp.route("/detect-faces/stream", methods=["POST"])
+def create_stream():
+    """
+    Open a detection stream. Body (optional): {profile, tracking, keyframe_interval, project_id}.
+    With a project_id, results for frames pushed with a timestamp are kept in its detection store.
+    Frames are pushed with POST /detect-faces/stream/<id>/frames and results
+    arrive on GET /detect-faces/stream/<id>/events (server-sent events).
+    """
+    try:
+        try:
+            profile = get_profile()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        data = request.get_json(silent=True) or {}
+        project_id = data.get("project_id")
+        if project_id and not Project.query.get(project_id):
+            return jsonify({"error": "Project not found"}), 404
+        try:
+            keyframe_interval = parse_keyframe_interval(data.get("keyframe_interval"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        stream = detection_streams.create(
+            profile,
+            tracking=bool(data.get("tracking")),
+            keyframe_interval=keyframe_interval,
+            project_id=project_id
+        )
+        return jsonify(stream.stats()), 201
+    except Exception as e:
+        logger.error(f"Error creating detection stream: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@stream_bp.route("/detect-faces/stream/<stream_id>/frames", methods=["POST"])
+def push_frame(stream_id):
+    """
+    Push a frame (raw image body, multipart "image" or JSON base64 "image").
+    Its timestamp comes from ?t= or X-Frame-Time, and an optional increasing
+    ?seq= / X-Frame-Seq lets the server discard frames that arrive late.
+    """
+    try:
+        stream = detection_streams.get(stream_id)
+        if not stream:
+            return jsonify({"error": "Stream not found"}), 404
+
+        t = request.args.get("t", type=float)
+        if t is None and request.headers.get("X-Frame-Time"):
+            t = float(request.headers["X-Frame-Time"])
+        seq = request.args.get("seq", type=int)
+        if seq is None and request.headers.get("X-Frame-Seq"):
+            seq = int(request.headers["X-Frame-Seq"])
+
+        buffer = get_single_frame_buffer()
+        if not buffer:
+            return jsonify({"error": "No image provided"}), 400
+
+        seq, accepted, replaced = stream.submit(buffer, t, seq)
+        return jsonify({"seq": seq, "t": t, "accepted": accepted, "replaced": replaced}), 202
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error pushing frame to stream {stream_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@stream_bp.route("/detect-faces/stream/<stream_id>/events", methods=["GET"])
+def stream_events(stream_id):
+    """Server-sent events: one "detections" event per processed frame, carrying its seq and t."""
+    try:
+        stream = detection_streams.get(stream_id)
+        if not stream:
+            return jsonify({"error": "Stream not found"}), 404
+        if not stream.subscribe():
+            return jsonify({"error": "Stream already has a subscriber"}), 409
+
+        response = Response(event_stream(stream), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        # Stop proxies (nginx) from buffering the event stream
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+    except Exception as e:
+        logger.error(f"Error opening event stream {stream_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@stream_bp.route("/detect-faces/stream/<stream_id>", methods=["GET"])
+def get_stream(stream_id):
+    try:
+        stream = detection_streams.get(stream_id)
+        if not stream:
+            return jsonify({"error": "Stream not found"}), 404
+        return jsonify(stream.stats()), 200
+    except Exception as e:
+        logger.error(f"Error getting detection stream: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@stream_bp.route("/detect-faces/stream/<stream_id>", methods=["DELETE"])
+def close_stream(stream_id):
+    try:
+        stream = detection_streams.get(stream_id)
+        if not stream or not detection_streams.remove(stream_id):
+            return jsonify({"error": "Stream not found"}), 404
+        tracking_sessions.remove(stream_id)
+        if stream.project_id:
+            detection_store.flush(stream.project_id)
+        return jsonify({"message": "Stream closed"}), 200
+    except Exception as e:
+        logger.error(f"Error closing detection stream: {e}")
+        return jsonify({"error": str(e)}), 500
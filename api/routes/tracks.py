@@ -0,0 +1,137 @@
+from flask import Blueprint, request, jsonify, current_app
+from api.models import db, Project, DetectionTrack
+from api.video_detection import DEFAULT_INTERVAL, find_sample, start_track_job
+from api.detection_store import detection_store, SOURCES, SOURCE_NAMES, DETECTION_STORE_MAX_ROWS
+from api.helpers import np, check_video_url
+from api.jobs import job_runner, JobsUnavailable
+import logging
+
+tracks_bp = Blueprint('tracks', __name__)
+logger = logging.getLogger(__name__)
+
+@tracks_bp.route("/<project_id>/track", methods=["POST"])
+def create_track(project_id):
+    try:
+        project = Project.query.get(project_id)
+        if not project:
+            return jsonify({"error": "Project not found"}), 404
+        if not project.video_url:
+            return jsonify({"error": "Project has no video"}), 400
+        try:
+            check_video_url(project.video_url)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            job_runner.require()
+        except JobsUnavailable as e:
+            return jsonify({"error": str(e)}), 503
+
+        data = request.get_json(silent=True) or {}
+        interval = float(data.get("interval", DEFAULT_INTERVAL))
+        if interval <= 0:
+            return jsonify({"error": "interval must be positive"}), 400
+
+        track = project.detection_track
+        if track and track.status in ('pending', 'processing'):
+            return jsonify(track.to_dict(include_frames=False)), 202
+
+        # Re-running replaces the previous track for this project
+        if not track:
+            track = DetectionTrack(project_id=project_id)
+            db.session.add(track)
+        track.status = 'pending'
+        track.video_url = project.video_url
+        track.interval = interval
+        track.frames = None
+        track.error = None
+        db.session.commit()
+
+        job_id = start_track_job(current_app._get_current_object(), track.id)
+
+        return jsonify({**track.to_dict(include_frames=False), "job_id": job_id}), 202
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error creating detection track: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@tracks_bp.route("/<project_id>/track", methods=["GET"])
+def get_track(project_id):
+    try:
+        track = DetectionTrack.query.filter_by(project_id=project_id).first()
+        if not track:
+            return jsonify({"error": "Detection track not found"}), 404
+
+        # ?t=<seconds> returns only the faces at that playback time
+        t = request.args.get("t", type=float)
+        if t is not None:
+            if track.status != 'complete':
+                return jsonify(track.to_dict(include_frames=False)), 202
+            sample = find_sample(track.get_frames(), t)
+            return jsonify({
+                "t": sample["t"] if sample else None,
+                "detections": sample["detections"] if sample else []
+            }), 200
+
+        return jsonify(track.to_dict()), 200
+    except Exception as e:
+        logger.error(f"Error getting detection track: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@tracks_bp.route("/<project_id>/detections", methods=["GET"])
+def get_detections(project_id):
+    """
+    Stored face boxes with ?from= <= t <= ?to=, sorted by t, from the track job
+    and from live detection requests (?source=track|live for one of them).
+    ?format=columns returns one array per field instead of one object per box.
+    A truncated page carries next_from and next_skip: pass them back as ?from=
+    and ?skip= (boxes at t == from to skip) for the next page.
+    """
+    try:
+        project = Project.query.get(project_id)
+        if not project:
+            return jsonify({"error": "Project not found"}), 404
+
+        start = request.args.get("from", 0.0, type=float)
+        end = request.args.get("to", float('inf'), type=float)
+        source = request.args.get("source")
+        limit = request.args.get("limit", DETECTION_STORE_MAX_ROWS, type=int)
+        skip = request.args.get("skip", 0, type=int)
+        output = request.args.get("format", "rows")
+        if end < start or skip < 0 or (source and source not in SOURCES) or output not in ('rows', 'columns'):
+            return jsonify({"error": "to must be >= from, skip >= 0, source track or live, "
+                                     "format rows or columns"}), 400
+        limit = max(1, min(limit, DETECTION_STORE_MAX_ROWS))
+
+        columns, truncated = detection_store.query(project_id, start, end, source, limit, skip)
+        track_ids = [f"{v:08x}" if v >= 0 else None for v in columns['track_id'].tolist()]
+        sources = [SOURCE_NAMES[v] for v in columns['source'].tolist()]
+        result = {"count": len(track_ids), "truncated": bool(truncated)}
+        if truncated:
+            # Resume at the last time returned, past the boxes at that time already sent;
+            # a time alone would repeat them forever when more than `limit` share it
+            last = float(columns['t'][-1])
+            at_last = int(np.count_nonzero(columns['t'] == last))
+            result["next_from"] = last
+            result["next_skip"] = skip + at_last if last == start else at_last
+
+        if output == 'columns':
+            result.update({
+                "t": columns['t'].tolist(),
+                "x": columns['x'].tolist(),
+                "y": columns['y'].tolist(),
+                "width": columns['w'].tolist(),
+                "height": columns['h'].tolist(),
+                "track_id": track_ids,
+                "source": sources
+            })
+        else:
+            result["detections"] = [
+                {"t": t, "x": x, "y": y, "width": w, "height": h, "track_id": track_id, "source": box_source}
+                for t, x, y, w, h, track_id, box_source in zip(
+                    columns['t'].tolist(), columns['x'].tolist(), columns['y'].tolist(),
+                    columns['w'].tolist(), columns['h'].tolist(), track_ids, sources)
+            ]
+        return jsonify(result), 200
+    except Exception as e:
+        logger.error(f"Error getting detections: {e}")
+        return jsonify({"error": str(e)}), 500
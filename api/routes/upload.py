@@ -1,40 +1,59 @@
-from flask import Blueprint, request, jsonify
-import cloudinary
-import cloudinary.uploader
+from flask import Blueprint, request, jsonify, current_app, send_file
 import os
+import math
 import logging
+from api.models import db, UploadSession
+from api.metrics import time_external
+from api.jobs import job_runner, JobsUnavailable, PRIORITY_HIGH
+from api.upload_storage import (
+    ChunkError, ChunkOrderError, get_cloudinary_uploader, get_backend_name, get_storage, clamp_chunk_size, start_assembly_job,
+    stage_upload, CLOUDINARY_FOLDER
+)
 
 upload_bp = Blueprint('upload', __name__)
 logger = logging.getLogger(__name__)
 
-# Configure Cloudinary
-# You need to set these environment variables
-cloudinary.config(
-  cloud_name = os.getenv('CLOUDINARY_CLOUD_NAME'),
-  api_key = os.getenv('CLOUDINARY_API_KEY'),
-  api_secret = os.getenv('CLOUDINARY_API_SECRET'),
-  secure = True
-)
+def upload_to_dict(upload, received=None):
+    """to_dict() with the local backend's file path turned into an absolute URL."""
+    result = upload.to_dict(received=received)
+    if result['url'] and result['url'].startswith('/'):
+        result['url'] = request.url_root.rstrip('/') + result['url']
+    return result
 
 @upload_bp.route("/upload", methods=["POST"])
 def upload_video():
+    """
+    Upload a video to Cloudinary and return its URL. With ?async=1 (only when
+    GET /job-runner reports live) the file is staged and sent by the job
+    runner: returns 202 with a job_id, and GET /jobs/<job_id> has the same
+    fields in its result once complete.
+    """
     try:
         if 'video' not in request.files:
             return jsonify({"error": "No video file provided"}), 400
-        
+
         file = request.files['video']
-        
+
         if file.filename == '':
             return jsonify({"error": "No selected file"}), 400
 
+        if request.args.get('async') in ('1', 'true'):
+            # The file is staged on this instance's disk, so only a process that runs jobs can take it
+            if not job_runner.live:
+                return jsonify({"error": "Background jobs don't run on this server; upload without ?async"}), 400
+            path = stage_upload(file)
+            job_id = job_runner.submit('video_upload', {'path': path, 'filename': file.filename}, PRIORITY_HIGH)
+            return jsonify({"job_id": job_id, "status": "queued"}), 202
+
         # Upload to Cloudinary
         # resource_type="video" is important for video files
-        upload_result = cloudinary.uploader.upload(
-            file, 
-            resource_type="video",
-            folder="video-editor-projects"
-        )
-        
+        with time_external('cloudinary', 'upload'):
+            upload_result = get_cloudinary_uploader().upload(
+                file,
+                resource_type="video",
+                folder=CLOUDINARY_FOLDER
+            )
+
         return jsonify({
             "url": upload_result['secure_url'],
             "public_id": upload_result['public_id'],
@@ -45,3 +64,140 @@ def upload_video():
     except Exception as e:
         logger.error(f"Error uploading video: {e}")
         return jsonify({"error": str(e)}), 500
+
+@upload_bp.route("/upload/init", methods=["POST"])
+def init_upload():
+    """Start a chunked upload. Body: {filename, size, chunk_size?, content_type?, backend?}"""
+    try:
+        data = request.get_json() or {}
+        filename = data.get('filename')
+        size = data.get('size')
+        if not filename or not isinstance(size, int) or size <= 0:
+            return jsonify({"error": "filename and a positive integer size are required"}), 400
+
+        try:
+            backend = get_backend_name(data.get('backend'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        chunk_size = clamp_chunk_size(get_storage(backend), data.get('chunk_size'))
+
+        upload = UploadSession(
+            filename=os.path.basename(filename),
+            content_type=data.get('content_type'),
+            total_size=size,
+            chunk_size=chunk_size,
+            total_chunks=math.ceil(size / chunk_size),
+            backend=backend
+        )
+        db.session.add(upload)
+        db.session.commit()
+        return jsonify(upload_to_dict(upload, received=[])), 201
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error starting upload: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@upload_bp.route("/upload/<upload_id>/chunks/<int:index>", methods=["PUT"])
+def put_chunk(upload_id, index):
+    """
+    Store one chunk (raw request body). Re-sending a chunk replaces it, so
+    failed chunks can be retried. The cloudinary backend sends each chunk on
+    as it arrives, so it takes them in order (409 for a chunk ahead of the next one).
+    """
+    try:
+        upload = UploadSession.query.get(upload_id)
+        if not upload:
+            return jsonify({"error": "Upload not found"}), 404
+        if upload.status not in ('pending', 'failed'):
+            return jsonify({"error": f"Upload is {upload.status}"}), 409
+        if index < 0 or index >= upload.total_chunks:
+            return jsonify({"error": f"Chunk index must be between 0 and {upload.total_chunks - 1}"}), 400
+
+        storage = get_storage(upload.backend)
+        try:
+            written = storage.write_chunk(upload, index, request.stream)
+        except ChunkOrderError as e:
+            return jsonify({"error": str(e), **upload_to_dict(upload, received=storage.received_chunks(upload))}), 409
+        except ChunkError as e:
+            return jsonify({"error": str(e)}), 400
+        db.session.commit()
+
+        received = storage.received_chunks(upload)
+        return jsonify({"index": index, "bytes": written, "received": len(received),
+                        "total_chunks": upload.total_chunks}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error storing chunk {index} of upload {upload_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@upload_bp.route("/upload/<upload_id>", methods=["GET"])
+def get_upload(upload_id):
+    """Upload status, with received/missing chunk indices for resuming."""
+    try:
+        upload = UploadSession.query.get(upload_id)
+        if not upload:
+            return jsonify({"error": "Upload not found"}), 404
+        # Chunks are removed once assembled, so received/missing only apply before that
+        received = None if upload.status == 'complete' else get_storage(upload.backend).received_chunks(upload)
+        return jsonify(upload_to_dict(upload, received=received)), 200
+    except Exception as e:
+        logger.error(f"Error getting upload: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@upload_bp.route("/upload/<upload_id>/complete", methods=["POST"])
+def complete_upload(upload_id):
+    """
+    Check every chunk arrived and finish the upload. The cloudinary backend
+    already has the whole video, so it completes at once (200); the local
+    backend assembles in the background (202; poll GET /upload/<id>).
+    """
+    try:
+        upload = UploadSession.query.get(upload_id)
+        if not upload:
+            return jsonify({"error": "Upload not found"}), 404
+        if upload.status in ('assembling', 'complete'):
+            return jsonify(upload_to_dict(upload)), 200 if upload.status == 'complete' else 202
+
+        storage = get_storage(upload.backend)
+        received = storage.received_chunks(upload)
+        if len(received) != upload.total_chunks:
+            return jsonify({"error": "Upload is missing chunks", **upload_to_dict(upload, received=received)}), 409
+
+        if storage.direct:
+            upload.status = 'complete'
+            upload.error = None
+            db.session.commit()
+            logger.info(f"Upload {upload_id} complete: {upload.total_size} bytes in {upload.total_chunks} chunks")
+            return jsonify(upload_to_dict(upload)), 200
+
+        try:
+            job_runner.require()
+        except JobsUnavailable as e:
+            return jsonify({"error": str(e)}), 503
+
+        upload.status = 'assembling'
+        upload.error = None
+        db.session.commit()
+
+        job_id = start_assembly_job(current_app._get_current_object(), upload.id)
+
+        return jsonify({**upload_to_dict(upload), "job_id": job_id}), 202
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error completing upload: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@upload_bp.route("/upload/<upload_id>/file", methods=["GET"])
+def get_upload_file(upload_id):
+    """Serve a video assembled by the local backend."""
+    try:
+        upload = UploadSession.query.get(upload_id)
+        if not upload or upload.backend != 'local':
+            return jsonify({"error": "Upload not found"}), 404
+        path = get_storage(upload.backend).file_path(upload)
+        if upload.status != 'complete' or not os.path.exists(path):
+            return jsonify({"error": "Upload is not ready"}), 409
+        return send_file(path, mimetype=upload.content_type or "video/mp4", conditional=True)
+    except Exception as e:
+        logger.error(f"Error serving upload: {e}")
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,71 @@
+import logging
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from api.models import db, SchemaInfo
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever models.py adds a table, column or index
+SCHEMA_VERSION = 8
+
+
+def get_schema_version():
+    """Version recorded in schema_info, or None if the table doesn't exist yet."""
+    try:
+        return db.session.execute(text("SELECT version FROM schema_info WHERE id = 1")).scalar()
+    except SQLAlchemyError:
+        # Postgres aborts the transaction on a missing table
+        db.session.rollback()
+        return None
+
+
+def column_ddl(column, dialect):
+    """ALTER TABLE ... ADD COLUMN clause for a model column."""
+    ddl = f"{column.name} {column.type.compile(dialect=dialect)}"
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        ddl += f" DEFAULT {default!r}" if isinstance(default, str) else f" DEFAULT {default}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+
+def add_missing_columns_and_indexes():
+    """
+    Bring existing tables up to date with the models: add columns and indexes
+    that create_all won't add to tables that already exist.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    logger.info(f"Adding column {table.name}.{column.name}")
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl(column, engine.dialect)}"))
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
+
+
+def ensure_schema():
+    """
+    Create or upgrade the schema unless schema_info already records SCHEMA_VERSION.
+    On a warm database this is a single one-row query. Returns True if the schema was updated.
+    """
+    if get_schema_version() == SCHEMA_VERSION:
+        return False
+
+    db.create_all()
+    add_missing_columns_and_indexes()
+
+    info = SchemaInfo.query.get(1)
+    if info:
+        info.version = SCHEMA_VERSION
+        info.updated_at = datetime.utcnow()
+    else:
+        db.session.add(SchemaInfo(id=1, version=SCHEMA_VERSION))
+    db.session.commit()
+    logger.info(f"Database schema updated to version {SCHEMA_VERSION}")
+    return True
@@ -0,0 +1,246 @@
+import os
+import logging
+import threading
+from api.helpers import cv2, np, detect_face_boxes_scaled, check_video_url
+from api.video_detection import find_sample
+from api.jobs import job_runner, PRIORITY_LOW
+
+logger = logging.getLogger(__name__)
+
+# Where mask files are written, one per project
+MASK_DIR = os.getenv('SEGMENTATION_DIR', os.path.join(os.path.dirname(__file__), 'masks'))
+# Mask width (the height follows the video's aspect ratio) and masks stored per second of video
+MASK_WIDTH = int(os.getenv('SEGMENTATION_WIDTH', '320'))
+MASK_FPS = float(os.getenv('SEGMENTATION_FPS', '10'))
+# Masks of history the background model learns from
+MOG2_HISTORY = int(os.getenv('SEGMENTATION_HISTORY', '120'))
+# Seconds between face detections when the project has no detection track to reuse
+FACE_INTERVAL = float(os.getenv('SEGMENTATION_FACE_INTERVAL', '0.5'))
+# Most masks returned by one range request
+MAX_RANGE_MASKS = int(os.getenv('SEGMENTATION_MAX_RANGE', '300'))
+# Progress is committed every this many masks
+PROGRESS_EVERY = 50
+# Region below a face where the body is expected, in face widths and heights
+TORSO_WIDTH = 3.0
+TORSO_HEIGHT = 4.0
+
+
+def mask_path(project_id):
+    return os.path.join(MASK_DIR, f"{project_id}.npy")
+
+
+def mask_size(width, height):
+    """Mask dimensions: at most MASK_WIDTH wide, same aspect ratio as the video."""
+    if width <= MASK_WIDTH:
+        return width, height
+    return MASK_WIDTH, max(1, int(round(height * MASK_WIDTH / width)))
+
+
+def person_prior(shape, boxes):
+    """(faces, body) masks: an ellipse over each face and the region its head and torso can occupy."""
+    faces = np.zeros(shape, np.uint8)
+    body = np.zeros(shape, np.uint8)
+    for x, y, w, h in boxes:
+        center = (int(x + w / 2), int(y + h / 2))
+        cv2.ellipse(faces, center, (int(w * 0.6), int(h * 0.8)), 0, 0, 360, 255, -1)
+        cv2.rectangle(body, (int(center[0] - w * TORSO_WIDTH / 2), int(y - h / 2)),
+                      (int(center[0] + w * TORSO_WIDTH / 2), int(y + h * (1 + TORSO_HEIGHT))), 255, -1)
+    return faces, body
+
+
+def refine_mask(foreground, boxes, kernel):
+    """
+    Turn MOG2 output into a clean binary mask. Shadows and speckle are
+    dropped; when faces are known, moving pixels only count inside the body
+    region around a face and the faces themselves are always foreground
+    (a person sitting still fades into the background model otherwise).
+    """
+    # MOG2 marks shadows as 127
+    _, mask = cv2.threshold(foreground, 200, 255, cv2.THRESH_BINARY)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    if len(boxes):
+        faces, body = person_prior(mask.shape, boxes)
+        mask = cv2.bitwise_or(cv2.bitwise_and(mask, body), faces)
+    return cv2.medianBlur(mask, 5)
+
+
+def scale_boxes(detections, scale):
+    return [(d["x"] * scale, d["y"] * scale, d["width"] * scale, d["height"] * scale) for d in detections]
+
+
+def compute_masks(video_path, out_path, box_scale=1.0, track_samples=None, on_progress=None):
+    """
+    Decode the video once and write a packed-bit foreground mask every
+    1/MASK_FPS seconds to a .npy file of shape (masks, height, ceil(width / 8)),
+    which readers open with mmap. Faces come from `track_samples` (a stored
+    detection track in source coordinates, `box_scale` times the decoded
+    frame's) or, without one, from the cascade every FACE_INTERVAL seconds.
+    """
+    cap = cv2.VideoCapture(video_path)
+    masks = None
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if frame_count <= 0 or width <= 0:
+            raise ValueError(f"Could not read the frame count and size of {video_path}")
+
+        out_width, out_height = mask_size(width, height)
+        step = max(1, int(round(fps / MASK_FPS)))
+        capacity = (frame_count + step - 1) // step
+        masks = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.uint8,
+                                          shape=(capacity, out_height, (out_width + 7) // 8))
+
+        subtractor = cv2.createBackgroundSubtractorMOG2(history=MOG2_HISTORY, detectShadows=True)
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        to_mask = out_width / width
+        face_every = max(1, int(round(FACE_INTERVAL * fps / step)))
+        boxes = []
+
+        index = 0
+        count = 0
+        while count < capacity and cap.grab():
+            index += 1
+            if (index - 1) % step:
+                continue
+            ok, frame = cap.retrieve()
+            if not ok or frame is None:
+                continue
+            t = (index - 1) / fps
+
+            if track_samples is not None:
+                sample = find_sample(track_samples, t)
+                boxes = scale_boxes(sample["detections"], to_mask / box_scale) if sample else []
+            elif count % face_every == 0:
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                boxes = [tuple(v * to_mask for v in box) for box in detect_face_boxes_scaled(gray, 'fast')]
+
+            if (out_width, out_height) != (width, height):
+                frame = cv2.resize(frame, (out_width, out_height), interpolation=cv2.INTER_AREA)
+            mask = refine_mask(subtractor.apply(frame), boxes, kernel)
+            masks[count] = np.packbits(mask > 127, axis=1)
+            count += 1
+            if on_progress and count % PROGRESS_EVERY == 0:
+                on_progress(count, capacity)
+
+        masks.flush()
+        if count == 0:
+            raise ValueError(f"No frames could be decoded from {video_path}")
+        return {
+            "fps": fps / step,
+            "frame_count": count,
+            "width": out_width,
+            "height": out_height,
+            "frames_total": capacity
+        }
+    finally:
+        cap.release()
+        # Drop the memmap so the file is closed before it is moved into place
+        del masks
+
+
+def mask_range(record, start, end):
+    """
+    (first index, packed masks) covering [start, end] seconds, at most
+    MAX_RANGE_MASKS of them. Only the requested rows are read from the file.
+    """
+    masks = np.load(record.path, mmap_mode='r')
+    first = max(0, int(start * record.fps))
+    last = min(record.frame_count - 1, int(end * record.fps), first + MAX_RANGE_MASKS - 1)
+    if first > last:
+        return first, masks[0:0]
+    return first, masks[first:last + 1]
+
+
+def rle_encode(packed, width):
+    """
+    Run lengths of one packed mask in row-major order, alternating background
+    and foreground and starting with background (0 first if it starts in the foreground).
+    """
+    bits = np.unpackbits(packed, axis=1)[:, :width].ravel()
+    changes = np.flatnonzero(np.diff(bits)) + 1
+    runs = np.diff(np.concatenate(([0], changes, [bits.size])))
+    if bits.size and bits[0]:
+        runs = np.concatenate(([0], runs))
+    return runs.tolist()
+
+
+def run_segmentation_job(app, mask_id, runner_job=None):
+    """
+    Background entry point: compute the project's masks and record them on the
+    SegmentationMask row (and progress on the runner's job, when given).
+    """
+    from api.models import db, SegmentationMask
+    from api.media_processing import get_proxy_source
+
+    with app.app_context():
+        record = SegmentationMask.query.get(mask_id)
+        if not record:
+            return
+        scratch = None
+        try:
+            record.status = 'processing'
+            db.session.commit()
+
+            project = record.project
+            check_video_url(record.video_url)
+            # Decode the low-resolution proxy when one exists for the same video
+            video_url, scale = record.video_url, 1.0
+            if project.video_url == record.video_url:
+                video_url, scale = get_proxy_source(project) or (video_url, scale)
+
+            # Reuse a finished detection track for the face boxes instead of running the cascade again
+            track = project.detection_track
+            samples = track.get_frames() if track and track.status == 'complete' and track.video_url == record.video_url else None
+
+            def on_progress(done, total):
+                record.frames_done = done
+                record.frames_total = total
+                db.session.commit()
+                if runner_job:
+                    runner_job.progress(done / total)
+
+            os.makedirs(MASK_DIR, exist_ok=True)
+            scratch = f"{mask_path(project.id)}.{threading.get_ident()}.tmp.npy"
+            result = compute_masks(video_url, scratch, scale, samples, on_progress)
+            os.replace(scratch, mask_path(project.id))
+
+            record.path = mask_path(project.id)
+            record.fps = result["fps"]
+            record.frame_count = result["frame_count"]
+            record.width = result["width"]
+            record.height = result["height"]
+            record.frames_done = result["frame_count"]
+            record.frames_total = result["frame_count"]
+            record.status = 'complete'
+            record.error = None
+            db.session.commit()
+            logger.info(f"Segmentation masks {mask_id} complete: {result['frame_count']} masks "
+                        f"at {result['width']}x{result['height']}")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error computing segmentation masks {mask_id}: {e}")
+            record = SegmentationMask.query.get(mask_id)
+            if record:
+                record.status = 'failed'
+                record.error = str(e)
+                db.session.commit()
+        finally:
+            if scratch and os.path.exists(scratch):
+                os.remove(scratch)
+
+
+@job_runner.handler('segmentation', max_concurrent=1)
+def segmentation_handler(job, payload):
+    from api.models import SegmentationMask
+    run_segmentation_job(job.app, payload['mask_id'], job)
+    job.check_row(SegmentationMask, payload['mask_id'])
+
+
+def start_segmentation_job(app, mask_id):
+    """Queue a segmentation job on the job runner (low priority, one at a time)."""
+    return job_runner.submit('segmentation', {'mask_id': mask_id}, PRIORITY_LOW, app=app)
@@ -0,0 +1,343 @@
+import io
+import os
+import uuid
+import shutil
+import logging
+import threading
+from datetime import datetime, timedelta
+from api.metrics import time_external
+from api.helpers import SERVERLESS
+from api.jobs import job_runner, PRIORITY_HIGH
+
+logger = logging.getLogger(__name__)
+
+# Where chunks are staged (and where the local backend keeps assembled files)
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', os.path.join(os.path.dirname(__file__), 'uploads'))
+# Storage backend for chunked uploads: local, cloudinary, or auto (cloudinary when configured).
+# Chunked uploads are refused on serverless deployments (see get_backend_name).
+UPLOAD_BACKEND = os.getenv('UPLOAD_BACKEND', 'auto')
+# Default and maximum chunk size. Each backend sets its own minimum.
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_MAX_CHUNK_SIZE = int(os.getenv('UPLOAD_MAX_CHUNK_SIZE', str(64 * 1024 * 1024)))
+# Bytes read from the request stream at a time, so memory per chunk stays bounded
+UPLOAD_READ_BLOCK = 1024 * 1024
+# Attempts per part when sending a chunk on to Cloudinary
+UPLOAD_PART_RETRIES = int(os.getenv('UPLOAD_PART_RETRIES', '3'))
+# A chunk claimed for sending this long ago was abandoned (its request died) and can be claimed again
+UPLOAD_SEND_STALE_SECONDS = float(os.getenv('UPLOAD_SEND_STALE_SECONDS', '300'))
+CLOUDINARY_FOLDER = "video-editor-projects"
+
+# Cloudinary is imported and configured on the first upload, not at startup
+_cloudinary_lock = threading.Lock()
+_cloudinary_uploader = None
+
+
+class ChunkError(ValueError):
+    """The chunk body doesn't match what the upload session expects."""
+
+
+class ChunkOrderError(ChunkError):
+    """The backend takes chunks in order and this one isn't next, or another request is sending it."""
+
+
+def copy_chunk(upload, index, stream, out):
+    """
+    Copy chunk `index` from the request stream to `out` in bounded blocks,
+    checking it has exactly the expected length. Returns the bytes written.
+    """
+    expected = upload.chunk_length(index)
+    written = 0
+    while True:
+        block = stream.read(min(UPLOAD_READ_BLOCK, expected - written + 1))
+        if not block:
+            break
+        written += len(block)
+        if written > expected:
+            raise ChunkError(f"Chunk {index} is larger than {expected} bytes")
+        out.write(block)
+    if written != expected:
+        raise ChunkError(f"Chunk {index} has {written} bytes, expected {expected}")
+    return written
+
+
+def get_cloudinary_uploader():
+    """Import and configure Cloudinary on first use."""
+    global _cloudinary_uploader
+    with _cloudinary_lock:
+        if _cloudinary_uploader is None:
+            import cloudinary.uploader
+
+            # Configure Cloudinary
+            # You need to set these environment variables
+            cloudinary.config(
+              cloud_name = os.getenv('CLOUDINARY_CLOUD_NAME'),
+              api_key = os.getenv('CLOUDINARY_API_KEY'),
+              api_secret = os.getenv('CLOUDINARY_API_SECRET'),
+              secure = True
+            )
+            _cloudinary_uploader = cloudinary.uploader
+        return _cloudinary_uploader
+
+
+class LocalDiskStorage:
+    """
+    Stages chunks as numbered part files and assembles them into one file on
+    local disk. Used for development and tests; the file is served by
+    GET /upload/<id>/file.
+    """
+
+    name = 'local'
+    min_chunk_size = 64 * 1024
+    # Chunks go through /complete and an assembly job
+    direct = False
+
+    def __init__(self, root=UPLOAD_DIR):
+        self.root = root
+
+    def chunk_dir(self, upload_id):
+        return os.path.join(self.root, 'chunks', upload_id)
+
+    def chunk_path(self, upload_id, index):
+        return os.path.join(self.chunk_dir(upload_id), f"{index:06d}.part")
+
+    def file_path(self, upload):
+        return os.path.join(self.root, 'files', upload.id, os.path.basename(upload.filename))
+
+    def write_chunk(self, upload, index, stream):
+        """
+        Copy one chunk from the request stream to disk in bounded blocks.
+        The part only appears under its final name once it is complete, so a
+        failed or interrupted chunk can simply be sent again.
+        """
+        os.makedirs(self.chunk_dir(upload.id), exist_ok=True)
+        final_path = self.chunk_path(upload.id, index)
+        temp_path = f"{final_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                written = copy_chunk(upload, index, stream, f)
+            os.replace(temp_path, final_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return written
+
+    def received_chunks(self, upload):
+        try:
+            names = os.listdir(self.chunk_dir(upload.id))
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-5]) for name in names if name.endswith('.part'))
+
+    def assemble(self, upload, on_progress):
+        """Concatenate the parts into the final file. Returns the upload result fields."""
+        path = self.file_path(upload)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as out:
+            for index in range(upload.total_chunks):
+                with open(self.chunk_path(upload.id, index), 'rb') as part:
+                    shutil.copyfileobj(part, out, UPLOAD_READ_BLOCK)
+                on_progress(index + 1)
+        return {
+            "url": f"/upload/{upload.id}/file",
+            "public_id": upload.id,
+            "duration": None,
+            "format": os.path.splitext(upload.filename)[1].lstrip('.').lower() or None
+        }
+
+    def cleanup(self, upload):
+        shutil.rmtree(self.chunk_dir(upload.id), ignore_errors=True)
+
+
+class CloudinaryStorage:
+    """
+    Sends each chunk straight to Cloudinary's chunked large upload as it
+    arrives (Content-Range plus X-Unique-Upload-Id, and the public_id from the
+    first part's response on every later part). Nothing is staged locally, so
+    any instance can take the next chunk. Parts must arrive in order: the
+    session's chunks_assembled is the next index Cloudinary expects, and a
+    request claims it (sending_at) before sending so retries racing each
+    other send it once.
+    """
+
+    name = 'cloudinary'
+    # Cloudinary requires every part except the last to be at least 5 MB
+    min_chunk_size = 5 * 1024 * 1024
+    # The video is complete on Cloudinary once the last chunk is accepted
+    direct = True
+
+    def write_chunk(self, upload, index, stream):
+        """
+        Send one chunk to Cloudinary and record it on the session. A chunk
+        that was already accepted is acknowledged without being sent again, so
+        a retry after a lost response is harmless.
+        """
+        from api.models import db, UploadSession
+
+        if index < upload.chunks_assembled:
+            return upload.chunk_length(index)
+        if index > upload.chunks_assembled:
+            raise ChunkOrderError(f"Chunk {upload.chunks_assembled} must be sent before chunk {index}")
+
+        # Read the body before claiming, so a slow client doesn't hold the claim
+        buffer = io.BytesIO()
+        written = copy_chunk(upload, index, stream, buffer)
+
+        sessions = UploadSession.__table__
+        now = datetime.utcnow()
+        this_chunk = (sessions.c.id == upload.id) & (sessions.c.chunks_assembled == index)
+        claimed = db.session.execute(sessions.update().where(
+            this_chunk,
+            (sessions.c.sending_at == None) | (sessions.c.sending_at < now - timedelta(seconds=UPLOAD_SEND_STALE_SECONDS))
+        ).values(sending_at=now)).rowcount
+        db.session.commit()
+        if not claimed:
+            db.session.refresh(upload)
+            if index < upload.chunks_assembled:
+                return written
+            raise ChunkOrderError(f"Chunk {index} is already being sent")
+
+        offset = upload.chunk_size * index
+        headers = {
+            "Content-Range": f"bytes {offset}-{offset + written - 1}/{upload.total_size}",
+            "X-Unique-Upload-Id": upload.id.replace('-', '')
+        }
+        options = {"resource_type": "video", "folder": CLOUDINARY_FOLDER}
+        if upload.public_id:
+            options["public_id"] = upload.public_id
+
+        try:
+            uploader = get_cloudinary_uploader()
+            for attempt in range(1, UPLOAD_PART_RETRIES + 1):
+                try:
+                    with time_external('cloudinary', 'upload_large_part'):
+                        result = uploader.upload_large_part((upload.filename, buffer.getvalue()), http_headers=headers, **options)
+                    break
+                except Exception as e:
+                    if attempt == UPLOAD_PART_RETRIES:
+                        raise
+                    logger.warning(f"Upload {upload.id} part {index} failed (attempt {attempt}): {e}")
+        except Exception:
+            db.session.rollback()
+            db.session.execute(sessions.update().where(this_chunk).values(sending_at=None))
+            db.session.commit()
+            raise
+
+        values = {"chunks_assembled": index + 1, "sending_at": None,
+                  "public_id": result.get('public_id') or upload.public_id, "updated_at": datetime.utcnow()}
+        if index + 1 == upload.total_chunks:
+            values.update(url=result['secure_url'], duration=result.get('duration'), format=result.get('format'))
+        db.session.execute(sessions.update().where(this_chunk).values(**values))
+        db.session.commit()
+        db.session.refresh(upload)
+        return written
+
+    def received_chunks(self, upload):
+        return list(range(upload.chunks_assembled))
+
+    def cleanup(self, upload):
+        pass
+
+
+_backends = {
+    'local': LocalDiskStorage,
+    'cloudinary': CloudinaryStorage,
+}
+
+
+def get_backend_name(name=None):
+    name = (name or UPLOAD_BACKEND).lower()
+    if name == 'auto':
+        name = 'cloudinary' if os.getenv('CLOUDINARY_CLOUD_NAME') else 'local'
+    if name not in _backends:
+        raise ValueError(f"Unknown upload backend '{name}'. Use {', '.join(_backends)} or auto.")
+    if SERVERLESS:
+        # local chunks aren't shared between instances, and Vercel caps request bodies at about
+        # 4.5 MB, below the 5 MB Cloudinary requires for every part but the last
+        raise ValueError("Chunked uploads aren't supported on serverless deployments; run the API on a long-lived server")
+    return name
+
+
+def get_storage(name):
+    return _backends[name]()
+
+
+def clamp_chunk_size(storage, requested=None):
+    size = int(requested or UPLOAD_CHUNK_SIZE)
+    return max(storage.min_chunk_size, min(size, UPLOAD_MAX_CHUNK_SIZE))
+
+
+def stage_upload(file):
+    """Save a /upload?async=1 file under UPLOAD_DIR/incoming until its job sends it on. Returns the path."""
+    path = os.path.join(UPLOAD_DIR, 'incoming', str(uuid.uuid4()), os.path.basename(file.filename))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    file.save(path)
+    return path
+
+
+@job_runner.handler('video_upload')
+def video_upload_handler(job, payload):
+    """Send a staged file to Cloudinary; the job result matches the synchronous /upload response."""
+    path = payload['path']
+    try:
+        with time_external('cloudinary', 'upload'):
+            result = get_cloudinary_uploader().upload(path, resource_type="video", folder=CLOUDINARY_FOLDER)
+    finally:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    return {
+        "url": result['secure_url'],
+        "public_id": result['public_id'],
+        "duration": result.get('duration'),
+        "format": result.get('format')
+    }
+
+
+def run_assembly_job(app, upload_id, runner_job=None):
+    """
+    Background entry point: assemble the chunks with the session's backend and
+    record the result (and progress on the runner's job, when given).
+    """
+    from api.models import db, UploadSession
+
+    with app.app_context():
+        upload = UploadSession.query.get(upload_id)
+        if not upload:
+            return
+        storage = get_storage(upload.backend)
+        try:
+            def on_progress(done):
+                upload.chunks_assembled = done
+                db.session.commit()
+                if runner_job:
+                    runner_job.progress(done / upload.total_chunks)
+
+            result = storage.assemble(upload, on_progress)
+
+            upload.url = result["url"]
+            upload.public_id = result["public_id"]
+            upload.duration = result.get("duration")
+            upload.format = result.get("format")
+            upload.status = 'complete'
+            upload.error = None
+            db.session.commit()
+            storage.cleanup(upload)
+            logger.info(f"Upload {upload_id} assembled: {upload.total_size} bytes in {upload.total_chunks} chunks")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error assembling upload {upload_id}: {e}")
+            upload = UploadSession.query.get(upload_id)
+            if upload:
+                upload.status = 'failed'
+                upload.error = str(e)
+                db.session.commit()
+
+
+@job_runner.handler('upload_assembly')
+def assembly_handler(job, payload):
+    from api.models import UploadSession
+    run_assembly_job(job.app, payload['upload_id'], job)
+    job.check_row(UploadSession, payload['upload_id'])
+
+
+def start_assembly_job(app, upload_id):
+    """Queue the assembly on the job runner so /complete returns immediately (high priority: the user is waiting)."""
+    return job_runner.submit('upload_assembly', {'upload_id': upload_id}, PRIORITY_HIGH, app=app)
@@ -0,0 +1,214 @@
+import os
+import json
+import bisect
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from api.helpers import cv2, check_video_url, detect_in_frame
+from api.jobs import job_runner, PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+# Number of worker processes used to scan a video. Defaults to the CPU count.
+DETECTION_WORKERS = int(os.getenv('DETECTION_WORKERS', '0')) or os.cpu_count() or 1
+
+# Seconds between sampled frames when no interval is requested
+DEFAULT_INTERVAL = 0.5
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Lazily create the shared process pool used for video scans. Workers are
+    spawned, not forked: forking this threaded server (request and job runner
+    threads) can copy a lock another thread holds and deadlock the child.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=DETECTION_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def reset_executor(executor):
+    """Drop a pool whose worker died (it stays broken); the next scan starts a new one."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def probe_video(video_url):
+    """Return (fps, frame_count) for a video, or raise ValueError if it cannot be opened."""
+    cap = cv2.VideoCapture(video_url)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_url}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        return fps, frame_count
+    finally:
+        cap.release()
+
+
+def plan_chunks(frame_count, step, workers):
+    """
+    Split [0, frame_count) into contiguous chunks, one or more per worker.
+    Chunk boundaries are aligned to the sampling step so no sample is lost.
+    """
+    samples = (frame_count + step - 1) // step
+    if samples == 0:
+        return []
+    # A few chunks per worker keeps the pool busy when chunks finish unevenly
+    chunk_count = min(samples, workers * 4)
+    samples_per_chunk = (samples + chunk_count - 1) // chunk_count
+    chunk_frames = samples_per_chunk * step
+    return [(start, min(start + chunk_frames, frame_count)) for start in range(0, frame_count, chunk_frames)]
+
+
+def scale_detections(detections, scale):
+    """Map boxes found on a proxy back to source-video coordinates."""
+    if scale == 1.0:
+        return detections
+    for detection in detections:
+        for key in ("x", "y", "width", "height"):
+            detection[key] = int(round(detection[key] * scale))
+    return detections
+
+
+def detect_chunk(video_url, start_frame, end_frame, step, fps, scale=1.0):
+    """
+    Scan frames [start_frame, end_frame) of a video in a worker process.
+    Every `step`-th frame is decoded and run through the cascade; the rest are only grabbed.
+    Boxes are multiplied by `scale` (used when scanning a downscaled proxy).
+    """
+    cap = cv2.VideoCapture(video_url)
+    samples = []
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_url}")
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        for index in range(start_frame, end_frame):
+            if not cap.grab():
+                break
+            if (index - start_frame) % step:
+                continue
+            ok, frame = cap.retrieve()
+            if not ok or frame is None:
+                continue
+            samples.append({
+                "t": round(index / fps, 3),
+                "detections": scale_detections(detect_in_frame(frame), scale)
+            })
+    finally:
+        cap.release()
+    return samples
+
+
+def build_track(video_url, interval=DEFAULT_INTERVAL, scale=1.0, on_progress=None):
+    """
+    Run face detection over a whole video across the process pool.
+    on_progress(chunks_done, chunk_count) is called as chunks finish; if it
+    raises (e.g. the job was cancelled), chunks not yet started are dropped.
+    Returns (fps, samples) where samples is a list of {t, detections} sorted by t.
+    """
+    fps, frame_count = probe_video(video_url)
+    step = max(1, int(round(fps * interval)))
+
+    executor = get_executor()
+    futures = [
+        executor.submit(detect_chunk, video_url, start, end, step, fps, scale)
+        for start, end in plan_chunks(frame_count, step, DETECTION_WORKERS)
+    ]
+
+    samples = []
+    try:
+        for done, future in enumerate(as_completed(futures), 1):
+            samples.extend(future.result())
+            if on_progress:
+                on_progress(done, len(futures))
+    except BrokenProcessPool:
+        reset_executor(executor)
+        raise
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    samples.sort(key=lambda s: s["t"])
+    return fps, samples
+
+
+def find_sample(samples, t):
+    """Return the sample at or immediately before playback time t (binary search)."""
+    if not samples:
+        return None
+    times = [s["t"] for s in samples]
+    index = bisect.bisect_right(times, t) - 1
+    return samples[max(index, 0)]
+
+
+def run_track_job(app, track_id, runner_job=None):
+    """
+    Background entry point: build the track and store it on the DetectionTrack
+    row (and progress on the runner's job, when given, so it can be cancelled).
+    """
+    from api.models import db, DetectionTrack
+    from api.media_processing import get_proxy_source
+    from api.detection_store import detection_store
+
+    with app.app_context():
+        track = DetectionTrack.query.get(track_id)
+        if not track:
+            return
+        try:
+            track.status = 'processing'
+            db.session.commit()
+
+            check_video_url(track.video_url)
+            # Scan the low-resolution proxy when one exists for the same video
+            video_url, scale = track.video_url, 1.0
+            if track.project.video_url == track.video_url:
+                video_url, scale = get_proxy_source(track.project) or (video_url, scale)
+
+            def on_progress(done, total):
+                if runner_job:
+                    runner_job.progress(done / total)
+
+            fps, samples = build_track(video_url, track.interval or DEFAULT_INTERVAL, scale, on_progress)
+
+            track.fps = fps
+            track.frames = json.dumps(samples)
+            track.status = 'complete'
+            track.error = None
+            db.session.commit()
+            # Columnar copy for time-range queries (GET /projects/<id>/detections)
+            detection_store.replace_track(track.project_id, samples)
+            logger.info(f"Detection track {track_id} complete: {len(samples)} samples")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error building detection track {track_id}: {e}")
+            track = DetectionTrack.query.get(track_id)
+            if track:
+                track.status = 'failed'
+                track.error = str(e)
+                db.session.commit()
+
+
+@job_runner.handler('track', max_concurrent=1)
+def track_handler(job, payload):
+    from api.models import DetectionTrack
+    run_track_job(job.app, payload['track_id'], job)
+    job.check_row(DetectionTrack, payload['track_id'])
+
+
+def start_track_job(app, track_id):
+    """Queue a track job on the job runner (one at a time; it already spreads over a process pool)."""
+    return job_runner.submit('track', {'track_id': track_id}, PRIORITY_NORMAL, app=app)
@@ -0,0 +1,377 @@
+"""
+Offline benchmarks for the API hot paths.
+
+Runs the Flask app in-process against a throwaway SQLite database with
+synthetic data, writes the results as JSON and compares them with a stored
+baseline. From the repository root:
+
+    python -m benchmarks.run                      # full run, compare with benchmarks/baseline.json
+    python -m benchmarks.run --quick --only detect,command
+    python -m benchmarks.run --save-baseline      # record the current numbers as the baseline
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, 'results', 'latest.json')
+
+SUITES = ('detect', 'effects', 'projects', 'command')
+# (width, height) and faces drawn per frame for /detect-faces
+RESOLUTIONS = ((640, 360), (1280, 720), (1920, 1080))
+FACE_COUNTS = (0, 1, 4)
+EFFECT_COUNTS = (10, 100, 1000, 10000)
+PROJECT_COUNT = 10000
+EFFECT_TYPES = ('blur', 'grayscale', 'sepia', 'invert', 'segmentation')
+
+
+def configure_environment(db_path):
+    """Point the app at a scratch database and keep it offline. Must run before api.main is imported."""
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    for name in ('POSTGRES_URL', 'POSTGRES_URL_NON_POOLING', 'ANTHROPIC_API_KEY', 'CLOUDINARY_CLOUD_NAME'):
+        os.environ.pop(name, None)
+    # Keep the LLM command cache in memory only
+    os.environ['COMMAND_CACHE_DB'] = ''
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+
+
+def summarize(samples, total_seconds=None):
+    """Latency percentiles (ms) and throughput for a list of per-call durations in seconds."""
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def percentile(p):
+        return ordered[min(n - 1, int(round(p / 100 * (n - 1))))] * 1000
+
+    total = total_seconds if total_seconds is not None else sum(ordered)
+    return {
+        "iterations": n,
+        "p50_ms": round(percentile(50), 3),
+        "p99_ms": round(percentile(99), 3),
+        "mean_ms": round(sum(ordered) / n * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "throughput_rps": round(n / total, 2) if total else None
+    }
+
+
+def timed_calls(call, iterations, warmup=1):
+    """Run call(i) `iterations` times after a warmup and return summarize() of the durations."""
+    for i in range(warmup):
+        call(-1 - i)
+    samples = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        call(i)
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples, time.perf_counter() - started)
+
+
+def expect(response, status):
+    if response.status_code != status:
+        raise RuntimeError(f"Expected {status}, got {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def synthetic_frame(width, height, faces, seed):
+    """
+    JPEG of a textured background with `faces` drawn face-like patterns
+    (skin-tone oval, dark eyes and brows, mouth). Deterministic for a seed.
+    """
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 255, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+    frame = cv2.resize(noise, (width, height), interpolation=cv2.INTER_LINEAR)
+    frame = cv2.GaussianBlur(frame, (0, 0), 3)
+
+    size = max(40, min(width, height) // 4)
+    for i in range(faces):
+        cx = int(size * 0.6 + (i % 4) * (width - size * 1.2) / 3)
+        cy = int(height / 2 + (i // 4) * size * 0.3)
+        w, h = size // 2, int(size * 0.65)
+        cv2.ellipse(frame, (cx, cy), (w, h), 0, 0, 360, (150, 180, 225), -1)
+        for side in (-1, 1):
+            ex, ey = cx + side * w // 2, cy - h // 5
+            cv2.line(frame, (ex - w // 4, ey - h // 6), (ex + w // 4, ey - h // 6), (40, 50, 60), max(2, size // 30))
+            cv2.ellipse(frame, (ex, ey), (w // 5, h // 10), 0, 0, 360, (30, 30, 30), -1)
+        cv2.rectangle(frame, (cx - w // 12, cy - h // 8), (cx + w // 12, cy + h // 5), (120, 150, 200), -1)
+        cv2.ellipse(frame, (cx, cy + h // 2), (w // 3, h // 10), 0, 0, 360, (60, 60, 140), -1)
+
+    ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return encoded.tobytes()
+
+
+def bench_detect(app, client, quick):
+    from api.detection_cache import detection_cache
+
+    iterations = 5 if quick else 30
+    results = {}
+    max_size = detection_cache.max_size
+    # Measure detection itself; the cache gets its own case below
+    detection_cache.max_size = 0
+    try:
+        for width, height in RESOLUTIONS:
+            for faces in FACE_COUNTS:
+                frames = [synthetic_frame(width, height, faces, seed) for seed in range(iterations + 1)]
+                found = []
+
+                def call(i):
+                    response = expect(client.post('/detect-faces', data=frames[i], content_type='image/jpeg'), 200)
+                    found.append(len(response.get_json()['detections']))
+
+                result = timed_calls(call, iterations)
+                result["faces_drawn"] = faces
+                result["faces_detected_avg"] = round(sum(found[1:]) / iterations, 2)
+                results[f"detect_faces.{width}x{height}.faces{faces}"] = result
+    finally:
+        detection_cache.max_size = max_size
+
+    detection_cache.clear()
+    frame = synthetic_frame(1280, 720, 1, 0)
+    results["detect_faces.1280x720.cached"] = timed_calls(
+        lambda i: expect(client.post('/detect-faces', data=frame, content_type='image/jpeg'), 200),
+        iterations * 4)
+    return results
+
+
+def create_project(client, name):
+    return expect(client.post('/projects', json={"name": name}), 201).get_json()['id']
+
+
+def fill_effects(project_id, count):
+    """Bulk-insert `count` back-to-back one-second effects."""
+    from sqlalchemy import insert
+    from api.models import db, Effect
+
+    rows = [{
+        "id": str(uuid.uuid4()),
+        "project_id": project_id,
+        "type": EFFECT_TYPES[i % len(EFFECT_TYPES)],
+        "start_time": float(i),
+        "end_time": float(i) + 1.0
+    } for i in range(count)]
+    for start in range(0, count, 1000):
+        db.session.execute(insert(Effect), rows[start:start + 1000])
+    db.session.commit()
+
+
+def effect_list(count, offset=0.0):
+    return [{
+        "type": EFFECT_TYPES[i % len(EFFECT_TYPES)],
+        "start_time": offset + i,
+        "end_time": offset + i + 1.0
+    } for i in range(count)]
+
+
+def bench_effects(app, client, quick):
+    results = {}
+    counts = EFFECT_COUNTS[:3] if quick else EFFECT_COUNTS
+    for count in counts:
+        project_id = create_project(client, f"bench-effects-{count}")
+        with app.app_context():
+            fill_effects(project_id, count)
+
+        # Each new effect lands after the existing ones, so the overlap check passes
+        results[f"add_effect.existing{count}"] = timed_calls(
+            lambda i: expect(client.post(f'/projects/{project_id}/effects', json={
+                "type": "blur", "start_time": count + 10.0 + i * 2, "end_time": count + 11.0 + i * 2
+            }), 201),
+            10 if quick else 50)
+
+        payload = {"effects": effect_list(count)}
+        results[f"update_effects.count{count}"] = timed_calls(
+            lambda i: expect(client.put(f'/projects/{project_id}/effects', json=payload), 200),
+            3 if quick or count >= 10000 else 10)
+    return results
+
+
+def fill_projects(count):
+    """Bulk-insert `count` projects with two effects each and distinct creation times."""
+    from sqlalchemy import insert
+    from api.models import db, Project, Effect
+
+    now = datetime.utcnow()
+    projects, effects = [], []
+    for i in range(count):
+        project_id = str(uuid.uuid4())
+        created = now - timedelta(seconds=i)
+        projects.append({"id": project_id, "name": f"Project {i}", "video_url": None,
+                         "created_at": created, "updated_at": created, "version": 1})
+        for j in range(2):
+            effects.append({"id": str(uuid.uuid4()), "project_id": project_id,
+                            "type": EFFECT_TYPES[(i + j) % len(EFFECT_TYPES)],
+                            "start_time": j * 5.0, "end_time": j * 5.0 + 2.0})
+    for start in range(0, count, 1000):
+        db.session.execute(insert(Project), projects[start:start + 1000])
+    for start in range(0, len(effects), 1000):
+        db.session.execute(insert(Effect), effects[start:start + 1000])
+    db.session.commit()
+
+
+def bench_projects(app, client, quick):
+    from api.models import Project
+
+    with app.app_context():
+        fill_projects(PROJECT_COUNT - Project.query.count())
+    full = 2 if quick else 5
+    light = 5 if quick else 20
+    return {
+        f"list_projects.n{PROJECT_COUNT}.full": timed_calls(
+            lambda i: expect(client.get('/projects'), 200), full),
+        f"list_projects.n{PROJECT_COUNT}.fields": timed_calls(
+            lambda i: expect(client.get('/projects?fields=id,name,created_at'), 200), light),
+        f"list_projects.n{PROJECT_COUNT}.page50": timed_calls(
+            lambda i: expect(client.get('/projects?limit=50'), 200), light * 5)
+    }
+
+
+def bench_command(app, client, quick):
+    iterations = 50 if quick else 500
+    rng = random.Random(0)
+    # Phrasings the local parser resolves, and ones it hands to the (mock) LLM path
+    parsed = ["add blur from {a} to {b}", "sepia for {n} seconds", "remove all effects", "grayscale the full video"]
+    mocked = ["make it look old please", "could you do something about the background", "hide the faces somehow"]
+    results = {}
+    for name, phrases, source in (("parser", parsed, "parser"), ("mock", mocked, "fallback")):
+        texts = [rng.choice(phrases).format(a=i % 50, b=i % 50 + 5, n=i % 9 + 1) for i in range(iterations + 1)]
+
+        def call(i):
+            response = expect(client.post('/command', json={"text": texts[i], "current_time": 3.0, "duration": 120}), 200)
+            if response.get_json()['source'] != source:
+                raise RuntimeError(f"'{texts[i]}' took the {response.get_json()['source']} path, expected {source}")
+
+        results[f"command.{name}"] = timed_calls(call, iterations)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def environment_info():
+    import cv2
+    from api.detection_engine import detection_engine
+    return {
+        "timestamp": datetime.utcnow().isoformat() + 'Z',
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "detection_workers": detection_engine.workers
+    }
+
+
+def compare(results, baseline, threshold):
+    """Per-benchmark p50/p99 ratios against the baseline. A p50 more than `threshold` slower is a regression."""
+    comparison = {}
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        p50_ratio = result["p50_ms"] / base["p50_ms"] if base["p50_ms"] else None
+        p99_ratio = result["p99_ms"] / base["p99_ms"] if base["p99_ms"] else None
+        if p50_ratio is None:
+            status = "n/a"
+        elif p50_ratio > 1 + threshold:
+            status = "regression"
+        elif p50_ratio < 1 / (1 + threshold):
+            status = "improvement"
+        else:
+            status = "unchanged"
+        comparison[name] = {
+            "baseline_p50_ms": base["p50_ms"],
+            "p50_ms": result["p50_ms"],
+            "p50_ratio": round(p50_ratio, 3) if p50_ratio is not None else None,
+            "p99_ratio": round(p99_ratio, 3) if p99_ratio is not None else None,
+            "status": status
+        }
+    return comparison
+
+
+def print_report(results, comparison):
+    print(f"{'benchmark':<42} {'p50 ms':>10} {'p99 ms':>10} {'req/s':>10}  vs baseline")
+    for name, result in results.items():
+        delta = comparison.get(name)
+        note = f"{delta['p50_ratio']:.2f}x {delta['status']}" if delta and delta['p50_ratio'] else ""
+        print(f"{name:<42} {result['p50_ms']:>10.2f} {result['p99_ms']:>10.2f} {result['throughput_rps'] or 0:>10.1f}  {note}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', help=f"Comma-separated suites to run ({', '.join(SUITES)})")
+    parser.add_argument('--quick', action='store_true', help="Fewer iterations and sizes, for a smoke run")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="Where to write the results JSON")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="Also write the results to --baseline")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Fractional p50 slowdown reported as a regression (default 0.2)")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Exit with status 1 on any regression")
+    args = parser.parse_args(argv)
+
+    suites = args.only.split(',') if args.only else list(SUITES)
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"Unknown suites: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory(prefix='bench-') as scratch:
+        configure_environment(os.path.join(scratch, 'bench.db'))
+        from api.main import app
+        # Per-request warnings (e.g. the mock LLM path) would drown the report
+        logging.disable(logging.WARNING)
+
+        runners = {"detect": bench_detect, "effects": bench_effects, "projects": bench_projects, "command": bench_command}
+        results = {}
+        client = app.test_client()
+        for suite in suites:
+            print(f"Running {suite}...", file=sys.stderr)
+            results.update(runners[suite](app, client, args.quick))
+        meta = environment_info()
+        meta["quick"] = args.quick
+        meta["suites"] = suites
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+    comparison = compare(results, baseline, args.threshold)
+
+    report = {"meta": meta, "results": results, "comparison": comparison}
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+
+    print_report(results, comparison)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    regressions = [name for name, delta in comparison.items() if delta["status"] == "regression"]
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
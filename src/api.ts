@@ -99,12 +99,64 @@ export const effectsApi = {
     }),
 };
 
+export interface Job<T = unknown> {
+  id: string;
+  kind: string;
+  status: 'queued' | 'running' | 'complete' | 'failed' | 'cancelled';
+  priority: number;
+  progress: number;
+  message: string | null;
+  result: T | null;
+  error: string | null;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+}
+
+const JOB_POLL_MS = 1000;
+
+export const jobsApi = {
+  get: <T = unknown>(jobId: string) => apiFetch<Job<T>>(`/jobs/${jobId}`),
+
+  cancel: (jobId: string) =>
+    apiFetch<Job>(`/jobs/${jobId}/cancel`, { method: 'POST' }),
+
+  // Poll until the job finishes; resolves with its result, rejects if it failed or was cancelled
+  wait: async <T = unknown>(jobId: string, onProgress?: (job: Job<T>) => void): Promise<T> => {
+    for (;;) {
+      const job = await jobsApi.get<T>(jobId);
+      onProgress?.(job);
+      if (job.status === 'complete') return job.result as T;
+      if (job.status === 'failed' || job.status === 'cancelled') {
+        throw new Error(job.error || `Job ${job.status}`);
+      }
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_MS));
+    }
+  },
+};
+
+let jobRunnerLive: Promise<boolean> | null = null;
+
+// Only servers that run jobs in-process take async uploads (not serverless deployments)
+function canUploadAsync(): Promise<boolean> {
+  if (!jobRunnerLive) {
+    jobRunnerLive = fetch(`${API_BASE}/job-runner`)
+      .then((response) => (response.ok ? response.json() : null))
+      .then((stats) => Boolean(stats?.live))
+      .catch(() => false);
+  }
+  return jobRunnerLive;
+}
+
 export const uploadApi = {
+  // With a live job runner the server stages the file and returns a job right away,
+  // and the Cloudinary upload runs in the background; otherwise upload synchronously
   uploadVideo: async (file: File): Promise<UploadResponse> => {
     const formData = new FormData();
     formData.append('video', file);
+    const isAsync = await canUploadAsync();
 
-    const response = await fetch(`${API_BASE}/upload`, {
+    const response = await fetch(`${API_BASE}/upload${isAsync ? '?async=1' : ''}`, {
       method: 'POST',
       body: formData,
     });
@@ -114,7 +166,11 @@ export const uploadApi = {
       throw new Error(error.error || `HTTP ${response.status}`);
     }
 
-    return response.json();
+    if (!isAsync) {
+      return response.json();
+    }
+    const { job_id } = await response.json();
+    return jobsApi.wait<UploadResponse>(job_id);
   },
 };
 